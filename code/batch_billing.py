@@ -0,0 +1,390 @@
+import numpy as np
+import pandas as pd
+from billing import (
+    DEMAND_WINDOW_MINUTES,
+    calculate_cost,
+    calculate_demand_cost,
+    calculate_peak_demands,
+    ratchet_demands,
+)
+from compiled_tariff import ensure_compiled, get_compiled_charge_array
+from calendar_index import get_calendar_index
+from instrumentation import timed
+
+CHARGE_TYPES = [
+    "electric_customer",
+    "electric_demand",
+    "electric_energy",
+    "gas_customer",
+    "gas_demand",
+    "gas_energy",
+]
+
+
+@timed()
+def calculate_facility_costs(
+    compiled_tariff,
+    keys,
+    electric,
+    gas,
+    periods,
+    interval_minutes=15,
+    demand_window=DEMAND_WINDOW_MINUTES,
+    rolling=False,
+    peaks=1,
+    ratchet_fraction=0,
+    ratchet_months=11,
+    utilities=("electric", "gas"),
+):
+    """Calculates the cost of every charge type in every billing period
+    for a single facility
+
+    Parameters
+    ----------
+    compiled_tariff : dict
+        Billing information compiled by `compiled_tariff.compile_tariff`
+
+    keys : array
+        Calendar keys of the load profile from `calendar_index.CalendarIndex`
+
+    electric : array
+        Electricity consumption in kW at each interval of the load profile
+
+    gas : array
+        Natural gas consumption in therms/hr at each interval of the load profile
+
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    interval_minutes : float
+        Length of each interval of the load profile in minutes
+
+    demand_window : float
+        Length in minutes of the window over which demand is averaged
+
+    rolling : bool
+        Whether demand is a rolling average over `demand_window`
+
+    peaks : int
+        Number of daily peaks averaged into the billed demand
+
+    ratchet_fraction : float
+        Fraction of the peak demand of the preceding `ratchet_months` billing
+        periods that is billed at minimum, e.g. 0.8. Defaults to no ratchet
+
+    ratchet_months : int
+        Number of preceding months of the demand ratchet
+
+    utilities : list
+        Utilities to bill. The costs of any other utility are left at 0
+
+    Returns
+    -------
+    array
+        Costs in USD with shape (number of billing periods, 6) in the
+        order of `CHARGE_TYPES`
+    """
+    costs = np.zeros((periods.shape[0], len(CHARGE_TYPES)))
+    consumption = {"electric": electric, "gas": gas}
+    demand_options = {
+        "interval_minutes": interval_minutes,
+        "demand_window": demand_window,
+        "rolling": rolling,
+        "peaks": peaks,
+    }
+    for utility in utilities:
+        col = CHARGE_TYPES.index(utility + "_customer")
+        costs[:, col] = np.sum(compiled_tariff[(utility, "customer")])
+        # gather the charges for the whole profile once as contiguous tensors,
+        # then bill views of each period
+        charges = {
+            charge_type: get_compiled_charge_array(
+                keys, compiled_tariff, charge_type, utility, as_tensor=True
+            )
+            for charge_type in ["demand", "energy"]
+        }
+        for p, (start, end) in enumerate(zip(periods["start"], periods["end"])):
+            costs[p, CHARGE_TYPES.index(utility + "_energy")] = calculate_cost(
+                charges["energy"][start:end],
+                consumption[utility][start:end],
+                charge_type="energy",
+                utility=utility,
+                interval_minutes=interval_minutes,
+            )
+            if not ratchet_fraction:
+                costs[p, CHARGE_TYPES.index(utility + "_demand")] = calculate_cost(
+                    charges["demand"][start:end],
+                    consumption[utility][start:end],
+                    charge_type="demand",
+                    **demand_options,
+                )
+        if ratchet_fraction:
+            costs[:, CHARGE_TYPES.index(utility + "_demand")] = ratcheted_demand_costs(
+                charges["demand"],
+                consumption[utility],
+                periods,
+                ratchet_fraction,
+                ratchet_months,
+                **demand_options,
+            )
+    return costs
+
+
+def ratcheted_demand_costs(
+    charges, consumption, periods, ratchet_fraction=0.8, ratchet_months=11, **demand_options
+):
+    """Calculates the demand cost of every billing period under a demand ratchet
+
+    The peak demand of every billing period is found once and cached, then the
+    ratchet of each period is the trailing maximum of the cached peaks.
+
+    Parameters
+    ----------
+    charges : array
+        Demand charges at each interval of the load profile
+
+    consumption : array
+        Electrical or gas usage data at each interval of the load profile
+
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    ratchet_fraction : float
+        Fraction of the trailing peak demand that is billed at minimum
+
+    ratchet_months : int
+        Number of preceding months of the demand ratchet
+
+    demand_options : dict
+        Keyword arguments of `billing.calculate_peak_demands`
+
+    Returns
+    -------
+    array
+        Demand cost in USD of each billing period
+    """
+    billed = [
+        calculate_peak_demands(charges[start:end], consumption[start:end], **demand_options)
+        for start, end in zip(periods["start"], periods["end"])
+    ]
+    peak_cache = np.array([ratchet_peaks(rates, demands) for _, rates, demands in billed])
+    period_ids = periods["year"].values * 12 + periods["month"].values
+    minimum = ratchet_demands(peak_cache, period_ids, ratchet_fraction, ratchet_months)
+    return np.array(
+        [
+            ratcheted_demand_cost(limits, rates, demands, minimum[p])
+            for p, (limits, rates, demands) in enumerate(billed)
+        ]
+    )
+
+
+def ratchet_peaks(rates, demands):
+    """Gets the peak demand of every demand charge of every tier of a billing period
+    that counts towards a demand ratchet, i.e. of the charges in effect
+
+    Parameters
+    ----------
+    rates : list
+        Charges of each tier from `billing.calculate_peak_demands`
+
+    demands : list
+        Billed demand of each column of each tier from `billing.calculate_peak_demands`
+
+    Returns
+    -------
+    array
+        Peak demand of each column of each tier, with 0 for charges that are not
+        in effect during the billing period
+    """
+    return np.concatenate(
+        [
+            np.where(np.any(tier_rates.reshape(len(tier_rates), -1) != 0, axis=0), demand, 0)
+            for tier_rates, demand in zip(rates, demands)
+        ]
+    )
+
+
+def ratcheted_demand_cost(limits, rates, demands, minimum):
+    """Calculates the demand cost of a billing period billed at least at the
+    ratchet `minimum`
+
+    Parameters
+    ----------
+    limits, rates, demands : list
+        Output of `billing.calculate_peak_demands` for the billing period
+
+    minimum : array
+        Lowest billed demand of each column of each tier, in the order of `ratchet_peaks`
+
+    Returns
+    -------
+    float
+        Demand cost in USD
+    """
+    # split the minimum of the billing period back into tiers
+    splits = np.cumsum([len(demand) for demand in demands])[:-1]
+    return calculate_demand_cost(
+        limits,
+        rates,
+        [np.maximum(d, m) for d, m in zip(demands, np.split(minimum, splits))],
+    )
+
+
+def prepare_profile(
+    consumption_data,
+    elec_col="grid_to_plant_kW",
+    ng_col="natural_gas_therm_per_hr",
+    holidays=None,
+):
+    """Computes the calendar features and consumption arrays of a load profile
+    that are shared by every facility
+
+    Parameters
+    ----------
+    consumption_data : DataFrame
+        Electrical and gas usage data with a 'DateTime' column.
+        See 'data/synthetic_energy_data.csv' for an example.
+
+    elec_col : str
+        Name of the electricity consumption column in kW
+
+    ng_col : str
+        Name of the natural gas consumption column in therms/hr
+
+    holidays : list or 'federal'
+        Dates billed at the charges of a Sunday. See `calendar_index.CalendarIndex`
+
+    Returns
+    -------
+    tuple
+        (keys, electric, gas, periods, interval_minutes) from the
+        `calendar_index.CalendarIndex` of the load profile
+    """
+    calendar = get_calendar_index(consumption_data["DateTime"], holidays=holidays)
+    electric = consumption_data[elec_col].to_numpy(dtype=float)
+    gas = consumption_data[ng_col].to_numpy(dtype=float)
+    return calendar.keys, electric, gas, calendar.periods, calendar.interval_minutes
+
+
+@timed()
+def tidy_costs(cwns_nos, periods, costs):
+    """Flattens an array of costs into a tidy table
+
+    Parameters
+    ----------
+    cwns_nos : list
+        CWNS numbers of the facilities
+
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    costs : array
+        Costs in USD with shape (facilities, billing periods, charge types)
+
+    Returns
+    -------
+    DataFrame
+        Tidy table of costs in USD with columns 'CWNS_No', 'year', 'month',
+        'charge_type', and 'cost', ordered by facility, month, and charge type
+    """
+    nperiods = periods.shape[0]
+    ncharges = len(CHARGE_TYPES)
+    return pd.DataFrame(
+        {
+            "CWNS_No": np.repeat(cwns_nos, nperiods * ncharges),
+            "year": np.tile(np.repeat(periods["year"].values, ncharges), len(cwns_nos)),
+            "month": np.tile(np.repeat(periods["month"].values, ncharges), len(cwns_nos)),
+            "charge_type": np.tile(CHARGE_TYPES, nperiods * len(cwns_nos)),
+            "cost": costs.ravel(),
+        }
+    )
+
+
+def calculate_cost_array(
+    consumption_data,
+    tariffs,
+    elec_col="grid_to_plant_kW",
+    ng_col="natural_gas_therm_per_hr",
+    units="imperial",
+    holidays=None,
+    **demand_options,
+):
+    """Calculates monthly costs of one load profile under many facilities' tariffs
+    as an array. See `calculate_costs` for a description of the parameters
+
+    Returns
+    -------
+    tuple
+        (costs, periods) where `costs` has shape (facilities, billing periods, 6)
+        in the order of `tariffs` and `CHARGE_TYPES`, and `periods` are the
+        billing periods from `calendar_index.CalendarIndex`
+    """
+    # calendar features are shared by every facility
+    keys, electric, gas, periods, interval_minutes = prepare_profile(
+        consumption_data, elec_col, ng_col, holidays
+    )
+
+    costs = np.empty((len(tariffs), periods.shape[0], len(CHARGE_TYPES)))
+    for f, tariff in enumerate(tariffs.values()):
+        costs[f] = calculate_facility_costs(
+            ensure_compiled(tariff, units),
+            keys,
+            electric,
+            gas,
+            periods,
+            interval_minutes,
+            **demand_options,
+        )
+    return costs, periods
+
+
+def calculate_costs(
+    consumption_data,
+    tariffs,
+    elec_col="grid_to_plant_kW",
+    ng_col="natural_gas_therm_per_hr",
+    units="imperial",
+    holidays=None,
+    **demand_options,
+):
+    """Calculates monthly costs of one load profile under many facilities' tariffs
+
+    Parameters
+    ----------
+    consumption_data : DataFrame
+        Electrical and gas usage data with a 'DateTime' column.
+        See 'data/synthetic_energy_data.csv' for an example.
+
+    tariffs : dict
+        Dictionary of billing information (as `DataFrame`, e.g. from
+        `tariff_cache.load_tariffs`) or compiled tariffs in imperial units (as
+        `dict` from `compiled_tariff.compile_tariff`) keyed by CWNS number
+
+    elec_col : str
+        Name of the electricity consumption column in kW
+
+    ng_col : str
+        Name of the natural gas consumption column in therms/hr, or m3/hr
+        if `units` is 'metric'
+
+    units : {'imperial', 'metric'}
+        Units of the consumption data. The rates of each tariff are converted
+        once by `compiled_tariff.convert_tariff` instead of converting the data
+
+    holidays : list or 'federal'
+        Dates billed at the charges of a Sunday, e.g. 'federal' for U.S. federal
+        holidays. See `calendar_index.CalendarIndex`. Defaults to no holidays
+
+    demand_options : dict
+        Demand window, peak, and ratchet options of `calculate_facility_costs`
+
+    Returns
+    -------
+    DataFrame
+        Tidy table of costs in USD with columns 'CWNS_No', 'year', 'month',
+        'charge_type', and 'cost', ordered by facility, month, and charge type
+    """
+    costs, periods = calculate_cost_array(
+        consumption_data, tariffs, elec_col, ng_col, units, holidays, **demand_options
+    )
+    return tidy_costs(list(tariffs.keys()), periods, costs)
@@ -0,0 +1,395 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import warnings
+import numpy as np
+import pandas as pd
+from tariff_cache import load_tariffs
+from billing import get_charge_array, calculate_cost
+from charge_cache import cache_disabled
+from calendar_index import CalendarIndex
+from compiled_tariff import compile_tariff, get_compiled_charge_array
+from batch_billing import calculate_costs, calculate_facility_costs, prepare_profile
+
+# change to repo parent directory and suppress superfluous openpyxl warnings
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
+
+ELEC_COL = "grid_to_plant_kW"
+NG_COL = "natural_gas_therm_per_hr"
+# sample facility with both electric and gas charges
+SAMPLE_CWNS_NO = 12000017027
+
+
+def one_minute_profile(energy_df, years):
+    """Derives a 1-minute load profile spanning `years` from the 15-minute
+    sample profile by linear interpolation, repeating the sample year
+
+    Parameters
+    ----------
+    energy_df : DataFrame
+        15-minute sample profile, i.e. 'data/synthetic_energy_data.csv'
+
+    years : list
+        Calendar years covered by the profile
+
+    Returns
+    -------
+    DataFrame
+        Load profile with 'DateTime', `ELEC_COL`, and `NG_COL` columns
+    """
+    sample_minutes = np.arange(energy_df.shape[0]) * 15
+    pieces = []
+    for year in years:
+        datetimes = pd.date_range(
+            "{}-01-01".format(year), "{}-01-01".format(year + 1), freq="1min", inclusive="left"
+        )
+        minutes = np.arange(len(datetimes)) % (sample_minutes[-1] + 15)
+        pieces.append(
+            pd.DataFrame(
+                {
+                    "DateTime": datetimes,
+                    ELEC_COL: np.interp(minutes, sample_minutes, energy_df[ELEC_COL].values),
+                    NG_COL: np.interp(minutes, sample_minutes, energy_df[NG_COL].values),
+                }
+            )
+        )
+    return pd.concat(pieces, ignore_index=True)
+
+
+def many_tier_tariff(ntiers=10, nperiods=6):
+    """Builds a synthetic tariff with `ntiers` tiered energy charges in each of
+    `nperiods` time-of-use periods, and `nperiods` demand charges in each of
+    `ntiers` demand tiers, for both electricity and gas
+
+    Returns
+    -------
+    DataFrame
+        Billing information with the columns of 'data/WWTP_Billing.xlsx'
+    """
+    hours = np.linspace(0, 24, nperiods + 1)
+    rows = []
+    for utility, unit_limit in [("electric", 20000), ("gas", 30)]:
+        rows.append(
+            {"utility": utility, "type": "customer", "period": np.nan,
+             "basic_charge_limit (imperial)": 0, "charge (imperial)": 250.0}
+        )
+        for charge_type, limit_step, rate in [
+            ("demand", unit_limit / 100, 5.0),
+            ("energy", unit_limit, 0.1),
+        ]:
+            # rows of the same limit must be contiguous, see `billing.build_charge_array`
+            for tier in range(ntiers):
+                for period in range(nperiods):
+                    rows.append(
+                        {
+                            "utility": utility,
+                            "type": charge_type,
+                            "period": "period_{}".format(period),
+                            "basic_charge_limit (imperial)": tier * limit_step,
+                            "month_start": 1 if period % 2 == 0 else 5,
+                            "month_end": 12 if period % 2 == 0 else 9,
+                            "hour_start": hours[period],
+                            "hour_end": hours[period + 1],
+                            "weekday_start": 0,
+                            "weekday_end": 6,
+                            "charge (imperial)": rate * (1 + 0.1 * period) * (1 - 0.05 * tier),
+                        }
+                    )
+    return pd.DataFrame(rows)
+
+
+def setup():
+    """Loads the sample data and prepares the inputs shared by every benchmark
+
+    Returns
+    -------
+    dict
+        Inputs of the benchmarks keyed by name
+    """
+    energy_df = pd.read_csv("data/synthetic_energy_data.csv", parse_dates=["DateTime"])
+    metadata = pd.read_csv("data/metadata.csv")
+    tariffs = load_tariffs("data/WWTP_Billing.xlsx")
+    tariffs = {cwns_no: tariffs[cwns_no] for cwns_no in metadata["CWNS_No"]}
+
+    january = energy_df.loc[energy_df["DateTime"].dt.month == 1, :]
+    rate_data = tariffs[SAMPLE_CWNS_NO]
+    one_minute_df = one_minute_profile(energy_df, [2021, 2022])
+    synthetic_tariff = many_tier_tariff()
+    return {
+        "energy_df": energy_df,
+        "tariffs": tariffs,
+        "compiled_tariffs": {
+            cwns_no: compile_tariff(tariff) for cwns_no, tariff in tariffs.items()
+        },
+        "january": january,
+        "rate_data": rate_data,
+        "charges": {
+            charge_type: get_charge_array(january, rate_data, charge_type, utility="electric")
+            for charge_type in ["demand", "energy"]
+        },
+        "one_minute_df": one_minute_df,
+        "one_minute_profile": prepare_profile(one_minute_df, ELEC_COL, NG_COL),
+        "profile": prepare_profile(energy_df, ELEC_COL, NG_COL),
+        "synthetic_tariff": synthetic_tariff,
+        "compiled_synthetic_tariff": compile_tariff(synthetic_tariff),
+    }
+
+
+def bench_get_charge_array_facility_month(data):
+    """`get_charge_array` for the demand and energy charges of one facility-month,
+    without the charge cache
+    """
+    with cache_disabled():
+        for charge_type in ["demand", "energy"]:
+            get_charge_array(data["january"], data["rate_data"], charge_type, utility="electric")
+
+
+def bench_calculate_cost_facility_month(data):
+    """`calculate_cost` for the demand and energy charges of one facility-month"""
+    consumption = data["january"][ELEC_COL]
+    for charge_type in ["demand", "energy"]:
+        calculate_cost(data["charges"][charge_type], consumption, charge_type=charge_type)
+
+
+def bench_calculate_cost_tensor_one_minute_two_years(data):
+    """`calculate_cost` for the demand and energy charges of the sample facility
+    on a 1-minute profile over two years, including gathering the charges
+    into a `ChargeTensor`
+    """
+    keys, electric = data["one_minute_profile"][:2]
+    compiled_tariff = data["compiled_tariffs"][SAMPLE_CWNS_NO]
+    for charge_type in ["demand", "energy"]:
+        charges = get_compiled_charge_array(keys, compiled_tariff, charge_type, as_tensor=True)
+        calculate_cost(charges, electric, charge_type=charge_type, interval_minutes=1)
+
+
+def bench_compile_tariffs(data):
+    """`compile_tariff` for every facility, without the charge cache"""
+    with cache_disabled():
+        for tariff in data["tariffs"].values():
+            compile_tariff(tariff)
+
+
+def bench_compile_tariffs_warm_cache(data):
+    """`compile_tariff` for every facility with every charge array already
+    in the charge cache, e.g. after the warm-up call
+    """
+    for tariff in data["tariffs"].values():
+        compile_tariff(tariff)
+
+
+def bench_facility_year_all(data):
+    """`calculate_costs` for every facility and month of the sample profile,
+    i.e. the loop in `sample_usage.py`
+    """
+    calculate_costs(data["energy_df"], data["compiled_tariffs"], ELEC_COL, NG_COL)
+
+
+def bench_calendar_one_minute_two_years(data):
+    """Building the `CalendarIndex` of a 1-minute profile over two years"""
+    CalendarIndex(data["one_minute_df"]["DateTime"])
+
+
+def bench_facility_one_minute_two_years(data):
+    """`calculate_facility_costs` for the sample facility on a 1-minute
+    profile over two years
+    """
+    calculate_facility_costs(data["compiled_tariffs"][SAMPLE_CWNS_NO], *data["one_minute_profile"])
+
+
+def bench_facility_one_minute_rolling_ratchet(data):
+    """`calculate_facility_costs` for the sample facility on a 1-minute profile
+    over two years with a 30-minute rolling demand window, the average of the
+    3 highest daily peaks, and an 80% 11-month demand ratchet
+    """
+    calculate_facility_costs(
+        data["compiled_tariffs"][SAMPLE_CWNS_NO],
+        *data["one_minute_profile"],
+        demand_window=30,
+        rolling=True,
+        peaks=3,
+        ratchet_fraction=0.8,
+    )
+
+
+def bench_compile_many_tier_tariff(data):
+    """`compile_tariff` for a tariff with 10 tiers and 6 periods per charge type,
+    without the charge cache
+    """
+    with cache_disabled():
+        compile_tariff(data["synthetic_tariff"])
+
+
+def bench_facility_year_many_tier_tariff(data):
+    """`calculate_facility_costs` for a tariff with 10 tiers and 6 periods
+    per charge type over the sample profile
+    """
+    calculate_facility_costs(data["compiled_synthetic_tariff"], *data["profile"])
+
+
+def bench_cli_cold_start_facility(data):
+    """Cold start of `cli.py` in a new interpreter billing the sample facility
+    over the sample profile, including imports and loading the tariff cache
+    """
+    subprocess.run(
+        [sys.executable, os.path.join("code", "cli.py"), str(SAMPLE_CWNS_NO)],
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+def bench_import_billing(data):
+    """Importing `billing` in a new interpreter, which must not import pandas,
+    matplotlib, or openpyxl
+    """
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, billing; "
+            "assert not {'pandas', 'matplotlib', 'openpyxl'} & set(sys.modules)",
+        ],
+        cwd="code",
+        check=True,
+    )
+
+
+BENCHMARKS = {
+    name[len("bench_"):]: function
+    for name, function in list(globals().items())
+    if name.startswith("bench_")
+}
+
+
+def time_benchmark(function, data, repeat=5):
+    """Times `function` after one warm-up call
+
+    Returns
+    -------
+    dict
+        Minimum, median, and mean wall time in seconds over `repeat` calls
+    """
+    function(data)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(data)
+        times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": float(np.median(times)),
+        "mean": float(np.mean(times)),
+        "repeat": repeat,
+    }
+
+
+def git_commit():
+    """Gets the current commit of the repository, or None outside of git"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, repeat=5):
+    """Runs the benchmarks
+
+    Parameters
+    ----------
+    names : list
+        Names of the benchmarks to run. Defaults to all of `BENCHMARKS`
+
+    repeat : int
+        Number of timed calls of each benchmark
+
+    Returns
+    -------
+    dict
+        JSON-serializable results with the commit and environment
+    """
+    names = list(BENCHMARKS) if names is None else names
+    data = setup()
+    results = {
+        "commit": git_commit(),
+        "timestamp": pd.Timestamp.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "benchmarks": {},
+    }
+    for name in names:
+        results["benchmarks"][name] = time_benchmark(BENCHMARKS[name], data, repeat=repeat)
+        results["benchmarks"][name]["description"] = " ".join(
+            BENCHMARKS[name].__doc__.split()
+        )
+        print("{:<40s}{:>10.4f} s".format(name, results["benchmarks"][name]["min"]))
+    return results
+
+
+def compare_results(baseline, results, threshold=0.2):
+    """Compares the minimum time of each benchmark against a baseline
+
+    Parameters
+    ----------
+    baseline : dict
+        Results of `run_benchmarks` for the baseline commit
+
+    results : dict
+        Results of `run_benchmarks` for the current commit
+
+    threshold : float
+        Relative slowdown above which a benchmark is a regression
+
+    Returns
+    -------
+    DataFrame
+        Baseline and current minimum times, their ratio, and whether
+        each benchmark regressed, for benchmarks present in both
+    """
+    names = [name for name in results["benchmarks"] if name in baseline["benchmarks"]]
+    comparison = pd.DataFrame(
+        {
+            "baseline": [baseline["benchmarks"][name]["min"] for name in names],
+            "current": [results["benchmarks"][name]["min"] for name in names],
+        },
+        index=names,
+    )
+    comparison["ratio"] = comparison["current"] / comparison["baseline"]
+    comparison["regression"] = comparison["ratio"] > 1 + threshold
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the billing hot paths")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per benchmark")
+    parser.add_argument("--output", help="JSON results path (default: benchmarks/<commit>.json)")
+    parser.add_argument("--compare", help="JSON results of a baseline commit")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="relative slowdown counted as a regression"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.names or None, repeat=args.repeat)
+    output = args.output or os.path.join(
+        "benchmarks", "{}.json".format(results["commit"] or "results")
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to " + output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            comparison = compare_results(json.load(f), results, threshold=args.threshold)
+        print(comparison.to_string())
+        if comparison["regression"].any():
+            sys.exit(1)
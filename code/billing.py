@@ -0,0 +1,633 @@
+import numpy as np
+import datetime as dt
+from collections import deque
+from instrumentation import timed
+from charge_cache import get_default_cache, tariff_signature, calendar_signature
+from tariff_model import ChargeTensor, Tariff, tier_arrays
+
+# length of the interval over which demand is averaged before finding the peak
+DEMAND_WINDOW_MINUTES = 15
+
+
+@timed()
+def get_charge_array(
+    consumption_data,
+    rate_data,
+    charge_type,
+    utility="electric",
+    as_tensor=False,
+    dtype=np.float64,
+):
+    """Gets an array with customer, demand, or energy charges (i.e. `charge_type`)
+    specific to each day/time
+
+    Parameters
+    ----------
+    consumption_data : DataFrame
+        Baseline electrical usage data. Determines which dates and times
+        to gather rate information. Column headers omitted due to size.
+        See 'data/baseline_noCHP.csv' for an example.
+
+    rate_data : DataFrame or Tariff
+        Electric and gas billing information, as a DataFrame with the columns
+        below or as a `tariff_model.Tariff`
+
+        ==================  ===========================================================
+        utility             type of utility {'electric', 'gas'}
+        type                type of charge {'customer', 'demand', 'energy'}
+        period              period used to calculate demand charge (as `str`)
+        basic_charge_limit (imperial)  the limit in imperial units at which the charge comes into effect (as `int`)
+        basic_charge_limit (metric)  the limit in metric units at which the charge comes into effect (as `int`)
+        month_start         first month for which the charge applies {1-12}
+        month_end           last month for which the charge applies {1-12}
+        hour_start          hour at which the charge begins {0-24}
+        hour_end            hour at which the charge ends {0-24}
+        weekday_start       first day on which the charge applies {0-6}
+        weekday_end         last day for which the charge applies {0-6}
+        charge (imperial)   cost of service per unit gas (therm, therm/hr) or electricity (kW, kWh) (as `int`)
+        charge (metric)     cost of service per unit gas (m3, m3/hr) or electricity (kW, kWh)(as `int`)
+        units               units of `basic_charge_limit` and `charge` (as `str`)
+        ==================  ===========================================================
+
+    charge_type : {'customer', 'demand', 'energy'}
+        Type of charge to look up
+
+    utility : {'electric', 'gas'}
+        Type of utility to look up
+
+    as_tensor : bool
+        Whether to return demand and energy charges as a `tariff_model.ChargeTensor`
+
+    dtype : dtype
+        Floating point type of the charges of a `ChargeTensor`
+
+    Raises
+    ------
+    ValueError
+        When invalid `charge_type` is entered
+
+    KeyError
+        When `consumption_data` does not have 'DateTime' column
+
+    Returns
+    -------
+    array
+        A structured array of arrays with the name of each array corresponding
+        to the basic charge limit which applies to the array of charges
+        corresponding to the given utility and charge type and
+        for each hour, day, and month. `tariff_model.TieredCharges` with the
+        same charges if `rate_data` is a `Tariff`, or `tariff_model.ChargeTensor`
+        if `as_tensor` is True
+    """
+    # imported here since `calendar_index` depends on this module
+    from calendar_index import get_calendar_index
+
+    if isinstance(rate_data, Tariff):
+        if charge_type == "customer":
+            return rate_data.customer[utility]
+        calendar = get_calendar_index(consumption_data["DateTime"])
+        charges = rate_data.get_charges(
+            charge_type, calendar.months, calendar.weekdays, calendar.hours, utility=utility
+        )
+        if as_tensor:
+            return ChargeTensor.from_charges(charges, charge_type, dtype)
+        return charges
+
+    # first search for the correct charge type, then correct utility
+    charges = rate_data.loc[(rate_data["type"] == charge_type), :]
+    charges = charges.loc[charges["utility"] == utility, :]
+    if charge_type == "customer":
+        return charges["charge (imperial)"].values
+    # the calendar is cached by its timestamps and carries the signature of its
+    # points, so the points are not hashed again for every charge lookup
+    calendar = get_calendar_index(consumption_data["DateTime"])
+    charges = build_charge_array(
+        charges,
+        charge_type,
+        calendar.months,
+        calendar.weekdays,
+        calendar.hours,
+        calendar_key=calendar.signature,
+    )
+    if as_tensor:
+        # the tensor is a new array, so the cached array is not copied first
+        return ChargeTensor.from_charges(charges, charge_type, dtype)
+    # copied so that callers may edit the charges without changing the cached array
+    return np.array(charges)
+
+
+def build_charge_array(charges, charge_type, months, weekdays, hours, calendar_key=None):
+    """Evaluates the rows of `charges` at each (month, weekday, hour) point.
+    Results are cached by the content of `charges` and the calendar points,
+    so identical tariffs and repeated calendar patterns are only evaluated once
+
+    Parameters
+    ----------
+    charges : DataFrame
+        Rows of the billing information for a single utility and `charge_type`.
+        See `get_charge_array` for a description of the columns
+
+    charge_type : {'demand', 'energy'}
+        Type of charge in `charges`
+
+    months : array
+        Month {1-12} of each point
+
+    weekdays : array
+        Weekday {0-6} of each point
+
+    hours : array
+        Fractional hour of day {0-24} of each point
+
+    calendar_key : str
+        Hash of the points from `charge_cache.calendar_signature`, e.g.
+        `calendar_index.CalendarIndex.signature`. Computed from the points if not given
+
+    Raises
+    ------
+    ValueError
+        When invalid `charge_type` is entered
+
+    Returns
+    -------
+    array
+        A structured array of arrays with the name of each array corresponding
+        to the basic charge limit which applies to the array of charges
+        at each point. The array is read-only when it is shared through the cache
+    """
+    cache = get_default_cache()
+    if not cache.enabled:
+        return _evaluate_charges(charges, charge_type, months, weekdays, hours)
+    if calendar_key is None:
+        calendar_key = calendar_signature(months, weekdays, hours)
+    key = "{}-{}-{}".format(charge_type, tariff_signature(charges), calendar_key)
+    return cache.get_or_compute(
+        key, lambda: _evaluate_charges(charges, charge_type, months, weekdays, hours)
+    )
+
+
+@timed("build_charge_array")
+def _evaluate_charges(charges, charge_type, months, weekdays, hours):
+    """Evaluates the rows of `charges` at each point without caching.
+    The rows are converted to the record array of a `tariff_model.Tariff`, so
+    billing information is evaluated the same way as a DataFrame or a `Tariff`.
+    See `build_charge_array`
+    """
+    if charge_type not in ["demand", "energy"]:
+        raise ValueError("Invalid charge_type: " + charge_type)
+    tariff = Tariff.from_rows(charges, charge_type)
+    return tariff.get_charges(charge_type, months, weekdays, hours).to_structured()
+
+
+@timed()
+def calculate_cost(
+    charges,
+    consumption_data,
+    charge_type="demand",
+    utility="electric",
+    interval_minutes=15,
+    demand_window=DEMAND_WINDOW_MINUTES,
+    rolling=False,
+    peaks=1,
+    minimum_demand=None,
+):
+    """Calculates the cost of given charges (demand or energy) for the given
+    billing rate structure, utility, and consumption information
+
+    Parameters
+    ----------
+    charges : array, TieredCharges, or ChargeTensor
+        structured array of arrays with names denoting to charge limit for each array
+        of demand or energy charges, `tariff_model.TieredCharges`, or
+        `tariff_model.ChargeTensor`
+
+    consumption_data : Series or array
+        Baseline electrical or gas usage data aligned with `charges`.
+        See 'data/synthetic_energy_data.csv' for an example.
+
+    charge_type : {'demand', 'energy'}
+        Type of charge to calculate costs for
+
+    utility : {'electric', 'gas'}
+        Type of utility to calculate costs for
+
+    interval_minutes : float
+        Length of each interval of `consumption_data` in minutes.
+        Data finer than `demand_window` is averaged over demand
+        windows before finding the peak demand
+
+    demand_window : float
+        Length in minutes of the window over which demand is averaged
+
+    rolling : bool
+        Whether demand windows start at every interval (i.e., a rolling average)
+        instead of every `demand_window` minutes
+
+    peaks : int
+        Number of daily peaks averaged into the billed demand. The default
+        bills the single highest demand of the billing period
+
+    minimum_demand : list
+        Lowest billed demand of each demand charge, as an array for each tier,
+        e.g. a ratchet from `ratchet_demands`. Defaults to no minimum
+
+    Raises
+    ------
+    ValueError
+        When invalid `utility` or `charge_type` is entered
+
+    Returns
+    -------
+    int
+        cost in USD for the given `consumption_data`, `charge_type`, and `utility`
+    """
+    cost = 0
+
+    if charge_type == "demand":
+        limits, rates, demands = calculate_peak_demands(
+            charges, consumption_data, interval_minutes, demand_window, rolling, peaks
+        )
+        if minimum_demand is not None:
+            demands = [
+                np.maximum(demand, minimum) for demand, minimum in zip(demands, minimum_demand)
+            ]
+        cost = calculate_demand_cost(limits, rates, demands)
+    elif charge_type == "energy":
+        # number of intervals per hour (electric) or per day (gas)
+        if utility == "electric":
+            divisor = 60 / interval_minutes
+        elif utility == "gas":
+            divisor = 1440 / interval_minutes
+        else:
+            raise ValueError("Invalid utility: " + utility)
+
+        cost = calculate_tiered_energy_cost(charges, consumption_data, divisor)
+    else:
+        raise ValueError("Invalid charge_type: " + charge_type)
+
+    return cost
+
+
+def calculate_peak_demands(
+    charges,
+    consumption_data,
+    interval_minutes=15,
+    demand_window=DEMAND_WINDOW_MINUTES,
+    rolling=False,
+    peaks=1,
+):
+    """Finds the billed demand of each demand charge over a billing period.
+    See `calculate_cost` for a description of the parameters
+
+    Returns
+    -------
+    tuple
+        (limits, rates, demands) with the basic charge limit, the charges in
+        each demand window, and the billed demand of each column of each tier
+    """
+    consumption = np.asarray(consumption_data, dtype=float)
+    window = max(int(round(demand_window / interval_minutes)), 1)
+    if window > 1:
+        consumption, charges = average_demand_windows(
+            consumption, charges, window, rolling=rolling
+        )
+    limits, rates = tier_arrays(charges)
+    windows_per_day = 1440 / interval_minutes / (1 if rolling else window)
+    return limits, rates, find_peak_demands(rates, consumption, peaks, windows_per_day)
+
+
+def find_peak_demands(rates, demand, peaks=1, windows_per_day=96):
+    """Finds the billed demand of each demand charge, i.e. the demand
+    at which `rates * demand` peaks
+
+    Parameters
+    ----------
+    rates : list
+        Charges of each tier, as an array of shape (windows, columns) or (windows,)
+
+    demand : array
+        Demand averaged over each demand window
+
+    peaks : int
+        Number of daily peaks to average. With more than one, the peak of each
+        day is found in one pass and the `peaks` highest days are averaged
+
+    windows_per_day : float
+        Number of demand windows per day, which start at the first window
+
+    Returns
+    -------
+    list
+        Billed demand of each column of each tier
+    """
+    demands = []
+    for tier_rates in rates:
+        # a single demand charge may be stored as a 1-D array
+        tier_rates = tier_rates.reshape(len(demand), -1)
+        if peaks <= 1:
+            demands.append(
+                np.array(
+                    [
+                        demand[np.argmax(tier_rates[:, i] * demand)]
+                        for i in range(tier_rates.shape[1])
+                    ]
+                )
+            )
+            continue
+
+        charged = tier_rates * demand[:, None]
+
+        # pad to whole days so that each day's peak is an argmax along one axis
+        per_day = max(int(round(windows_per_day)), 1)
+        ndays = -(-len(demand) // per_day)
+        padded = np.full((ndays * per_day, charged.shape[1]), -np.inf)
+        padded[: len(demand)] = charged
+        daily_peaks = np.argmax(padded.reshape(ndays, per_day, -1), axis=1)
+        daily_peaks += np.arange(ndays)[:, None] * per_day
+        daily_charged = np.take_along_axis(charged, daily_peaks, axis=0)
+        if ndays > peaks:
+            top_days = np.argpartition(-daily_charged, peaks - 1, axis=0)[:peaks]
+            daily_peaks = np.take_along_axis(daily_peaks, top_days, axis=0)
+        demands.append(demand[daily_peaks].mean(axis=0))
+    return demands
+
+
+def calculate_demand_cost(limits, rates, demands):
+    """Calculates the cost of tiered demand charges at the billed demands
+
+    Parameters
+    ----------
+    limits : list
+        Basic charge limit of each tier in ascending order
+
+    rates : list
+        Charges of each tier, as an array of shape (windows, columns) or (windows,)
+
+    demands : list
+        Billed demand of each column of each tier from `find_peak_demands`
+
+    Returns
+    -------
+    float
+        cost in USD of the demand charges
+    """
+    cost = 0
+    for j, (limit, demand) in enumerate(zip(limits, demands)):
+        tier_rates = rates[j].reshape(rates[j].shape[0], -1)
+        next_limit = limits[j + 1] if j < len(limits) - 1 else None
+        # columns of a structured array are strided, so each is reduced on its own
+        for i in range(tier_rates.shape[1]):
+            if next_limit is not None and demand[i] > next_limit:
+                cost += np.max((next_limit - limit) * tier_rates[:, i])
+            else:
+                cost += np.max([np.max((demand[i] - limit) * tier_rates[:, i]), 0])
+    return cost
+
+
+def tier_demand_cost(demand, limit, next_limit, max_rate, min_rate, return_slope=False):
+    """Calculates the cost of each demand charge of one tier from its billed demand
+    and the highest and lowest rate of each charge over the billing period
+
+    The cost of a charge is the maximum of (demand - limit) * rate over its rates,
+    which is at the highest rate for demand above the limit and at the lowest rate
+    below it, and it is capped at (next_limit - limit) * highest rate once the
+    demand exceeds the next tier. Identical to `calculate_demand_cost`.
+
+    Parameters
+    ----------
+    demand : array
+        Billed demand of each charge, with the charges along the last axis
+
+    limit : float
+        Basic charge limit of the tier
+
+    next_limit : float
+        Basic charge limit of the next tier, or None for the last tier
+
+    max_rate : array
+        Highest rate of each charge
+
+    min_rate : array
+        Lowest rate of each charge
+
+    return_slope : bool
+        Whether to also return the derivative of each cost with respect to its demand
+
+    Returns
+    -------
+    array or tuple
+        Cost in USD of each charge with the shape of `demand`, and its slope
+        if `return_slope` is True
+    """
+    excess = demand - limit
+    slope = np.where(excess >= 0, max_rate, min_rate)
+    cost = np.maximum(excess * slope, 0)
+    if next_limit is not None:
+        capped = demand > next_limit
+        cost = np.where(capped, (next_limit - limit) * max_rate, cost)
+    else:
+        capped = np.zeros(np.shape(demand), dtype=bool)
+    if return_slope:
+        return cost, np.where(~capped & (excess * slope > 0), slope, 0)
+    return cost
+
+
+def ratchet_demands(peak_demands, period_ids, fraction=0.8, months=11):
+    """Applies a demand ratchet, which bills at least `fraction` of the highest
+    demand of the preceding `months` billing periods
+
+    The trailing maximum is kept with a monotonic queue, so each billing period
+    is added and removed once regardless of `months`.
+
+    Parameters
+    ----------
+    peak_demands : array
+        Peak demand of each billing period (rows) and demand charge (columns)
+
+    period_ids : array
+        Consecutive month number of each billing period, e.g. year * 12 + month
+
+    fraction : float
+        Fraction of the trailing peak demand that is billed at minimum
+
+    months : int
+        Number of preceding months over which the peak is taken
+
+    Returns
+    -------
+    array
+        Lowest billed demand of each billing period and demand charge
+    """
+    peak_demands = np.asarray(peak_demands, dtype=float)
+    minimum = np.zeros_like(peak_demands)
+    for column in range(peak_demands.shape[1]):
+        queue = deque()
+        for p, period_id in enumerate(period_ids):
+            while queue and period_ids[queue[0]] < period_id - months:
+                queue.popleft()
+            if queue:
+                minimum[p, column] = fraction * peak_demands[queue[0], column]
+            while queue and peak_demands[queue[-1], column] <= peak_demands[p, column]:
+                queue.pop()
+            queue.append(p)
+    return minimum
+
+
+@timed()
+def calculate_tiered_energy_cost(charges, consumption_data, divisor):
+    """Calculates the cost of tiered energy charges in a single vectorized pass
+
+    The cumulative energy is computed once and `np.searchsorted` finds the interval
+    in which each `basic_charge_limit` is crossed. Intervals before the crossing
+    are billed at the current tier's rate, the crossing interval is billed up to
+    the limit, and the next tier starts with the following interval.
+
+    Parameters
+    ----------
+    charges : array or TieredCharges
+        structured array of arrays with names denoting to charge limit for each array
+        of energy charges, or `tariff_model.TieredCharges`
+
+    consumption_data : array
+        Electrical or gas usage data aligned with `charges`
+
+    divisor : float
+        Number of intervals per unit of time of the rates, i.e. 4 for
+        electric energy in kWh from 15-minute kW data
+
+    Returns
+    -------
+    float
+        cost in USD for the given `consumption_data`
+    """
+    limits, tier_rates = tier_arrays(charges)
+    consumption = np.asarray(consumption_data, dtype=float)
+    energy = np.cumsum(consumption)
+    tiers = find_tier_crossings(limits, energy / divisor, consumption)
+
+    cost = 0
+    for j, (start_idx, i) in enumerate(tiers):
+        rates = tier_rates[j]
+        if i is None:
+            cost += np.sum((consumption[start_idx:] / divisor) * rates[start_idx:])
+        else:
+            cost += np.sum((consumption[start_idx:i] / divisor) * rates[start_idx:i])
+            cost += (limits[j + 1] - ((energy[i] - consumption[i]) / divisor)) * rates[i]
+
+    return cost
+
+
+def find_tier_crossings(limits, cumulative, consumption):
+    """Finds the intervals billed by each energy tier
+
+    Parameters
+    ----------
+    limits : list
+        Basic charge limit of each tier in ascending order
+
+    cumulative : array
+        Cumulative energy at the end of each interval in the units of `limits`
+
+    consumption : array
+        Electrical or gas usage data of each interval
+
+    Returns
+    -------
+    list
+        (start_idx, crossing_idx) of each billed tier. Intervals from `start_idx`
+        up to `crossing_idx` are billed in full, and interval `crossing_idx` is
+        billed up to the next limit. `crossing_idx` is None if the tier is
+        billed through the last interval
+    """
+    # cumulative energy is only sorted if there is no export to the grid
+    is_sorted = consumption.size == 0 or consumption.min() >= 0
+    n = len(consumption)
+
+    tiers = []
+    start_idx = 0
+    for j in range(len(limits)):
+        if j == len(limits) - 1:
+            tiers.append((start_idx, None))
+            break
+
+        limit = limits[j + 1]
+        if is_sorted:
+            i = start_idx + np.searchsorted(cumulative[start_idx:], limit, side="right")
+        else:
+            crossed = cumulative[start_idx:] > limit
+            i = start_idx + np.argmax(crossed) if crossed.any() else n
+        if i == n:
+            # limit is never reached, so the rest is billed at this tier
+            tiers.append((start_idx, None))
+            break
+
+        tiers.append((start_idx, i))
+        start_idx = i + 1
+        if start_idx == n:
+            break
+
+    return tiers
+
+
+def average_demand_windows(consumption, charges, window, rolling=False):
+    """Averages consumption over consecutive demand windows of `window`
+    intervals, starting from the first interval, or over a rolling window
+
+    Parameters
+    ----------
+    consumption : array
+        Electrical or gas usage data
+
+    charges : array
+        structured array of demand charges aligned with `consumption`
+
+    window : int
+        Number of intervals per demand window
+
+    rolling : bool
+        Whether a window starts at every interval with a full window after it,
+        averaged in O(n) from the running sum of consumption
+
+    Returns
+    -------
+    tuple
+        (consumption, charges) with one entry per demand window, where the
+        charges are those in effect at the start of each window
+    """
+    if rolling:
+        if len(consumption) <= window:
+            return np.mean(consumption, keepdims=True), charges[:1]
+        running = np.concatenate([[0], np.cumsum(consumption)])
+        nwindows = len(consumption) - window + 1
+        return (running[window:] - running[:nwindows]) / window, charges[:nwindows]
+    starts = np.arange(0, len(consumption), window)
+    counts = np.diff(np.append(starts, len(consumption)))
+    return np.add.reduceat(consumption, starts) / counts, charges[starts]
+
+
+def infer_interval_minutes(datetimes):
+    """Infers the interval length of a load profile from its timestamps
+
+    Parameters
+    ----------
+    datetimes : Series
+        Datetime series, e.g. the 'DateTime' column of the consumption data
+
+    Returns
+    -------
+    float
+        Median spacing between consecutive timestamps in minutes,
+        or 15 if there are fewer than two timestamps
+    """
+    if len(datetimes) < 2:
+        return 15
+    deltas = np.diff(datetimes.values).astype("timedelta64[s]").astype(float)
+    return float(np.median(deltas)) / 60
+
+
+def last_day_of_month(any_day):
+    """From: https://stackoverflow.com/questions/42950/how-to-get-the-last-day-of-the-month"""
+    # get close to the end of the month for any day, and add 4 days 'over'
+    next_month = any_day.replace(day=28) + dt.timedelta(days=4)
+    # subtract the number of remaining 'overage' days to get last day of current month, or said programattically said, the previous day of the first of next month
+    return next_month - dt.timedelta(days=next_month.day)
@@ -0,0 +1,158 @@
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from billing import infer_interval_minutes
+from charge_cache import calendar_signature
+from compiled_tariff import CALENDAR_SHAPE
+from instrumentation import timer, count
+
+# number of calendar indexes kept by `get_calendar_index`
+CACHE_SIZE = 8
+_cache = OrderedDict()
+
+
+class CalendarIndex:
+    """Calendar features of a load profile, built once and shared by every
+    billing routine
+
+    Parameters
+    ----------
+    datetimes : Series
+        Datetime series, e.g. the 'DateTime' column of the consumption data
+
+    holidays : list or 'federal'
+        Dates to flag as holidays, or 'federal' for U.S. federal holidays.
+        Holidays are billed at the charges of a Sunday. Defaults to no holidays
+
+    Attributes
+    ----------
+    datetimes : Series
+        Parsed timestamps of the load profile
+
+    months : array
+        Month {1-12} of each interval
+
+    weekdays : array
+        Weekday {0-6} of each interval
+
+    hours : array
+        Fractional hour of day {0-24} of each interval
+
+    slots : array
+        15-minute slot of the day {0-95} of each interval
+
+    keys : array
+        Flat (month, weekday, slot) index into compiled tariff tables, with the
+        weekday of holidays set to Sunday {6}
+
+    holidays : array
+        Whether each interval falls on a holiday
+
+    periods : DataFrame
+        One row per monthly billing period with its 'year', 'month', and the
+        'start' and (exclusive) 'end' positions in the load profile
+
+    interval_minutes : float
+        Length of each interval in minutes
+    """
+
+    def __init__(self, datetimes, holidays=None):
+        self.datetimes = pd.to_datetime(pd.Series(datetimes)).reset_index(drop=True)
+        years = self.datetimes.dt.year.values
+        self.months = self.datetimes.dt.month.values
+        self.weekdays = self.datetimes.dt.weekday.values
+        hours = self.datetimes.dt.hour.values
+        minutes = self.datetimes.dt.minute.values
+        self.hours = hours + minutes / 60
+        self.slots = hours * 4 + minutes // 15
+        self.interval_minutes = infer_interval_minutes(self.datetimes)
+        self._signature = None
+
+        dates = self.datetimes.dt.normalize()
+        if holidays is None:
+            self.holidays = np.zeros(len(dates), dtype=bool)
+        else:
+            if isinstance(holidays, str) and holidays == "federal":
+                from pandas.tseries.holiday import USFederalHolidayCalendar
+
+                holidays = USFederalHolidayCalendar().holidays(dates.min(), dates.max())
+            self.holidays = dates.isin(pd.to_datetime(holidays)).values
+        # utilities bill holidays at their weekend (off-peak) charges
+        self.keys = np.ravel_multi_index(
+            (self.months - 1, np.where(self.holidays, 6, self.weekdays), self.slots),
+            CALENDAR_SHAPE,
+        )
+
+        period_ids = years * 12 + self.months
+        starts = np.flatnonzero(np.diff(period_ids, prepend=period_ids[0] - 1))
+        ends = np.append(starts[1:], len(period_ids))
+        self.periods = pd.DataFrame(
+            {"year": years[starts], "month": self.months[starts], "start": starts, "end": ends}
+        )
+        self._period_lookup = {
+            (year, month): (start, end)
+            for year, month, start, end in self.periods.itertuples(index=False)
+        }
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def signature(self):
+        """Hash of the (month, weekday, hour) points from `charge_cache.calendar_signature`,
+        computed on first use so that charge array lookups do not hash the points again
+        """
+        if self._signature is None:
+            self._signature = calendar_signature(self.months, self.weekdays, self.hours)
+        return self._signature
+
+    def period_slice(self, year, month):
+        """Gets the positions of a billing period in O(1)
+
+        Raises
+        ------
+        KeyError
+            When the load profile does not include `year` and `month`
+
+        Returns
+        -------
+        slice
+            Positions of the given billing period in the load profile
+        """
+        start, end = self._period_lookup[(year, month)]
+        return slice(start, end)
+
+
+def get_calendar_index(datetimes, holidays=None):
+    """Gets the `CalendarIndex` of a load profile, reusing a cached one if
+    the same timestamps were indexed before so they are only parsed once
+
+    Parameters
+    ----------
+    datetimes : Series
+        Datetime series (or unparsed strings), e.g. the 'DateTime'
+        column of the consumption data
+
+    holidays : list or 'federal'
+        Dates to flag as holidays. See `CalendarIndex`
+
+    Returns
+    -------
+    CalendarIndex
+        Calendar features of `datetimes`
+    """
+    values = pd.util.hash_pandas_object(pd.Series(datetimes), index=False).values
+    key = (hashlib.sha1(values.tobytes()).hexdigest(), repr(holidays))
+    if key in _cache:
+        count("calendar_cache_hits")
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    count("calendar_cache_misses")
+    with timer("build_calendar_index"):
+        calendar = CalendarIndex(datetimes, holidays=holidays)
+    _cache[key] = calendar
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return calendar
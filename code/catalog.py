@@ -0,0 +1,228 @@
+import os
+import numpy as np
+import pandas as pd
+from compiled_tariff import compile_tariff
+from tariff_cache import REPO_DIR, BILLING_PATH, load_tariffs
+from tariff_model import Tariff
+
+METADATA_PATH = os.path.join(REPO_DIR, "data", "metadata.csv")
+# metadata columns looked up by equality, keyed by query name
+HASH_INDEXES = {
+    "state": "State",
+    "electric_utility": "Electricity Utility",
+    "gas_utility": "Gas Utility",
+    "has_cogen": "Has Cogen",
+    "energy_temporality": "Electricity Energy Charge Temporality",
+    "demand_temporality": "Electricity Demand Charge Temporality",
+}
+# metadata columns looked up by range, keyed by query name
+SORTED_INDEXES = {
+    "flow": "Existing Total Flow (MGD)",
+    "design_flow": "Design Flow (MGD)",
+    "electric_demand": "Est. Existing Electric Grid Demand (MW)",
+    "design_electric_demand": "Est. Design Electric Grid Demand (MW)",
+    "gas_demand": "Est. Existing Natural Gas Demand (therms/hr)",
+    "design_gas_demand": "Est. Design Natural Gas Demand (therms/hr)",
+}
+
+
+class FacilityCatalog:
+    """Facility metadata joined with each facility's tariff, indexed for queries
+
+    Categorical columns (see `HASH_INDEXES`) are indexed by a dictionary from each
+    value to the rows that have it, and numeric columns (see `SORTED_INDEXES`) by
+    their sort order, so a query touches only the matching rows. Tariffs are
+    built from the billing information once, on first use.
+
+    Parameters
+    ----------
+    metadata : DataFrame
+        Facility metadata, i.e. 'data/metadata.csv'
+
+    tariffs : dict
+        Billing information (as `DataFrame`) keyed by CWNS number,
+        e.g. from `tariff_cache.load_tariffs`
+
+    Attributes
+    ----------
+    cwns_nos : array
+        CWNS number of each row of `metadata`
+    """
+
+    def __init__(self, metadata, tariffs):
+        self.metadata = metadata.reset_index(drop=True)
+        self.cwns_nos = self.metadata["CWNS_No"].values
+        self._rows = {cwns_no: row for row, cwns_no in enumerate(self.cwns_nos)}
+        self._rate_data = tariffs
+        self._tariffs = {}
+        self._compiled = {}
+
+        self._hash_indexes = {}
+        for name, column in HASH_INDEXES.items():
+            codes, values = pd.factorize(self.metadata[column])
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+            # missing values (code -1) sort first and are not indexed
+            self._hash_indexes[name] = {
+                value: order[bounds[code] : bounds[code + 1]] for code, value in enumerate(values)
+            }
+
+        self._sorted_indexes = {}
+        for name, column in SORTED_INDEXES.items():
+            values = self.metadata[column].to_numpy(dtype=float)
+            order = np.argsort(values, kind="stable")
+            self._sorted_indexes[name] = (values[order], order)
+
+    @classmethod
+    def from_files(cls, metadata_path=METADATA_PATH, workbook_path=BILLING_PATH):
+        """Builds the catalog from 'data/metadata.csv' and the billing workbook,
+        whose compiled cache is read instead of the workbook when it is current.
+        See `tariff_cache.load_tariffs`
+        """
+        return cls(pd.read_csv(metadata_path), load_tariffs(workbook_path))
+
+    def __len__(self):
+        return len(self.cwns_nos)
+
+    def values(self, name):
+        """Gets the distinct values of a hash index, e.g. every state"""
+        return list(self._hash_indexes[name].keys())
+
+    def rows(self, **conditions):
+        """Finds the rows of the metadata matching every condition
+
+        Parameters
+        ----------
+        conditions : dict
+            Conditions keyed by the name of an index. A hash index (see
+            `HASH_INDEXES`) takes a value or a list of values, and a sorted index
+            (see `SORTED_INDEXES`) takes a (low, high) range with inclusive bounds,
+            either of which may be None, e.g. `flow=(100, None)`
+
+        Raises
+        ------
+        KeyError
+            When a condition is not the name of an index
+
+        Returns
+        -------
+        array
+            Rows of the metadata in ascending order
+        """
+        selected = None
+        for name, condition in conditions.items():
+            if name in self._hash_indexes:
+                index = self._hash_indexes[name]
+                values = condition if isinstance(condition, (list, tuple, set)) else [condition]
+                rows = np.concatenate(
+                    [index.get(value, np.array([], dtype=int)) for value in values]
+                )
+            elif name in self._sorted_indexes:
+                sorted_values, order = self._sorted_indexes[name]
+                low, high = condition
+                first = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+                last = (
+                    len(order)
+                    if high is None
+                    else np.searchsorted(sorted_values, high, side="right")
+                )
+                rows = order[first:last]
+            else:
+                raise KeyError("No index named " + name)
+            rows = np.sort(rows)
+            selected = rows if selected is None else np.intersect1d(selected, rows, True)
+            if len(selected) == 0:
+                break
+        return np.arange(len(self)) if selected is None else selected
+
+    def query(self, **conditions):
+        """Gets the CWNS numbers of the facilities matching every condition.
+        See `rows` for a description of the conditions
+
+        Returns
+        -------
+        list
+            CWNS numbers (as `int`) in the order of the metadata, like the keys
+            of `tariff_cache.load_tariffs`
+        """
+        return self.cwns_nos[self.rows(**conditions)].tolist()
+
+    def facilities(self, **conditions):
+        """Gets the metadata of the facilities matching every condition.
+        See `rows` for a description of the conditions
+        """
+        return self.metadata.iloc[self.rows(**conditions)]
+
+    def tariff(self, cwns_no):
+        """Gets the `tariff_model.Tariff` of a facility, built on first use"""
+        if cwns_no not in self._tariffs:
+            self._tariffs[cwns_no] = Tariff.from_frame(self._rate_data[cwns_no])
+        return self._tariffs[cwns_no]
+
+    def compiled_tariff(self, cwns_no):
+        """Gets the tariff of a facility compiled by `compiled_tariff.compile_tariff`,
+        built on first use
+        """
+        if cwns_no not in self._compiled:
+            self._compiled[cwns_no] = compile_tariff(self.tariff(cwns_no))
+        return self._compiled[cwns_no]
+
+    def tariffs(self, **conditions):
+        """Gets the `tariff_model.Tariff` of the facilities matching every condition
+
+        Returns
+        -------
+        dict
+            Tariffs keyed by CWNS number. See `rows` for a description of the conditions
+        """
+        return {cwns_no: self.tariff(cwns_no) for cwns_no in self.query(**conditions)}
+
+    def bill(
+        self,
+        consumption_data,
+        elec_col="grid_to_plant_kW",
+        ng_col="natural_gas_therm_per_hr",
+        units="imperial",
+        demand_options=None,
+        **conditions,
+    ):
+        """Bills a load profile for the facilities matching every condition
+
+        Parameters
+        ----------
+        consumption_data : DataFrame
+            Electrical and gas usage data with a 'DateTime' column.
+            See 'data/synthetic_energy_data.csv' for an example.
+
+        elec_col : str
+            Name of the electricity consumption column in kW
+
+        ng_col : str
+            Name of the natural gas consumption column in therms/hr, or m3/hr
+            if `units` is 'metric'
+
+        units : {'imperial', 'metric'}
+            Units of the consumption data. See `compiled_tariff.convert_tariff`
+
+        demand_options : dict
+            Demand window, peak, and ratchet options of
+            `batch_billing.calculate_facility_costs`. Defaults to none
+
+        conditions : dict
+            See `rows` for a description of the conditions
+
+        Returns
+        -------
+        BillingResults
+            Costs of every matching facility from `results.bill_facilities`
+        """
+        from results import bill_facilities
+
+        return bill_facilities(
+            consumption_data,
+            {cwns_no: self.compiled_tariff(cwns_no) for cwns_no in self.query(**conditions)},
+            elec_col=elec_col,
+            ng_col=ng_col,
+            units=units,
+            **(demand_options or {}),
+        )
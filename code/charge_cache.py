@@ -0,0 +1,238 @@
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from instrumentation import count
+
+# number of charge arrays kept in memory by the default cache
+CACHE_SIZE = 256
+# total size in bytes of the charge arrays kept in memory by the default cache
+CACHE_BYTES = 256 * 2**20
+# numeric columns of the billing information that determine a charge array
+TARIFF_COLUMNS = [
+    "basic_charge_limit (imperial)",
+    "month_start",
+    "month_end",
+    "hour_start",
+    "hour_end",
+    "weekday_start",
+    "weekday_end",
+    "charge (imperial)",
+]
+
+
+def tariff_signature(charges):
+    """Hashes the rows of billing information that determine a charge array
+
+    Parameters
+    ----------
+    charges : DataFrame
+        Rows of the billing information for a single utility and charge type
+
+    Returns
+    -------
+    str
+        SHA-1 hex digest of the rows, identical for identical tariffs
+        regardless of the facility they belong to
+    """
+    sha = hashlib.sha1()
+    sha.update(charges[TARIFF_COLUMNS].to_numpy(dtype=float).tobytes())
+    sha.update(repr(charges["period"].tolist()).encode())
+    # `billing.build_charge_array` uses row positions relative to the first row,
+    # so identical rows at different rows of the sheet hash the same
+    index = charges.index.values
+    sha.update(repr((index - index.min() if len(index) else index).tolist()).encode())
+    return sha.hexdigest()
+
+
+def calendar_signature(months, weekdays, hours):
+    """Hashes the (month, weekday, hour) points at which charges are evaluated
+
+    Returns
+    -------
+    str
+        SHA-1 hex digest, identical for any two date ranges with the same
+        calendar pattern, e.g. the same month of two years starting on the same weekday
+    """
+    sha = hashlib.sha1()
+    for values in [months, weekdays, hours]:
+        sha.update(np.ascontiguousarray(values, dtype=float).tobytes())
+    return sha.hexdigest()
+
+
+class ChargeArrayCache:
+    """Content-addressed LRU cache of charge arrays with an optional on-disk spill
+
+    Cached arrays are shared between callers, so they are returned read-only.
+
+    Parameters
+    ----------
+    maxsize : int
+        Number of arrays kept in memory. 0 disables the cache
+
+    max_bytes : int
+        Total size of the arrays kept in memory. Arrays larger than this
+        are computed without caching
+
+    spill_dir : str
+        Directory to which arrays evicted from memory are written, and from which
+        they are read back on a later miss. Defaults to no spill
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups found in memory
+
+    disk_hits : int
+        Number of lookups read back from `spill_dir`
+
+    misses : int
+        Number of lookups that were computed
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, spill_dir=None, max_bytes=CACHE_BYTES):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._arrays = OrderedDict()
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._arrays)
+
+    @property
+    def enabled(self):
+        """Whether arrays are cached, so that callers can skip building keys"""
+        return self.maxsize > 0 and self.max_bytes > 0
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, key + ".npy")
+
+    def get_or_compute(self, key, compute):
+        """Gets the array cached under `key`, or computes and caches it
+
+        Parameters
+        ----------
+        key : str
+            Content hash of everything `compute` depends on
+
+        compute : function
+            Function without arguments that returns the array
+
+        Returns
+        -------
+        array
+            Read-only cached array
+        """
+        if not self.enabled:
+            return compute()
+        if key in self._arrays:
+            self.hits += 1
+            count("charge_cache_hits")
+            self._arrays.move_to_end(key)
+            return self._arrays[key]
+
+        if self.spill_dir is not None and os.path.exists(self._spill_path(key)):
+            self.disk_hits += 1
+            count("charge_cache_disk_hits")
+            array = np.load(self._spill_path(key))
+        else:
+            self.misses += 1
+            count("charge_cache_misses")
+            array = compute()
+        if array.nbytes > self.max_bytes:
+            return array
+        array.setflags(write=False)
+        self._arrays[key] = array
+        self.nbytes += array.nbytes
+        while len(self._arrays) > self.maxsize or self.nbytes > self.max_bytes:
+            evicted_key, evicted = self._arrays.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            if self.spill_dir is not None and not os.path.exists(self._spill_path(evicted_key)):
+                # write to a uniquely named temporary file first so that readers never
+                # see a partial file and concurrent processes never share one
+                with tempfile.NamedTemporaryFile(
+                    dir=self.spill_dir, suffix=".tmp.npy", delete=False
+                ) as f:
+                    np.save(f, evicted)
+                os.replace(f.name, self._spill_path(evicted_key))
+        return array
+
+    def clear(self):
+        """Empties the in-memory cache and resets its statistics, keeping spilled arrays"""
+        self._arrays.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Gets the statistics of the cache
+
+        Returns
+        -------
+        dict
+            'hits', 'disk_hits', 'misses', 'size', 'maxsize', 'nbytes', and 'max_bytes'
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self._arrays),
+            "maxsize": self.maxsize,
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_default_cache = ChargeArrayCache()
+
+
+def get_default_cache():
+    """Returns the cache used by `billing.build_charge_array`"""
+    return _default_cache
+
+
+def configure_cache(maxsize=CACHE_SIZE, spill_dir=None, max_bytes=CACHE_BYTES):
+    """Replaces the cache used by `billing.build_charge_array`
+
+    Parameters
+    ----------
+    maxsize : int
+        Number of arrays kept in memory. 0 disables the cache
+
+    spill_dir : str
+        Directory for arrays evicted from memory. Defaults to no spill
+
+    max_bytes : int
+        Total size of the arrays kept in memory
+
+    Returns
+    -------
+    ChargeArrayCache
+        The new default cache
+    """
+    global _default_cache
+    _default_cache = ChargeArrayCache(maxsize=maxsize, spill_dir=spill_dir, max_bytes=max_bytes)
+    return _default_cache
+
+
+@contextmanager
+def cache_disabled():
+    """Disables the default cache within a `with` block and restores it afterwards,
+    e.g. to time the evaluation of charge arrays
+    """
+    global _default_cache
+    previous = _default_cache
+    _default_cache = ChargeArrayCache(maxsize=0)
+    try:
+        yield
+    finally:
+        _default_cache = previous
@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import argparse
+
+# only the standard library is imported here so that `--help` returns
+# immediately; the billing modules are imported once the arguments are parsed
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENERGY_PATH = os.path.join(REPO_DIR, "data", "synthetic_energy_data.csv")
+BILLING_PATH = os.path.join(REPO_DIR, "data", "WWTP_Billing.xlsx")
+
+
+def build_parser():
+    """Builds the parser of the command line arguments of `main`"""
+    parser = argparse.ArgumentParser(
+        description="Calculate the monthly electricity and natural gas bill of facilities"
+    )
+    parser.add_argument("cwns_nos", nargs="+", type=int, help="CWNS numbers of the facilities")
+    parser.add_argument(
+        "--profile", default=ENERGY_PATH, help="load profile CSV with a 'DateTime' column"
+    )
+    parser.add_argument("--tariffs", default=BILLING_PATH, help="billing workbook")
+    parser.add_argument("--elec-col", default="grid_to_plant_kW", help="electricity column in kW")
+    parser.add_argument(
+        "--ng-col",
+        default="natural_gas_therm_per_hr",
+        help="natural gas column in therms/hr, or m3/hr with --units metric",
+    )
+    parser.add_argument(
+        "--units",
+        choices=["imperial", "metric"],
+        default="imperial",
+        help="units of the load profile",
+    )
+    parser.add_argument(
+        "--demand-window", type=float, default=15, help="demand window in minutes"
+    )
+    parser.add_argument(
+        "--rolling", action="store_true", help="bill demand on a rolling average"
+    )
+    parser.add_argument(
+        "--peaks", type=int, default=1, help="number of daily peaks averaged into demand"
+    )
+    parser.add_argument(
+        "--ratchet-fraction",
+        type=float,
+        default=0,
+        help="fraction of the trailing peak demand billed at minimum (default: no ratchet)",
+    )
+    parser.add_argument(
+        "--ratchet-months", type=int, default=11, help="months of the demand ratchet"
+    )
+    parser.add_argument("--output", help="save the costs to a .npz, .parquet, or .csv file")
+    parser.add_argument(
+        "--timing", action="store_true", help="print the time spent in each step"
+    )
+    return parser
+
+
+def parse_args(argv=None):
+    """Parses the command line arguments of `main`"""
+    return build_parser().parse_args(argv)
+
+
+def main(argv=None):
+    """Bills each facility in `argv` for the load profile and prints its costs
+
+    Parameters
+    ----------
+    argv : list
+        Command line arguments. Defaults to `sys.argv[1:]`
+
+    Returns
+    -------
+    BillingResults
+        Costs of every facility, billing period, and charge type
+    """
+    start = time.perf_counter()
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+    import instrumentation
+    from tariff_cache import load_tariffs
+    from results import bill_facilities
+
+    if args.timing:
+        instrumentation.enable()
+    imported = time.perf_counter()
+    with instrumentation.timer("read_profile"):
+        consumption_data = pd.read_csv(args.profile)
+    try:
+        tariffs = load_tariffs(args.tariffs, cwns_nos=args.cwns_nos)
+    except KeyError as error:
+        parser.error("no tariff for CWNS number {} in {}".format(error, args.tariffs))
+    with instrumentation.timer("bill_facilities"):
+        bills = bill_facilities(
+            consumption_data,
+            tariffs,
+            elec_col=args.elec_col,
+            ng_col=args.ng_col,
+            units=args.units,
+            demand_window=args.demand_window,
+            rolling=args.rolling,
+            peaks=args.peaks,
+            ratchet_fraction=args.ratchet_fraction,
+            ratchet_months=args.ratchet_months,
+        )
+
+    for cwns_no in args.cwns_nos:
+        facility_costs = bills.facility(cwns_no)
+        facility_costs.loc["Total"] = facility_costs.sum()
+        print("CWNS No. {} costs ($)".format(cwns_no))
+        print(facility_costs.round(2).to_string())
+    if args.output:
+        bills.save(args.output)
+        print("Costs written to " + args.output)
+
+    if args.timing:
+        print(instrumentation.stats_frame().to_string())
+        print("imports: {:.3f} s".format(imported - start))
+        print("total: {:.3f} s".format(time.perf_counter() - start))
+    return bills
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
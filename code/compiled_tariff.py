@@ -0,0 +1,214 @@
+import numpy as np
+from billing import build_charge_array
+from charge_cache import calendar_signature
+from instrumentation import timed
+from tariff_model import ChargeTensor, Tariff
+
+SLOTS_PER_DAY = 96
+CALENDAR_SHAPE = (12, 7, SLOTS_PER_DAY)
+# cubic meters per therm
+THERM_TO_M3 = 2.83168
+# metric units per imperial unit of consumption of each utility, i.e. kW per kW
+# and m3/hr per therm/hr
+METRIC_FACTORS = {"electric": 1.0, "gas": THERM_TO_M3}
+UNITS = ["imperial", "metric"]
+
+
+def calendar_grid():
+    """Gets the month, weekday, and fractional hour of every
+    (month, weekday, 15-minute slot) cell of the calendar lookup table
+
+    Returns
+    -------
+    tuple
+        (months, weekdays, hours) arrays, each of length 12 * 7 * 96
+    """
+    months, weekdays, slots = np.indices(CALENDAR_SHAPE).reshape(3, -1)
+    return months + 1, weekdays, slots / 4
+
+
+def calendar_keys(datetimes):
+    """Maps each timestamp onto its cell of the calendar lookup table
+
+    Parameters
+    ----------
+    datetimes : Series
+        Datetime series, e.g. the 'DateTime' column of the consumption data
+
+    Returns
+    -------
+    array
+        Flat index of (month, weekday, 15-minute slot) for each timestamp
+    """
+    months = datetimes.dt.month.values - 1
+    weekdays = datetimes.dt.weekday.values
+    slots = datetimes.dt.hour.values * 4 + datetimes.dt.minute.values // 15
+    return np.ravel_multi_index((months, weekdays, slots), CALENDAR_SHAPE)
+
+
+@timed()
+def compile_tariff(rate_data, units="imperial"):
+    """Compiles billing information into calendar lookup tables so that charge
+    arrays for any date range can be gathered without re-evaluating the tariff
+
+    Parameters
+    ----------
+    rate_data : DataFrame or Tariff
+        Electric and gas billing information, or a `tariff_model.Tariff`.
+        See `billing.get_charge_array` for a description of the columns
+
+    units : {'imperial', 'metric'}
+        Units of the consumption that the tariff bills. See `convert_tariff`
+
+    Returns
+    -------
+    dict
+        Dictionary keyed by (utility, charge_type). Customer charges map to an
+        array of monthly charges. Demand and energy charges map to a structured
+        array with one row per (month, weekday, 15-minute slot) and the same
+        fields as the output of `billing.get_charge_array`
+    """
+    if units != "imperial":
+        return convert_tariff(compile_tariff(rate_data), units)
+    months, weekdays, hours = calendar_grid()
+    # the grid is hashed once for all the charge arrays of the tariff
+    grid_key = calendar_signature(months, weekdays, hours)
+    compiled = {}
+    for utility in ["electric", "gas"]:
+        for charge_type in ["customer", "demand", "energy"]:
+            if isinstance(rate_data, Tariff):
+                charges = rate_data.get_charges(charge_type, months, weekdays, hours, utility)
+                if charge_type != "customer":
+                    charges = charges.to_structured()
+                compiled[(utility, charge_type)] = charges
+                continue
+            charges = rate_data.loc[(rate_data["type"] == charge_type), :]
+            charges = charges.loc[charges["utility"] == utility, :]
+            if charge_type == "customer":
+                compiled[(utility, charge_type)] = charges["charge (imperial)"].values
+            else:
+                compiled[(utility, charge_type)] = build_charge_array(
+                    charges, charge_type, months, weekdays, hours, calendar_key=grid_key
+                )
+    return compiled
+
+
+def convert_tariff(compiled_tariff, units="metric"):
+    """Converts the rates of a compiled tariff so that it bills consumption in `units`
+
+    The charges of each utility are divided by its `METRIC_FACTORS` and the basic
+    charge limits multiplied by it, once per tariff, so that load profiles in metric
+    units (e.g. natural gas in m3/hr) are billed in place without converting them.
+    The converted rates equal the 'charge (metric)' and 'basic_charge_limit (metric)'
+    columns of the billing information, which `tariff_validation.validate_tariffs`
+    checks against the imperial columns.
+
+    Parameters
+    ----------
+    compiled_tariff : dict
+        Billing information in imperial units compiled by `compile_tariff`
+
+    units : {'imperial', 'metric'}
+        Units of the consumption that the converted tariff bills
+
+    Raises
+    ------
+    ValueError
+        When invalid `units` are entered
+
+    Returns
+    -------
+    dict
+        Compiled tariff sharing the tables of `compiled_tariff` that need no
+        conversion, i.e. every table in imperial units and customer charges
+    """
+    if units not in UNITS:
+        raise ValueError("Invalid units: " + units)
+    if units == "imperial":
+        return compiled_tariff
+    converted = dict(compiled_tariff)
+    for utility, factor in METRIC_FACTORS.items():
+        if factor == 1:
+            continue
+        for charge_type in ["demand", "energy"]:
+            table = compiled_tariff[(utility, charge_type)]
+            names = table.dtype.names
+            converted_table = np.empty(
+                table.shape, dtype=[(str(float(name) * factor), float) for name in names]
+            )
+            for name, converted_name in zip(names, converted_table.dtype.names):
+                converted_table[converted_name] = table[name] / factor
+            converted[(utility, charge_type)] = converted_table
+    return converted
+
+
+def ensure_compiled(tariff, units="imperial"):
+    """Compiles a tariff unless it is already compiled, and converts its rates to `units`
+
+    Parameters
+    ----------
+    tariff : DataFrame, Tariff, or dict
+        Billing information, a `tariff_model.Tariff`, or a tariff in imperial
+        units compiled by `compile_tariff`
+
+    units : {'imperial', 'metric'}
+        Units of the consumption that the tariff bills. See `convert_tariff`
+
+    Returns
+    -------
+    dict
+        Compiled tariff, which is `tariff` itself if it is compiled and in `units`
+    """
+    if not isinstance(tariff, dict):
+        tariff = compile_tariff(tariff)
+    return convert_tariff(tariff, units)
+
+
+def get_compiled_charge_array(
+    keys, compiled_tariff, charge_type, utility="electric", as_tensor=False, dtype=np.float64
+):
+    """Gets an array with customer, demand, or energy charges (i.e. `charge_type`)
+    specific to each day/time from a compiled tariff
+
+    Parameters
+    ----------
+    keys : array
+        Calendar keys of the consumption data from `calendar_keys`
+
+    compiled_tariff : dict
+        Billing information compiled by `compile_tariff`
+
+    charge_type : {'customer', 'demand', 'energy'}
+        Type of charge to look up
+
+    utility : {'electric', 'gas'}
+        Type of utility to look up
+
+    as_tensor : bool
+        Whether to return demand and energy charges as a `tariff_model.ChargeTensor`
+
+    dtype : dtype
+        Floating point type of the charges of a `ChargeTensor`
+
+    Raises
+    ------
+    ValueError
+        When invalid `charge_type` is entered
+
+    Returns
+    -------
+    array
+        Identical to the output of `billing.get_charge_array`. Data finer than
+        15 minutes takes the charges of the 15-minute slot containing it,
+        which is exact as long as charges start and end on quarter hours.
+        `tariff_model.ChargeTensor` with the same charges if `as_tensor` is True
+    """
+    if charge_type not in ["customer", "demand", "energy"]:
+        raise ValueError("Invalid charge_type: " + charge_type)
+    table = compiled_tariff[(utility, charge_type)]
+    if charge_type == "customer":
+        return table
+    if as_tensor:
+        # convert the small calendar table, then gather every tier in one take
+        return ChargeTensor.from_charges(table, charge_type, dtype)[keys]
+    return table[keys]
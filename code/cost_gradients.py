@@ -0,0 +1,312 @@
+import numpy as np
+from billing import DEMAND_WINDOW_MINUTES, find_tier_crossings, tier_demand_cost
+from tariff_model import tier_arrays
+
+
+class BillingPeriodModel:
+    """Demand and tiered energy cost of one utility over one billing period
+    as a function of the load vector, together with its gradient
+
+    The charge arrays are preprocessed once, so an optimizer can evaluate the cost
+    of many candidate load vectors without looking up the tariff again. Costs are
+    identical to `billing.calculate_cost` with the same demand options. A demand
+    ratchet depends on earlier billing periods, so it is not modeled. Since the cost
+    is piecewise linear in the load, the gradient is exact wherever the peak demand
+    intervals and tier crossing intervals do not change, and is a valid subgradient
+    at the demand peaks.
+
+    Parameters
+    ----------
+    demand_charges : array or TieredCharges
+        structured array of demand charges for the billing period, e.g. from
+        `compiled_tariff.get_compiled_charge_array`, or `tariff_model.TieredCharges`
+
+    energy_charges : array or TieredCharges
+        structured array of energy charges for the billing period
+
+    utility : {'electric', 'gas'}
+        Type of utility of the charges
+
+    interval_minutes : float
+        Length of each interval of the load vector in minutes
+
+    demand_window : float
+        Length in minutes of the window over which demand is averaged
+
+    rolling : bool
+        Whether demand is a rolling average over `demand_window`
+
+    peaks : int
+        Number of daily peaks averaged into the billed demand
+
+    Raises
+    ------
+    ValueError
+        When invalid `utility` is entered
+    """
+
+    def __init__(
+        self,
+        demand_charges,
+        energy_charges,
+        utility="electric",
+        interval_minutes=15,
+        demand_window=DEMAND_WINDOW_MINUTES,
+        rolling=False,
+        peaks=1,
+    ):
+        if utility == "electric":
+            self.divisor = 60 / interval_minutes
+        elif utility == "gas":
+            self.divisor = 1440 / interval_minutes
+        else:
+            raise ValueError("Invalid utility: " + utility)
+        self.n = len(energy_charges)
+
+        # demand is billed on the average of each demand window, as in
+        # `billing.average_demand_windows`
+        window = max(int(round(demand_window / interval_minutes)), 1)
+        self.rolling = rolling and window > 1
+        self.peaks = peaks
+        if self.rolling:
+            self.window_starts = np.arange(max(self.n - window + 1, 1))
+            self.window_counts = np.full(len(self.window_starts), min(window, self.n))
+            windows_per_day = 1440 / interval_minutes
+        else:
+            self.window_starts = np.arange(0, self.n, window)
+            self.window_counts = np.diff(np.append(self.window_starts, self.n))
+            windows_per_day = 1440 / interval_minutes / window
+        self.windows_per_day = max(int(round(windows_per_day)), 1)
+        demand_charges = demand_charges[self.window_starts]
+
+        limits, tier_rates = tier_arrays(demand_charges)
+        self.demand_tiers = []
+        for j, limit in enumerate(limits):
+            rates = tier_rates[j].reshape(len(demand_charges), -1)
+            next_limit = limits[j + 1] if j < len(limits) - 1 else None
+            self.demand_tiers.append(
+                {
+                    "rates": rates,
+                    "limit": limit,
+                    "next_limit": next_limit,
+                    "max_rate": rates.max(axis=0),
+                    "min_rate": rates.min(axis=0),
+                }
+            )
+
+        self.energy_limits, self.energy_rates = tier_arrays(energy_charges)
+
+    def average_demand(self, consumption):
+        """Averages `consumption` over each demand window, along the last axis"""
+        consumption = np.asarray(consumption, dtype=float)
+        if not self.rolling:
+            return np.add.reduceat(consumption, self.window_starts, axis=-1) / self.window_counts
+        running = np.zeros(consumption.shape[:-1] + (consumption.shape[-1] + 1,))
+        np.cumsum(consumption, axis=-1, out=running[..., 1:])
+        window, nwindows = self.window_counts[0], len(self.window_starts)
+        return (running[..., window:] - running[..., :nwindows]) / self.window_counts
+
+    def demand_peaks(self, averaged):
+        """Finds the demand windows billed for each column of each demand tier,
+        i.e. the peak window or the peak windows of the `peaks` highest days,
+        as in `billing.find_peak_demands`
+
+        Parameters
+        ----------
+        averaged : array
+            Demand averaged over each demand window from `average_demand`,
+            optionally with leading axes, e.g. of scenarios
+
+        Returns
+        -------
+        list
+            Window indices of shape (..., billed windows, columns) for each demand tier
+        """
+        nwindows = averaged.shape[-1]
+        all_peaks = []
+        for tier in self.demand_tiers:
+            charged = averaged[..., :, None] * tier["rates"]
+            if self.peaks <= 1:
+                all_peaks.append(np.argmax(charged, axis=-2)[..., None, :])
+                continue
+            # pad to whole days so that each day's peak is an argmax along one axis
+            ndays = -(-nwindows // self.windows_per_day)
+            padded = np.full(
+                charged.shape[:-2] + (ndays * self.windows_per_day, charged.shape[-1]), -np.inf
+            )
+            padded[..., :nwindows, :] = charged
+            days = padded.reshape(charged.shape[:-2] + (ndays, self.windows_per_day, -1))
+            daily_peaks = np.argmax(days, axis=-2)
+            daily_peaks += np.arange(ndays)[:, None] * self.windows_per_day
+            if ndays > self.peaks:
+                daily_charged = np.take_along_axis(charged, daily_peaks, axis=-2)
+                top_days = np.argpartition(-daily_charged, self.peaks - 1, axis=-2)
+                top_days = top_days[..., : self.peaks, :]
+                daily_peaks = np.take_along_axis(daily_peaks, top_days, axis=-2)
+            all_peaks.append(daily_peaks)
+        return all_peaks
+
+    @staticmethod
+    def billed_demand(averaged, tier_peaks):
+        """Averages the demand of the billed windows of each column of a demand
+        tier from `demand_peaks`
+        """
+        return np.take_along_axis(averaged[..., :, None], tier_peaks, axis=-2).mean(axis=-2)
+
+    def demand_cost_at_peaks(self, averaged, peaks, gradient=None):
+        """Calculates the demand cost given the billed windows of each column
+
+        Parameters
+        ----------
+        averaged : array
+            Demand averaged over each demand window from `average_demand`
+
+        peaks : list
+            Billed window indices of each demand tier from `demand_peaks`
+
+        gradient : array
+            If given, the gradient with respect to `averaged` is added to it
+
+        Returns
+        -------
+        float
+            Demand cost in USD
+        """
+        cost = 0
+        for tier, tier_peaks in zip(self.demand_tiers, peaks):
+            demand = self.billed_demand(averaged, tier_peaks)
+            costs, slope = self.tier_cost(tier, demand, return_slope=True)
+            cost += np.sum(costs)
+            if gradient is not None:
+                # the billed demand is the mean of the billed windows. The slopes are
+                # repeated for each window, since `np.add.at` mishandles broadcast values
+                slopes = np.broadcast_to(slope / len(tier_peaks), tier_peaks.shape)
+                np.add.at(gradient, tier_peaks.ravel(), slopes.ravel())
+        return cost
+
+    @staticmethod
+    def tier_cost(tier, demand, return_slope=False):
+        """Calculates the cost of each column of a demand tier from `demand_tiers`
+        at its billed demand, with the columns along the last axis of `demand`.
+        See `billing.tier_demand_cost`
+        """
+        return tier_demand_cost(
+            demand,
+            tier["limit"],
+            tier["next_limit"],
+            tier["max_rate"],
+            tier["min_rate"],
+            return_slope=return_slope,
+        )
+
+    def demand_cost_and_gradient(self, consumption):
+        """Calculates the demand cost and its gradient with respect to `consumption`
+
+        Returns
+        -------
+        tuple
+            (cost, gradient) where `gradient` has the same length as `consumption`
+        """
+        averaged = self.average_demand(consumption)
+        gradient = np.zeros(len(averaged))
+        cost = self.demand_cost_at_peaks(averaged, self.demand_peaks(averaged), gradient)
+        # spread the gradient of each window evenly over its intervals
+        per_interval = gradient / self.window_counts
+        if not self.rolling:
+            return cost, np.repeat(per_interval, self.window_counts)
+        steps = np.zeros(self.n + 1)
+        steps[self.window_starts] += per_interval
+        steps[self.window_starts + self.window_counts] -= per_interval
+        return cost, np.cumsum(steps[:-1])
+
+    def energy_cost_and_gradient(self, consumption):
+        """Calculates the tiered energy cost and its gradient with respect to `consumption`
+
+        Returns
+        -------
+        tuple
+            (cost, gradient) where `gradient` has the same length as `consumption`
+        """
+        consumption = np.asarray(consumption, dtype=float)
+        energy = np.cumsum(consumption)
+        tiers = find_tier_crossings(self.energy_limits, energy / self.divisor, consumption)
+
+        cost = 0
+        gradient = np.zeros(self.n)
+        for j, (start_idx, i) in enumerate(tiers):
+            rates = self.energy_rates[j]
+            if i is None:
+                cost += np.sum((consumption[start_idx:] / self.divisor) * rates[start_idx:])
+                gradient[start_idx:] += rates[start_idx:] / self.divisor
+            else:
+                limit = self.energy_limits[j + 1]
+                cost += np.sum((consumption[start_idx:i] / self.divisor) * rates[start_idx:i])
+                cost += (limit - ((energy[i] - consumption[i]) / self.divisor)) * rates[i]
+                gradient[start_idx:i] += rates[start_idx:i] / self.divisor
+                # the crossing interval is billed up to the limit, which shrinks
+                # as the energy consumed before it grows
+                gradient[:i] -= rates[i] / self.divisor
+        return cost, gradient
+
+    def cost_and_gradient(self, consumption):
+        """Calculates the total demand and energy cost and its gradient
+        with respect to `consumption`
+
+        Parameters
+        ----------
+        consumption : array
+            Electrical or gas usage data for the billing period
+
+        Returns
+        -------
+        tuple
+            (cost, gradient) where `gradient` has the same length as `consumption`
+        """
+        demand_cost, demand_gradient = self.demand_cost_and_gradient(consumption)
+        energy_cost, energy_gradient = self.energy_cost_and_gradient(consumption)
+        return demand_cost + energy_cost, demand_gradient + energy_gradient
+
+
+def period_models(
+    compiled_tariff, keys, periods, utility="electric", interval_minutes=15, **demand_options
+):
+    """Builds the `BillingPeriodModel` of every billing period of a load profile
+
+    Parameters
+    ----------
+    compiled_tariff : dict
+        Billing information compiled by `compiled_tariff.compile_tariff`
+
+    keys : array
+        Calendar keys of the load profile from `calendar_index.CalendarIndex`
+
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    utility : {'electric', 'gas'}
+        Type of utility of the charges
+
+    interval_minutes : float
+        Length of each interval of the load profile in minutes
+
+    demand_options : dict
+        Keyword arguments `demand_window`, `rolling`, and `peaks` of `BillingPeriodModel`
+
+    Returns
+    -------
+    list
+        Model of each billing period in the order of `periods`
+    """
+    # gather the charges for the whole profile once, then model views of each period
+    demand_charges = compiled_tariff[(utility, "demand")][keys]
+    energy_charges = compiled_tariff[(utility, "energy")][keys]
+    return [
+        BillingPeriodModel(
+            demand_charges[start:end],
+            energy_charges[start:end],
+            utility=utility,
+            interval_minutes=interval_minutes,
+            **demand_options,
+        )
+        for start, end in zip(periods["start"], periods["end"])
+    ]
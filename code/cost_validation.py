@@ -0,0 +1,562 @@
+import os
+import pytest
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import USFederalHolidayCalendar
+from tariff_cache import load_tariffs
+from billing import build_charge_array, calculate_cost, find_tier_crossings, get_charge_array
+from batch_billing import (
+    CHARGE_TYPES,
+    calculate_cost_array,
+    calculate_costs,
+    calculate_facility_costs,
+)
+from tariff_dedup import TariffRegistry
+from calendar_index import get_calendar_index
+from catalog import FacilityCatalog
+from charge_cache import cache_disabled, configure_cache, get_default_cache, tariff_signature
+from compiled_tariff import (
+    CALENDAR_SHAPE,
+    THERM_TO_M3,
+    calendar_grid,
+    compile_tariff,
+    get_compiled_charge_array,
+)
+from cost_gradients import period_models
+from tariff_model import ChargeTensor, Tariff, tier_arrays
+from ensemble_billing import calculate_ensemble_costs
+from incremental_billing import IncrementalBill
+from load_scaling import calculate_scaled_costs
+from online_billing import OnlineBill
+from parallel_billing import calculate_costs_parallel
+from streaming_billing import calculate_costs_streaming
+
+# change to repo parent directory and suppress superfluous openpyxl warnings
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
+
+
+def reference_energy_cost(charges, consumption_data, divisor):
+    """Interval-by-interval tiered energy cost, as originally implemented in
+    `calculate_cost`, used as the reference for the vectorized version
+    """
+    names = charges.dtype.names
+    cost = 0
+    energy = 0
+    start_idx = 0
+    for j in range(len(names)):
+        name = names[j]
+        if j == len(names) - 1:
+            cost += np.sum(
+                (consumption_data.iloc[start_idx:] / divisor) * charges[name][start_idx:]
+            )
+            break
+        else:
+            next_name = names[j + 1]
+
+        for i in range(start_idx, len(charges[name])):
+            energy += consumption_data[i + consumption_data.index[0]]
+            if energy / divisor > float(next_name):
+                cost += np.sum(
+                    (
+                        consumption_data.loc[
+                            start_idx
+                            + consumption_data.index[0] : i
+                            - 1
+                            + consumption_data.index[0]
+                        ]
+                        / divisor
+                    )
+                    * charges[name][start_idx:i]
+                )
+                cost += (
+                    float(next_name)
+                    - (
+                        (energy - consumption_data[i + consumption_data.index[0]])
+                        / divisor
+                    )
+                ) * charges[name][i]
+                start_idx = i + 1
+                break
+        if i == len(charges[name]) - 1:
+            cost += np.sum(
+                (
+                    consumption_data.loc[start_idx + consumption_data.index[0] :]
+                    / divisor
+                )
+                * charges[name][start_idx:]
+            )
+            break
+    return cost
+
+
+def reference_billed_demands(charges, consumption, window, rolling, peaks, windows_per_day):
+    """Window-by-window billed demand of every demand charge of a billing period,
+    used as the reference for `billing.calculate_peak_demands`
+
+    Returns
+    -------
+    list
+        (limit, rates, demands) of each tier, with the charges of each window
+        and the billed demand of each column
+    """
+    consumption = [float(value) for value in consumption]
+    if rolling:
+        starts = list(range(max(len(consumption) - window + 1, 1)))
+    else:
+        starts = list(range(0, len(consumption), window))
+    demand = []
+    for start in starts:
+        values = consumption[start : start + window]
+        demand.append(sum(values) / len(values))
+
+    tiers = []
+    for name in charges.dtype.names:
+        rates = charges[name][starts].reshape(len(starts), -1)
+        billed = []
+        for i in range(rates.shape[1]):
+            charged = [float(rate) * d for rate, d in zip(rates[:, i], demand)]
+            if peaks <= 1:
+                billed.append(demand[charged.index(max(charged))])
+                continue
+            # the first window with the highest charge of each day, then the
+            # days with the highest charges, keeping the earlier of tied days
+            days = []
+            for day in range(0, len(starts), windows_per_day):
+                day_charged = charged[day : day + windows_per_day]
+                days.append(day + day_charged.index(max(day_charged)))
+            days.sort(key=lambda w: -charged[w])
+            billed.append(sum(demand[w] for w in days[:peaks]) / len(days[:peaks]))
+        tiers.append((float(name), rates, billed))
+    return tiers
+
+
+def reference_demand_costs(
+    charges,
+    consumption,
+    periods,
+    interval_minutes=15,
+    demand_window=15,
+    rolling=False,
+    peaks=1,
+    ratchet_fraction=0,
+    ratchet_months=11,
+):
+    """Demand cost of every billing period billed window by window, with the
+    billed demand of each charge at least `ratchet_fraction` of its highest billed
+    demand in the preceding `ratchet_months` months, used as the reference for
+    `batch_billing.calculate_facility_costs`
+    """
+    window = max(int(round(demand_window / interval_minutes)), 1)
+    windows_per_day = max(int(round(1440 / interval_minutes / (1 if rolling else window))), 1)
+    billed = [
+        reference_billed_demands(
+            charges[start:end], consumption[start:end], window, rolling, peaks, windows_per_day
+        )
+        for start, end in zip(periods["start"], periods["end"])
+    ]
+    period_ids = list(periods["year"] * 12 + periods["month"])
+
+    costs = []
+    for p, tiers in enumerate(billed):
+        for j, (limit, rates, demands) in enumerate(tiers):
+            next_limit = tiers[j + 1][0] if j < len(tiers) - 1 else None
+            for i, demand in enumerate(demands):
+                for q in range(p):
+                    trailing = period_ids[p] - ratchet_months <= period_ids[q] < period_ids[p]
+                    # only charges in effect during a month count towards the ratchet
+                    if ratchet_fraction and trailing and np.any(billed[q][j][1][:, i] != 0):
+                        demand = max(demand, ratchet_fraction * billed[q][j][2][i])
+                if next_limit is not None and demand > next_limit:
+                    cost = max((next_limit - limit) * rate for rate in rates[:, i])
+                else:
+                    cost = max(max((demand - limit) * rate for rate in rates[:, i]), 0)
+                costs.append((p, cost))
+    return np.bincount([p for p, _ in costs], [cost for _, cost in costs], len(billed))
+
+
+def linear_pieces(model, consumption):
+    """Gets the peak demand windows and tier crossings of `consumption`, between
+    changes of which the cost of a `BillingPeriodModel` is linear
+    """
+    averaged = model.average_demand(consumption)
+    peaks = [tuple(tier_peaks.ravel()) for tier_peaks in model.demand_peaks(averaged)]
+    energy = np.cumsum(consumption) / model.divisor
+    return peaks, find_tier_crossings(model.energy_limits, energy, consumption)
+
+
+energy_df = pd.read_csv("data/synthetic_energy_data.csv")
+calendar = get_calendar_index(energy_df["DateTime"])
+metadata = pd.read_csv("data/metadata.csv")
+tariffs = load_tariffs("data/WWTP_Billing.xlsx")
+columns = {"electric": ("grid_to_plant_kW", 4), "gas": ("natural_gas_therm_per_hr", 96)}
+# scale the sample profile so that every tier of every tariff is crossed,
+# and offset it so that the cumulative energy is not monotonic
+scenarios = [(1, 0), (0.01, 0), (100, 0), (1, -400)]
+
+for cwns_no in metadata["CWNS_No"]:
+    compiled_tariff = compile_tariff(tariffs[cwns_no])
+    for month in range(1, 13):
+        period = calendar.period_slice(2021, month)
+        for utility, (col, divisor) in columns.items():
+            charges = get_compiled_charge_array(
+                calendar.keys[period], compiled_tariff, "energy", utility=utility
+            )
+            for scale, offset in scenarios:
+                consumption = energy_df[col].iloc[period] * scale + offset
+                # Check that vectorized tiered energy cost matches the reference loop
+                assert calculate_cost(
+                    charges, consumption, charge_type="energy", utility=utility
+                ) == pytest.approx(
+                    reference_energy_cost(charges, consumption, divisor), rel=1e-9, abs=1e-6
+                )
+
+compiled_tariffs = {
+    cwns_no: compile_tariff(tariffs[cwns_no]) for cwns_no in metadata["CWNS_No"]
+}
+
+# Check that the billing period model reproduces `calculate_cost`, and that its
+# gradient matches forward differences at random intervals and at the demand
+# peaks wherever the step does not move a demand peak or a tier crossing, with
+# the default demand options for every facility and others for a sample
+rng = np.random.default_rng(0)
+step = 0.01
+model_scenarios = [({}, cwns_no) for cwns_no in compiled_tariffs] + [
+    (demand_options, cwns_no)
+    for demand_options in [
+        {"demand_window": 30, "rolling": True, "peaks": 3},
+        {"demand_window": 60, "peaks": 2},
+    ]
+    for cwns_no in list(compiled_tariffs)[::10]
+]
+for demand_options, cwns_no in model_scenarios:
+    compiled_tariff = compiled_tariffs[cwns_no]
+    for utility, (col, _) in columns.items():
+        models = period_models(
+            compiled_tariff, calendar.keys, calendar.periods, utility, **demand_options
+        )
+        for model, start, end in zip(models, calendar.periods["start"], calendar.periods["end"]):
+            keys = calendar.keys[start:end]
+            for scale in [1, 100]:
+                consumption = energy_df[col].to_numpy(dtype=float)[start:end] * scale
+                cost, gradient = model.cost_and_gradient(consumption)
+                assert cost == pytest.approx(
+                    sum(
+                        calculate_cost(
+                            compiled_tariff[(utility, charge_type)][keys],
+                            consumption,
+                            charge_type=charge_type,
+                            utility=utility,
+                            **demand_options,
+                        )
+                        for charge_type in ["demand", "energy"]
+                    ),
+                    rel=1e-9,
+                    abs=1e-6,
+                )
+                peaks = model.demand_peaks(model.average_demand(consumption))
+                intervals = np.concatenate(
+                    [rng.choice(len(consumption), 3, replace=False)]
+                    + [model.window_starts[tier_peaks.ravel()] for tier_peaks in peaks]
+                )
+                for i in intervals:
+                    stepped = consumption.copy()
+                    stepped[i] += step
+                    if linear_pieces(model, stepped) != linear_pieces(model, consumption):
+                        continue
+                    assert (model.cost_and_gradient(stepped)[0] - cost) / step == pytest.approx(
+                        gradient[i], rel=1e-6, abs=1e-5
+                    )
+
+# Check that a typed tariff looks up the same charges as its billing information
+datetime_df = energy_df.assign(DateTime=pd.to_datetime(energy_df["DateTime"]))
+for cwns_no, rate_data in tariffs.items():
+    tariff = Tariff.from_frame(rate_data)
+    for utility in columns:
+        assert np.array_equal(
+            get_charge_array(datetime_df, tariff, "customer", utility),
+            get_charge_array(datetime_df, rate_data, "customer", utility),
+        )
+        for charge_type in ["demand", "energy"]:
+            assert np.array_equal(
+                get_charge_array(datetime_df, tariff, charge_type, utility).to_structured(),
+                get_charge_array(datetime_df, rate_data, charge_type, utility),
+            )
+
+# Check that charge tensors hold the same charges as the structured arrays, and
+# that whole tensors round trip through Arrow without copying when pyarrow is installed
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+period = calendar.period_slice(2021, 6)
+for cwns_no, compiled_tariff in compiled_tariffs.items():
+    for utility in columns:
+        for charge_type in ["demand", "energy"]:
+            structured = get_charge_array(datetime_df, tariffs[cwns_no], charge_type, utility)
+            tensor = get_compiled_charge_array(
+                calendar.keys, compiled_tariff, charge_type, utility, as_tensor=True
+            )
+            assert np.array_equal(tensor.to_structured(), structured)
+            assert np.array_equal(
+                get_charge_array(
+                    datetime_df, tariffs[cwns_no], charge_type, utility, as_tensor=True
+                ).to_structured(),
+                structured,
+            )
+            if pyarrow is None:
+                continue
+            # a slice of a billing period is copied on export, the whole tensor is not
+            for exported in [tensor, tensor[period]]:
+                imported = ChargeTensor.from_arrow(exported.to_arrow())
+                assert imported.charge_type == charge_type
+                assert tier_arrays(imported)[0] == tier_arrays(exported)[0]
+                assert np.array_equal(imported.values, exported.values)
+            imported = ChargeTensor.from_arrow(tensor.to_arrow())
+            assert np.shares_memory(imported.values, tensor.values)
+
+# Check that updating slices of the load profile in place matches re-billing the
+# edited profile, including edits that cross tiers and export to the grid
+for cwns_no, compiled_tariff in compiled_tariffs.items():
+    bill = IncrementalBill(compiled_tariff, energy_df)
+    edited_df = energy_df.copy()
+    for edit in range(4):
+        start = int(rng.integers(0, len(edited_df)))
+        end = min(start + int(rng.integers(1, 3000)), len(edited_df))
+        electric = edited_df["grid_to_plant_kW"].values[start:end] * rng.choice([0.01, 1, 100])
+        if edit == 3:
+            electric = electric - 400
+        edited_df.loc[start : end - 1, "grid_to_plant_kW"] = electric
+        # the second edit leaves the gas profile unchanged
+        gas = None
+        if edit != 1:
+            gas = edited_df["natural_gas_therm_per_hr"].values[start:end]
+            gas = gas * rng.choice([0.01, 1, 100])
+            edited_df.loc[start : end - 1, "natural_gas_therm_per_hr"] = gas
+        bill.update(start, electric=electric, gas=gas)
+        assert bill.costs == pytest.approx(
+            calculate_cost_array(edited_df, {cwns_no: compiled_tariff})[0][0], rel=1e-9, abs=1e-6
+        )
+
+# Check that the online bill of readings accrued one at a time and then in
+# micro-batches closes every month at the cost of billing the whole profile
+datetimes = pd.to_datetime(energy_df["DateTime"]).values
+electric = energy_df["grid_to_plant_kW"].values
+gas = energy_df["natural_gas_therm_per_hr"].values
+for cwns_no, compiled_tariff in compiled_tariffs.items():
+    bill = OnlineBill(compiled_tariff)
+    for i in range(500):
+        bill.add(datetimes[i], electric[i], gas[i])
+    for start in range(500, len(energy_df), 1000):
+        end = start + 1000
+        bill.add_batch(datetimes[start:end], electric[start:end], gas[start:end])
+    bill.close()
+    assert bill.history_frame()[CHARGE_TYPES].values == pytest.approx(
+        calculate_cost_array(energy_df, {cwns_no: compiled_tariff})[0][0], rel=1e-9, abs=1e-6
+    )
+
+# Check that the closed-form cost curves over load scale factors match billing
+# each scaled profile, with scales from no load to well past the last tier
+electric_scales = np.array([0, 0.01, 0.5, 1, 3, 100])
+gas_scales = np.array([100, 3, 1, 0.5, 0.01, 0])
+scaled_costs, _ = calculate_scaled_costs(energy_df, compiled_tariffs, electric_scales, gas_scales)
+for s, (electric_scale, gas_scale) in enumerate(zip(electric_scales, gas_scales)):
+    scaled_df = energy_df.assign(
+        grid_to_plant_kW=energy_df["grid_to_plant_kW"] * electric_scale,
+        natural_gas_therm_per_hr=energy_df["natural_gas_therm_per_hr"] * gas_scale,
+    )
+    assert scaled_costs[:, s] == pytest.approx(
+        calculate_cost_array(scaled_df, compiled_tariffs)[0], rel=1e-9, abs=1e-6
+    )
+
+# Check rolling demand windows, averages of daily peaks and demand ratchets
+# against billing every demand window of a sample of facilities one by one. The
+# sample profile repeats from day to day and month to month, so it is varied by
+# a random daily factor and lowered in the second half of the year, which makes
+# the number of peaks and the ratchet change the bill
+timestamps = pd.to_datetime(energy_df["DateTime"])
+days = (timestamps - timestamps.iloc[0]).dt.days.values
+factor = rng.uniform(0.5, 1.5, days.max() + 1)[days]
+factor *= np.where(timestamps.dt.month.values <= 6, 1, 0.3)
+varied_df = energy_df.assign(
+    grid_to_plant_kW=energy_df["grid_to_plant_kW"] * factor,
+    natural_gas_therm_per_hr=energy_df["natural_gas_therm_per_hr"] * factor,
+)
+reference_scenarios = [
+    {"demand_window": 30, "rolling": True, "peaks": 3, "ratchet_fraction": 0.8},
+    {"demand_window": 60, "rolling": False, "peaks": 2, "ratchet_fraction": 0.8},
+    {"demand_window": 60, "rolling": True, "peaks": 1},
+]
+for demand_options in reference_scenarios:
+    for cwns_no in list(compiled_tariffs)[::10]:
+        compiled_tariff = compiled_tariffs[cwns_no]
+        costs = calculate_cost_array(varied_df, {cwns_no: compiled_tariff}, **demand_options)[0][0]
+        for utility, (col, _) in columns.items():
+            assert costs[:, CHARGE_TYPES.index(utility + "_demand")] == pytest.approx(
+                reference_demand_costs(
+                    compiled_tariff[(utility, "demand")][calendar.keys],
+                    varied_df[col].to_numpy(dtype=float),
+                    calendar.periods,
+                    **demand_options,
+                ),
+                rel=1e-9,
+                abs=1e-6,
+            )
+
+# Check that batched ensemble billing matches billing each scenario on its own,
+# including scenarios with export to the grid
+electric = energy_df["grid_to_plant_kW"].to_numpy() * np.array([[1], [0.01], [100], [1]])
+gas = energy_df["natural_gas_therm_per_hr"].to_numpy() * np.array([[1], [100], [0.01], [1]])
+electric[3] -= 400
+ensemble_costs, _ = calculate_ensemble_costs(
+    energy_df["DateTime"], compiled_tariffs, electric, gas, chunksize=3
+)
+for s in range(electric.shape[0]):
+    scenario_df = energy_df.assign(grid_to_plant_kW=electric[s], natural_gas_therm_per_hr=gas[s])
+    assert ensemble_costs[:, s] == pytest.approx(
+        calculate_cost_array(scenario_df, compiled_tariffs)[0], rel=1e-9, abs=1e-6
+    )
+
+# Check that ensemble billing matches batch billing with the demand window, peak,
+# and ratchet options, on scenarios of the varied profile
+electric = varied_df["grid_to_plant_kW"].to_numpy() * np.array([[1], [0.01], [100]])
+gas = varied_df["natural_gas_therm_per_hr"].to_numpy() * np.array([[1], [100], [0.01]])
+sample_tariffs = {cwns_no: compiled_tariffs[cwns_no] for cwns_no in list(compiled_tariffs)[::10]}
+for demand_options in reference_scenarios:
+    ensemble_costs, _ = calculate_ensemble_costs(
+        varied_df["DateTime"], sample_tariffs, electric, gas, chunksize=2, **demand_options
+    )
+    for s in range(electric.shape[0]):
+        scenario_df = varied_df.assign(
+            grid_to_plant_kW=electric[s], natural_gas_therm_per_hr=gas[s]
+        )
+        assert ensemble_costs[:, s] == pytest.approx(
+            calculate_cost_array(scenario_df, sample_tariffs, **demand_options)[0],
+            rel=1e-9,
+            abs=1e-6,
+        )
+
+# Check that federal holidays are billed at the charges of a Sunday, which changes
+# the bill of facilities with weekday time-of-use charges
+datetimes = pd.to_datetime(energy_df["DateTime"])
+on_holiday = datetimes.dt.normalize().isin(
+    USFederalHolidayCalendar().holidays(datetimes.min(), datetimes.max())
+).values
+assert on_holiday.any()
+holiday_keys = np.ravel_multi_index(
+    (
+        datetimes.dt.month.values - 1,
+        np.where(on_holiday, 6, datetimes.dt.weekday.values),
+        datetimes.dt.hour.values * 4 + datetimes.dt.minute.values // 15,
+    ),
+    CALENDAR_SHAPE,
+)
+holiday_costs, _ = calculate_cost_array(energy_df, compiled_tariffs, holidays="federal")
+for f, compiled_tariff in enumerate(compiled_tariffs.values()):
+    assert holiday_costs[f] == pytest.approx(
+        calculate_facility_costs(
+            compiled_tariff,
+            holiday_keys,
+            energy_df["grid_to_plant_kW"].to_numpy(dtype=float),
+            energy_df["natural_gas_therm_per_hr"].to_numpy(dtype=float),
+            calendar.periods,
+        ),
+        rel=1e-9,
+        abs=1e-6,
+    )
+assert not np.array_equal(holiday_costs, calculate_cost_array(energy_df, compiled_tariffs)[0])
+
+# Check that a profile with natural gas in m3/hr billed by metric tariffs
+# matches the imperial bill of every facility
+imperial_costs = calculate_costs(energy_df, compiled_tariffs)
+metric_df = energy_df.assign(
+    natural_gas_m3_per_hr=energy_df["natural_gas_therm_per_hr"] * THERM_TO_M3
+)
+metric_costs = calculate_costs(
+    metric_df, compiled_tariffs, ng_col="natural_gas_m3_per_hr", units="metric"
+)
+assert metric_costs["cost"].values == pytest.approx(
+    imperial_costs["cost"].values, rel=1e-9, abs=1e-6
+)
+
+# Check that billing each unique rate structure once matches billing every facility,
+# with and without demand options
+registry = TariffRegistry(compiled_tariffs)
+demand_scenarios = [
+    {},
+    {"demand_window": 30, "rolling": True, "peaks": 3, "ratchet_fraction": 0.8},
+]
+for demand_options in demand_scenarios:
+    assert np.array_equal(
+        registry.calculate_costs(energy_df, **demand_options).to_tidy()["cost"].values,
+        calculate_costs(energy_df, compiled_tariffs, **demand_options)["cost"].values,
+    )
+
+# Check that catalog queries return CWNS numbers as `int` like the tariff keys,
+# and that billing the matching facilities matches billing them directly
+catalog = FacilityCatalog(metadata, tariffs)
+temporality = catalog.values("demand_temporality")[0]
+cwns_nos = catalog.query(demand_temporality=temporality)
+assert cwns_nos and all(type(cwns_no) is int for cwns_no in cwns_nos)
+assert catalog.query() == [int(cwns_no) for cwns_no in metadata["CWNS_No"]]
+matching_tariffs = {cwns_no: compiled_tariffs[cwns_no] for cwns_no in cwns_nos}
+assert np.array_equal(
+    catalog.bill(energy_df, demand_temporality=temporality).to_tidy()["cost"].values,
+    calculate_costs(energy_df, matching_tariffs)["cost"].values,
+)
+
+# Check that billing one billing period at a time matches billing the whole
+# profile, with and without demand options
+for demand_options in demand_scenarios:
+    assert calculate_costs_streaming(
+        "data/synthetic_energy_data.csv", compiled_tariffs, chunksize=5000, **demand_options
+    ).equals(calculate_costs(energy_df, compiled_tariffs, **demand_options))
+
+# Check that cached charge arrays equal uncached ones on a memory hit, after
+# least recently used arrays are evicted, when they are read back from the spill
+# directory, and that a disabled cache is bypassed
+months, weekdays, hours = calendar_grid()
+unique_rows = {}
+for rate_data in tariffs.values():
+    for charge_type in ["demand", "energy"]:
+        rows = rate_data.loc[
+            (rate_data["type"] == charge_type) & (rate_data["utility"] == "electric"), :
+        ]
+        unique_rows.setdefault((charge_type, tariff_signature(rows)), (rows, charge_type))
+sample_rows = list(unique_rows.values())[:4]
+with cache_disabled():
+    assert not get_default_cache().enabled
+    expected = [
+        build_charge_array(rows, charge_type, months, weekdays, hours)
+        for rows, charge_type in sample_rows
+    ]
+    assert get_default_cache().info()["misses"] == 0
+with tempfile.TemporaryDirectory() as spill_dir:
+    cache = configure_cache(maxsize=2, spill_dir=spill_dir)
+    for (rows, charge_type), array in zip(sample_rows, expected):
+        assert np.array_equal(build_charge_array(rows, charge_type, months, weekdays, hours), array)
+    assert cache.info()["misses"] == len(sample_rows) and len(cache) == 2
+    assert len(os.listdir(spill_dir)) == len(sample_rows) - 2
+    rows, charge_type = sample_rows[-1]
+    cached = build_charge_array(rows, charge_type, months, weekdays, hours)
+    assert cache.hits == 1 and np.array_equal(cached, expected[-1]) and not cached.flags.writeable
+    rows, charge_type = sample_rows[0]
+    reloaded = build_charge_array(rows, charge_type, months, weekdays, hours)
+    assert np.array_equal(reloaded, expected[0])
+    assert cache.disk_hits == 1 and cache.misses == len(sample_rows)
+    with cache_disabled():
+        bypassed = build_charge_array(rows, charge_type, months, weekdays, hours)
+        assert np.array_equal(bypassed, expected[0]) and bypassed.flags.writeable
+    assert cache.info()["misses"] == len(sample_rows) and get_default_cache() is cache
+configure_cache()
+
+if __name__ == "__main__":
+    # Check that billing across worker processes matches serial billing, with and
+    # without demand options, and that no facilities bill to an empty table
+    for demand_options in demand_scenarios:
+        assert calculate_costs_parallel(
+            energy_df, compiled_tariffs, max_workers=2, **demand_options
+        ).equals(calculate_costs(energy_df, compiled_tariffs, **demand_options))
+    assert calculate_costs_parallel(energy_df, {}).equals(calculate_costs(energy_df, {}))
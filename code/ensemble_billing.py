@@ -0,0 +1,421 @@
+import numpy as np
+import pandas as pd
+from billing import DEMAND_WINDOW_MINUTES, calculate_tiered_energy_cost, ratchet_demands
+from batch_billing import CHARGE_TYPES
+from calendar_index import get_calendar_index
+from compiled_tariff import ensure_compiled
+from cost_gradients import period_models
+from tariff_model import TieredCharges
+
+
+def load_profiles(profiles):
+    """Opens a 2-D array of load profiles without reading it into memory
+
+    Parameters
+    ----------
+    profiles : str or array
+        Path to a `.npy` file of shape (scenarios, intervals), or an array
+
+    Returns
+    -------
+    array
+        Memory-mapped array if `profiles` is a path, otherwise `profiles`
+    """
+    if isinstance(profiles, str):
+        return np.load(profiles, mmap_mode="r")
+    return profiles
+
+
+def ensemble_billed_demands(model, consumption):
+    """Finds the billed demand of each column of each demand tier for many load
+    profiles of one billing period
+
+    Parameters
+    ----------
+    model : BillingPeriodModel
+        Charges and demand options of the billing period from
+        `cost_gradients.BillingPeriodModel`
+
+    consumption : array
+        Electrical or gas usage data of shape (scenarios, intervals)
+
+    Returns
+    -------
+    list
+        Billed demand of shape (scenarios, columns) for each demand tier,
+        identical to `billing.calculate_peak_demands`
+    """
+    if len(model.window_starts) == consumption.shape[1]:
+        averaged = consumption
+    else:
+        averaged = model.average_demand(consumption)
+    if model.peaks > 1:
+        return [
+            model.billed_demand(averaged, tier_peaks)
+            for tier_peaks in model.demand_peaks(averaged)
+        ]
+    demands = []
+    for tier in model.demand_tiers:
+        # peak window of every (scenario, column) in one pass over the windows,
+        # with windows along the last axis so that the search is contiguous
+        peaks = np.argmax(averaged[:, None, :] * tier["rates"].T[None, :, :], axis=2)
+        demands.append(np.take_along_axis(averaged, peaks, axis=1))
+    return demands
+
+
+def ensemble_demand_cost(model, demands, minimum=None):
+    """Calculates the demand cost of many load profiles of one billing period
+
+    Parameters
+    ----------
+    model : BillingPeriodModel
+        Charges of the billing period from `cost_gradients.BillingPeriodModel`
+
+    demands : list
+        Billed demands of each demand tier from `ensemble_billed_demands`
+
+    minimum : list
+        Lowest billed demand of shape (scenarios, columns) for each demand tier,
+        e.g. a ratchet from `ensemble_ratchet`. Defaults to no minimum
+
+    Returns
+    -------
+    array
+        Demand cost in USD of each scenario, identical to `billing.calculate_cost`
+    """
+    if minimum is not None:
+        demands = [np.maximum(demand, m) for demand, m in zip(demands, minimum)]
+    cost = 0
+    for tier, demand in zip(model.demand_tiers, demands):
+        cost += model.tier_cost(tier, demand).sum(axis=1)
+    return cost
+
+
+def ensemble_ratchet(models, demands, periods, fraction=0.8, months=11):
+    """Applies a demand ratchet to the billed demands of many load profiles,
+    as `batch_billing.ratcheted_demand_costs` does for one load profile
+
+    Parameters
+    ----------
+    models : list
+        `cost_gradients.BillingPeriodModel` of every billing period
+
+    demands : list
+        Billed demands of every billing period from `ensemble_billed_demands`
+
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    fraction : float
+        Fraction of the trailing peak demand that is billed at minimum
+
+    months : int
+        Number of preceding months over which the peak is taken
+
+    Returns
+    -------
+    list
+        Lowest billed demand of shape (scenarios, columns) for each demand tier
+        of every billing period
+    """
+    # only the charges in effect during a billing period count towards the ratchet
+    peak_cache = np.stack(
+        [
+            np.concatenate(
+                [
+                    np.where(np.any(tier["rates"] != 0, axis=0), demand, 0)
+                    for tier, demand in zip(model.demand_tiers, period_demands)
+                ],
+                axis=1,
+            )
+            for model, period_demands in zip(models, demands)
+        ]
+    )
+    nperiods, nscenarios, ncolumns = peak_cache.shape
+    period_ids = periods["year"].values * 12 + periods["month"].values
+    minimum = ratchet_demands(
+        peak_cache.reshape(nperiods, -1), period_ids, fraction, months
+    ).reshape(nperiods, nscenarios, ncolumns)
+    # split the minimum of each billing period back into tiers
+    splits = np.cumsum([demand.shape[1] for demand in demands[0]])[:-1]
+    return [np.split(period_minimum, splits, axis=1) for period_minimum in minimum]
+
+
+def ensemble_energy_cost(model, consumption):
+    """Calculates the tiered energy cost of many load profiles of one billing period
+
+    Tier crossings are found for all scenarios at once from the cumulative energy,
+    and each tier is billed from running sums of consumption * rate. Scenarios
+    with export to the grid (i.e., negative consumption) do not have sorted
+    cumulative energy and are billed one at a time.
+
+    Parameters
+    ----------
+    model : BillingPeriodModel
+        Charges of the billing period from `cost_gradients.BillingPeriodModel`
+
+    consumption : array
+        Electrical or gas usage data of shape (scenarios, intervals)
+
+    Returns
+    -------
+    array
+        Tiered energy cost in USD of each scenario, identical to
+        `billing.calculate_cost` up to floating point rounding
+    """
+    nscenarios, n = consumption.shape
+    limits = model.energy_limits
+    if len(limits) == 1:
+        return consumption @ model.energy_rates[0] / model.divisor
+
+    cost = np.zeros(nscenarios)
+    exports = consumption.min(axis=1, initial=0) < 0
+    charges = TieredCharges(limits, model.energy_rates)
+    for s in np.flatnonzero(exports):
+        cost[s] = calculate_tiered_energy_cost(charges, consumption[s], model.divisor)
+
+    energy = np.cumsum(consumption, axis=1)
+    cumulative = energy / model.divisor
+    start = np.zeros(nscenarios, dtype=int)
+    active = ~exports
+    for j, rates in enumerate(model.energy_rates):
+        sums = np.zeros((nscenarios, n + 1))
+        np.cumsum(consumption / model.divisor * rates, axis=1, out=sums[:, 1:])
+        rows = np.flatnonzero(active)
+        if j == len(limits) - 1:
+            cost[rows] += sums[rows, n] - sums[rows, start[rows]]
+            break
+
+        limit = limits[j + 1]
+        # cumulative energy is sorted, so the crossing is the number of intervals
+        # at or below the limit, but never before the start of the tier
+        crossing = np.maximum(start, np.count_nonzero(cumulative <= limit, axis=1))
+        ends = active & (crossing == n)
+        cost[ends] += sums[ends, n] - sums[ends, start[ends]]
+
+        crosses = active & (crossing < n)
+        rows = np.flatnonzero(crosses)
+        i = crossing[rows]
+        cost[rows] += sums[rows, i] - sums[rows, start[rows]]
+        cost[rows] += (limit - (energy[rows, i] - consumption[rows, i]) / model.divisor) * rates[i]
+        start = np.where(crosses, crossing + 1, start)
+        active = crosses & (start < n)
+    return cost
+
+
+def calculate_ensemble_facility_costs(
+    compiled_tariff,
+    keys,
+    electric,
+    gas,
+    periods,
+    interval_minutes=15,
+    demand_window=DEMAND_WINDOW_MINUTES,
+    rolling=False,
+    peaks=1,
+    ratchet_fraction=0,
+    ratchet_months=11,
+    chunksize=128,
+):
+    """Calculates the cost of every charge type in every billing period for
+    many load profiles of a single facility
+
+    Parameters
+    ----------
+    compiled_tariff : dict
+        Billing information compiled by `compiled_tariff.compile_tariff`
+
+    keys : array
+        Calendar keys of the load profiles from `calendar_index.CalendarIndex`
+
+    electric : array
+        Electricity consumption in kW of shape (scenarios, intervals).
+        May be memory-mapped, see `load_profiles`
+
+    gas : array
+        Natural gas consumption in therms/hr of shape (scenarios, intervals),
+        or None for no gas consumption
+
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    interval_minutes : float
+        Length of each interval of the load profiles in minutes
+
+    demand_window : float
+        Length in minutes of the window over which demand is averaged
+
+    rolling : bool
+        Whether demand is a rolling average over `demand_window`
+
+    peaks : int
+        Number of daily peaks averaged into the billed demand
+
+    ratchet_fraction : float
+        Fraction of the peak demand of the preceding `ratchet_months` billing
+        periods that is billed at minimum, e.g. 0.8. Defaults to no ratchet
+
+    ratchet_months : int
+        Number of preceding months of the demand ratchet
+
+    chunksize : int
+        Number of scenarios billed at a time, which bounds the memory used
+
+    Returns
+    -------
+    array
+        Costs in USD with shape (scenarios, number of billing periods, 6) in the
+        order of `batch_billing.CHARGE_TYPES`
+    """
+    nscenarios = electric.shape[0]
+    costs = np.zeros((nscenarios, periods.shape[0], len(CHARGE_TYPES)))
+    models = {}
+    for utility in ["electric", "gas"]:
+        costs[:, :, CHARGE_TYPES.index(utility + "_customer")] = np.sum(
+            compiled_tariff[(utility, "customer")]
+        )
+        models[utility] = period_models(
+            compiled_tariff,
+            keys,
+            periods,
+            utility,
+            interval_minutes,
+            demand_window=demand_window,
+            rolling=rolling,
+            peaks=peaks,
+        )
+
+    for first in range(0, nscenarios, chunksize):
+        last = min(first + chunksize, nscenarios)
+        consumption = {
+            "electric": np.asarray(electric[first:last], dtype=float),
+            "gas": (
+                np.zeros((last - first, len(keys)))
+                if gas is None
+                else np.asarray(gas[first:last], dtype=float)
+            ),
+        }
+        for utility, utility_models in models.items():
+            demands = []
+            for p, model in enumerate(utility_models):
+                start, end = periods["start"].iloc[p], periods["end"].iloc[p]
+                period_consumption = consumption[utility][:, start:end]
+                demands.append(ensemble_billed_demands(model, period_consumption))
+                costs[first:last, p, CHARGE_TYPES.index(utility + "_energy")] = (
+                    ensemble_energy_cost(model, period_consumption)
+                )
+            if ratchet_fraction:
+                minimum = ensemble_ratchet(
+                    utility_models, demands, periods, ratchet_fraction, ratchet_months
+                )
+            else:
+                minimum = [None] * len(utility_models)
+            for p, model in enumerate(utility_models):
+                costs[first:last, p, CHARGE_TYPES.index(utility + "_demand")] = (
+                    ensemble_demand_cost(model, demands[p], minimum[p])
+                )
+    return costs
+
+
+def calculate_ensemble_costs(
+    datetimes, tariffs, electric, gas=None, chunksize=128, **demand_options
+):
+    """Calculates monthly costs of many load profiles under many facilities' tariffs
+
+    Parameters
+    ----------
+    datetimes : Series
+        Timestamps shared by every load profile, e.g. the 'DateTime' column
+        of 'data/synthetic_energy_data.csv'
+
+    tariffs : dict
+        Dictionary of billing information (as `DataFrame`) or compiled
+        tariffs (as `dict`) keyed by CWNS number
+
+    electric : str or array
+        Electricity consumption in kW of shape (scenarios, intervals),
+        or the path to a `.npy` file of it, which is memory-mapped
+
+    gas : str or array
+        Natural gas consumption in therms/hr of shape (scenarios, intervals),
+        or the path to a `.npy` file of it. Defaults to no gas consumption
+
+    chunksize : int
+        Number of scenarios billed at a time
+
+    demand_options : dict
+        Demand window, peak, and ratchet options of `calculate_ensemble_facility_costs`
+
+    Returns
+    -------
+    tuple
+        (costs, periods) where `costs` has shape (facilities, scenarios, billing
+        periods, 6) in the order of `tariffs` and `batch_billing.CHARGE_TYPES`,
+        and `periods` are the billing periods from `calendar_index.CalendarIndex`
+    """
+    calendar = get_calendar_index(datetimes)
+    electric = load_profiles(electric)
+    gas = load_profiles(gas)
+    if electric.shape[1] != len(calendar) or (gas is not None and gas.shape != electric.shape):
+        raise ValueError("Load profiles must have shape (scenarios, {})".format(len(calendar)))
+
+    costs = np.empty(
+        (len(tariffs), electric.shape[0], calendar.periods.shape[0], len(CHARGE_TYPES))
+    )
+    for f, tariff in enumerate(tariffs.values()):
+        costs[f] = calculate_ensemble_facility_costs(
+            ensure_compiled(tariff),
+            calendar.keys,
+            electric,
+            gas,
+            calendar.periods,
+            calendar.interval_minutes,
+            chunksize=chunksize,
+            **demand_options,
+        )
+    return costs, calendar.periods
+
+
+def summarize_ensemble(cwns_nos, periods, costs, quantiles=(0.05, 0.5, 0.95)):
+    """Summarizes the distribution of costs over scenarios
+
+    Parameters
+    ----------
+    cwns_nos : list
+        CWNS numbers of the facilities
+
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    costs : array
+        Costs in USD with shape (facilities, scenarios, billing periods, 6)
+        from `calculate_ensemble_costs`
+
+    quantiles : tuple
+        Quantiles of the cost to report
+
+    Returns
+    -------
+    DataFrame
+        Tidy table with columns 'CWNS_No', 'year', 'month', and 'charge_type'
+        (including a 'total' of all charge types) and the 'mean', 'std', and
+        each quantile (e.g. 'q0.05') of the cost in USD over scenarios
+    """
+    totals = costs.sum(axis=3, keepdims=True)
+    costs = np.concatenate([costs, totals], axis=3)
+    charge_types = CHARGE_TYPES + ["total"]
+    nfacilities, _, nperiods, ncharges = costs.shape
+
+    summary = pd.DataFrame(
+        {
+            "CWNS_No": np.repeat(cwns_nos, nperiods * ncharges),
+            "year": np.tile(np.repeat(periods["year"].values, ncharges), nfacilities),
+            "month": np.tile(np.repeat(periods["month"].values, ncharges), nfacilities),
+            "charge_type": np.tile(charge_types, nperiods * nfacilities),
+            "mean": costs.mean(axis=1).ravel(),
+            "std": costs.std(axis=1).ravel(),
+        }
+    )
+    for q, values in zip(quantiles, np.quantile(costs, quantiles, axis=1)):
+        summary["q{:g}".format(q)] = values.ravel()
+    return summary
@@ -0,0 +1,332 @@
+import numpy as np
+import pandas as pd
+from batch_billing import CHARGE_TYPES
+from calendar_index import get_calendar_index
+from compiled_tariff import ensure_compiled
+from cost_gradients import period_models
+
+
+class IncrementalBill:
+    """Monthly bill of one facility that is updated in place when part of the
+    load profile changes, instead of re-billing the whole profile
+
+    Each billing period caches its demand averaged over every demand window,
+    the peak window of every demand charge, the cumulative energy, and the
+    running cost of every energy tier. An update only touches the billing
+    periods overlapping the modified slice. Demand and single-tier energy
+    charges are updated in O(changed intervals), unless the peak window of a
+    demand charge decreased, which searches its billing period again. The
+    running sums of tiered energy charges are kept in blocks (see
+    `_BlockedCumsum`), so an update and the search for the tier crossings take
+    O(changed intervals + sqrt(intervals in the billing period)).
+
+    Parameters
+    ----------
+    compiled_tariff : dict or DataFrame
+        Billing information compiled by `compiled_tariff.compile_tariff`,
+        or the billing information itself
+
+    consumption_data : DataFrame
+        Electrical and gas usage data with a 'DateTime' column.
+        See 'data/synthetic_energy_data.csv' for an example.
+
+    elec_col : str
+        Name of the electricity consumption column in kW
+
+    ng_col : str
+        Name of the natural gas consumption column in therms/hr
+
+    Attributes
+    ----------
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    consumption : dict
+        Current electricity and gas consumption of the load profile keyed by utility
+
+    costs : array
+        Costs in USD with shape (number of billing periods, 6) in the order of
+        `batch_billing.CHARGE_TYPES`, identical to `batch_billing.calculate_facility_costs`
+    """
+
+    def __init__(
+        self,
+        compiled_tariff,
+        consumption_data,
+        elec_col="grid_to_plant_kW",
+        ng_col="natural_gas_therm_per_hr",
+    ):
+        compiled_tariff = ensure_compiled(compiled_tariff)
+        calendar = get_calendar_index(consumption_data["DateTime"])
+        self.periods = calendar.periods
+        self.consumption = {
+            "electric": consumption_data[elec_col].to_numpy(dtype=float, copy=True),
+            "gas": consumption_data[ng_col].to_numpy(dtype=float, copy=True),
+        }
+        self._starts = self.periods["start"].values
+        self._ends = self.periods["end"].values
+
+        self.costs = np.zeros((self.periods.shape[0], len(CHARGE_TYPES)))
+        self._state = {}
+        for utility in ["electric", "gas"]:
+            col = CHARGE_TYPES.index(utility + "_customer")
+            self.costs[:, col] = np.sum(compiled_tariff[(utility, "customer")])
+            models = period_models(
+                compiled_tariff, calendar.keys, self.periods, utility, calendar.interval_minutes
+            )
+            for p, model in enumerate(models):
+                self._state[(p, utility)] = {"model": model}
+                self._bill_period(p, utility)
+
+    def _bill_period(self, p, utility):
+        """Bills a billing period from scratch and caches its intermediate results"""
+        state = self._state[(p, utility)]
+        model = state["model"]
+        consumption = self.consumption[utility][self._starts[p] : self._ends[p]]
+
+        state["averaged"] = model.average_demand(consumption)
+        state["peaks"] = model.demand_peaks(state["averaged"])
+        demand_cost = model.demand_cost_at_peaks(state["averaged"], state["peaks"])
+
+        if len(model.energy_limits) > 1:
+            block = max(int(np.sqrt(len(consumption))), 1)
+            state["energy"] = _BlockedCumsum(consumption, block)
+            state["tier_sums"] = [
+                _BlockedCumsum(consumption / model.divisor * rates, block)
+                for rates in model.energy_rates
+            ]
+            energy_cost = self._tiered_energy_cost(state, consumption)
+        else:
+            energy_cost = np.sum(consumption / model.divisor * model.energy_rates[0])
+
+        self.costs[p, CHARGE_TYPES.index(utility + "_demand")] = demand_cost
+        self.costs[p, CHARGE_TYPES.index(utility + "_energy")] = energy_cost
+
+    def _tiered_energy_cost(self, state, consumption):
+        """Calculates the tiered energy cost of a billing period from its cached
+        cumulative energy and running tier costs. Tiers are crossed as in
+        `billing.find_tier_crossings`
+        """
+        model = state["model"]
+        energy = state["energy"]
+        limits = model.energy_limits
+        n = len(consumption)
+        cost = 0
+        start_idx = 0
+        for j, sums in enumerate(state["tier_sums"]):
+            if j == len(limits) - 1:
+                i = n
+            else:
+                i = energy.first_above(limits[j + 1], start_idx, model.divisor)
+            if i == n:
+                # limit is never reached, so the rest is billed at this tier
+                cost += sums.before(n) - sums.before(start_idx)
+                break
+            cost += sums.before(i) - sums.before(start_idx)
+            cost += (
+                limits[j + 1] - ((energy.at(i) - consumption[i]) / model.divisor)
+            ) * model.energy_rates[j][i]
+            start_idx = i + 1
+            if start_idx == n:
+                break
+        return cost
+
+    def _update_demand(self, state, consumption, start, end):
+        """Updates the cached demand of the windows overlapping [start, end)
+        and the peak window of each demand charge
+        """
+        model = state["model"]
+        averaged = state["averaged"]
+        first = np.searchsorted(model.window_starts, start, side="right") - 1
+        last = np.searchsorted(model.window_starts, end, side="left")
+        starts = model.window_starts[first:last]
+        stop = starts[-1] + model.window_counts[last - 1]
+        averaged[first:last] = (
+            np.add.reduceat(consumption[starts[0] : stop], starts - starts[0])
+            / model.window_counts[first:last]
+        )
+
+        for j, tier in enumerate(model.demand_tiers):
+            # the default demand options bill a single peak window per column
+            peaks = state["peaks"][j][0]
+            columns = np.arange(len(peaks))
+            # a peak inside the modified windows may have decreased,
+            # so those columns search the whole billing period again
+            stale = (peaks >= first) & (peaks < last)
+            values = tier["rates"][first:last] * averaged[first:last, None]
+            candidates = np.argmax(values, axis=0)
+            candidate_values = values[candidates, columns]
+            peak_values = tier["rates"][peaks, columns] * averaged[peaks]
+            # np.argmax returns the first of tied maxima
+            better = ~stale & (
+                (candidate_values > peak_values)
+                | ((candidate_values == peak_values) & (candidates + first < peaks))
+            )
+            peaks[better] = candidates[better] + first
+            if np.any(stale):
+                peaks[stale] = np.argmax(tier["rates"][:, stale] * averaged[:, None], axis=0)
+
+    def _update_energy(self, state, consumption, start, end):
+        """Updates the cached cumulative energy and running tier costs
+        after [start, end) of a billing period changed
+        """
+        model = state["model"]
+        # recompute whole blocks, which also hold unchanged values around the slice
+        lo, hi = state["energy"].span(start, end)
+        state["energy"].update(consumption[lo:hi], lo)
+        for rates, sums in zip(model.energy_rates, state["tier_sums"]):
+            sums.update(consumption[lo:hi] / model.divisor * rates[lo:hi], lo)
+
+    def update(self, start, electric=None, gas=None):
+        """Replaces part of the load profile and updates the affected billing periods
+
+        Parameters
+        ----------
+        start : int
+            Position in the load profile of the first modified interval
+
+        electric : array
+            New electricity consumption in kW from `start` onwards
+
+        gas : array
+            New natural gas consumption in therms/hr from `start` onwards
+
+        Raises
+        ------
+        ValueError
+            When the modified slice extends beyond the load profile
+
+        Returns
+        -------
+        array
+            Positions of the billing periods whose costs were updated
+        """
+        updated = []
+        for utility, values in [("electric", electric), ("gas", gas)]:
+            if values is None:
+                continue
+            values = np.asarray(values, dtype=float)
+            end = start + len(values)
+            if start < 0 or end > len(self.consumption[utility]):
+                raise ValueError(
+                    "Slice [{}, {}) is outside the load profile".format(start, end)
+                )
+            if end == start:
+                continue
+
+            first = np.searchsorted(self._starts, start, side="right") - 1
+            last = np.searchsorted(self._starts, end - 1, side="right")
+            for p in range(first, last):
+                offset = self._starts[p]
+                lo = max(start, offset) - offset
+                hi = min(end, self._ends[p]) - offset
+                consumption = self.consumption[utility][offset : self._ends[p]]
+                old = consumption[lo:hi].copy()
+                consumption[lo:hi] = values[lo + offset - start : hi + offset - start]
+
+                state = self._state[(p, utility)]
+                model = state["model"]
+                self._update_demand(state, consumption, lo, hi)
+                demand_cost = model.demand_cost_at_peaks(state["averaged"], state["peaks"])
+                col = CHARGE_TYPES.index(utility + "_energy")
+                if len(model.energy_limits) > 1:
+                    self._update_energy(state, consumption, lo, hi)
+                    self.costs[p, col] = self._tiered_energy_cost(state, consumption)
+                else:
+                    self.costs[p, col] += np.sum(
+                        (consumption[lo:hi] - old) / model.divisor * model.energy_rates[0][lo:hi]
+                    )
+                self.costs[p, CHARGE_TYPES.index(utility + "_demand")] = demand_cost
+                updated.append(p)
+        return np.unique(updated)
+
+    def total(self):
+        """Gets the total cost of the load profile in USD"""
+        return np.sum(self.costs)
+
+    def to_frame(self):
+        """Gets the costs as a DataFrame
+
+        Returns
+        -------
+        DataFrame
+            Costs in USD indexed by ('year', 'month') with one column per charge type
+        """
+        index = pd.MultiIndex.from_arrays(
+            [self.periods["year"].values, self.periods["month"].values],
+            names=["year", "month"],
+        )
+        return pd.DataFrame(self.costs.copy(), index=index, columns=CHARGE_TYPES)
+
+
+class _BlockedCumsum:
+    """Cumulative sum of an array stored as the cumulative sums within blocks of
+    `block` values and the running total before each block, so that changing
+    a slice only recomputes the blocks it overlaps and the block totals
+
+    Parameters
+    ----------
+    values : array
+        Values to sum
+
+    block : int
+        Number of values in each block, e.g. the square root of their number
+    """
+
+    def __init__(self, values, block):
+        self.n = len(values)
+        self.block = block
+        nblocks = -(-self.n // block)
+        self.local = np.zeros((nblocks, block))
+        self.maxima = np.zeros(nblocks)
+        self.offsets = np.zeros(nblocks + 1)
+        self._fill(values, 0, 0, nblocks)
+
+    def _fill(self, values, position, first, last):
+        """Recomputes blocks [first, last) from `values` starting at `position`,
+        then the running totals of every later block
+        """
+        padded = np.zeros((last - first) * self.block)
+        lo = first * self.block - position
+        chunk = values[lo : lo + len(padded)]
+        padded[: len(chunk)] = chunk
+        self.local[first:last] = np.cumsum(padded.reshape(-1, self.block), axis=1)
+        self.maxima[first:last] = self.local[first:last].max(axis=1)
+        self.offsets[first + 1 :] = self.offsets[first] + np.cumsum(self.local[first:, -1])
+
+    def span(self, start, end):
+        """Gets the positions [lo, hi) of the blocks overlapping [start, end)"""
+        lo = start // self.block * self.block
+        hi = min(-(-end // self.block) * self.block, self.n)
+        return lo, hi
+
+    def update(self, values, start):
+        """Replaces the values of whole blocks from `start`, which is the first
+        position of a block, e.g. from `span`
+        """
+        first = start // self.block
+        self._fill(values, start, first, first + -(-len(values) // self.block))
+
+    def at(self, i):
+        """Gets the cumulative sum through position `i`"""
+        return self.offsets[i // self.block] + self.local[i // self.block, i % self.block]
+
+    def before(self, i):
+        """Gets the sum of the values before position `i`"""
+        return self.at(i - 1) if i > 0 else 0.0
+
+    def first_above(self, threshold, start, divisor=1):
+        """Finds the first position from `start` at which the cumulative sum
+        divided by `divisor` exceeds `threshold`, or the number of values if none does
+        """
+        b = start // self.block
+        row = (self.offsets[b] + self.local[b, start % self.block :]) / divisor > threshold
+        if row.any():
+            return min(start + int(np.argmax(row)), self.n)
+        # the maximum of each block bounds the search to a single block
+        above = (self.offsets[b + 1 : -1] + self.maxima[b + 1 :]) / divisor > threshold
+        if not above.any():
+            return self.n
+        c = b + 1 + int(np.argmax(above))
+        row = (self.offsets[c] + self.local[c]) / divisor > threshold
+        return min(c * self.block + int(np.argmax(row)), self.n)
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+from collections import defaultdict
+
+# instrumentation is off unless `enable` is called
+_state = {"enabled": False, "trace": False}
+_timers = defaultdict(lambda: {"calls": 0, "total": 0.0, "max": 0.0})
+_counters = defaultdict(int)
+_events = []
+_origin = time.perf_counter()
+# returned by `timer` while disabled so that no object is created per call
+_null_timer = contextlib.nullcontext()
+
+
+def enable(trace=False):
+    """Turns on the timers and counters of the cost pipeline
+
+    Parameters
+    ----------
+    trace : bool
+        Whether to also record every timed call for `dump_chrome_trace`
+    """
+    _state["enabled"] = True
+    _state["trace"] = trace
+
+
+def disable():
+    """Turns off the timers and counters, keeping the stats collected so far"""
+    _state["enabled"] = False
+    _state["trace"] = False
+
+
+def is_enabled():
+    """Returns whether the timers and counters are on"""
+    return _state["enabled"]
+
+
+def reset():
+    """Clears all collected stats and trace events"""
+    _timers.clear()
+    _counters.clear()
+    del _events[:]
+
+
+@contextlib.contextmanager
+def _timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        elapsed = end - start
+        stats = _timers[name]
+        stats["calls"] += 1
+        stats["total"] += elapsed
+        stats["max"] = max(stats["max"], elapsed)
+        if _state["trace"]:
+            _events.append(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": (start - _origin) * 1e6,
+                    "dur": elapsed * 1e6,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                }
+            )
+
+
+def timer(name):
+    """Context manager that times its block under `name` while enabled
+
+    Parameters
+    ----------
+    name : str
+        Name of the timed step, e.g. 'calculate_cost'
+
+    Returns
+    -------
+    context manager
+        A timer, or a shared no-op context while disabled
+    """
+    if not _state["enabled"]:
+        return _null_timer
+    return _timer(name)
+
+
+def timed(name=None):
+    """Decorator that times every call of a function while enabled
+
+    Parameters
+    ----------
+    name : str
+        Name of the timed step. Defaults to the name of the function
+
+    Returns
+    -------
+    function
+        Decorator whose wrapper calls the function directly while disabled
+    """
+
+    def decorator(function):
+        step = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state["enabled"]:
+                return function(*args, **kwargs)
+            with _timer(step):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, n=1):
+    """Adds `n` to the counter `name` while enabled"""
+    if _state["enabled"]:
+        _counters[name] += n
+
+
+def get_stats():
+    """Gets the collected timers and counters
+
+    Returns
+    -------
+    dict
+        'timers' maps each step to its number of 'calls' and 'total' and 'max'
+        time in seconds, and 'counters' maps each counter to its value
+    """
+    return {
+        "timers": {name: dict(stats) for name, stats in _timers.items()},
+        "counters": dict(_counters),
+    }
+
+
+def stats_frame():
+    """Gets the collected timers as a DataFrame
+
+    Returns
+    -------
+    DataFrame
+        One row per timed step with 'calls', 'total', 'mean', and 'max' time in
+        seconds, sorted by descending total time
+    """
+    # pandas is only needed for reporting, so it is not imported with the timers
+    import pandas as pd
+
+    frame = pd.DataFrame.from_dict(
+        get_stats()["timers"], orient="index", columns=["calls", "total", "max"]
+    )
+    frame["mean"] = frame["total"] / frame["calls"]
+    return frame[["calls", "total", "mean", "max"]].sort_values("total", ascending=False)
+
+
+def dump_chrome_trace(path):
+    """Writes the recorded trace events to a JSON file that can be opened in
+    chrome://tracing or Perfetto. Requires `enable(trace=True)`
+    """
+    with open(path, "w") as f:
+        json.dump({"traceEvents": list(_events), "displayTimeUnit": "ms"}, f)
+
+
+@contextlib.contextmanager
+def profile(path=None):
+    """Context manager that runs its block under cProfile
+
+    Parameters
+    ----------
+    path : str
+        If given, the profile is dumped there for `pstats` or snakeviz
+
+    Yields
+    ------
+    cProfile.Profile
+        The profiler, e.g. for `pstats.Stats(profiler)`
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
@@ -0,0 +1,296 @@
+import numpy as np
+from billing import calculate_tiered_energy_cost
+from batch_billing import CHARGE_TYPES, prepare_profile
+from compiled_tariff import ensure_compiled
+from cost_gradients import period_models
+from tariff_model import TieredCharges
+
+
+def demand_cost_curve(model, consumption, scales):
+    """Calculates the demand cost of one billing period for every scale factor
+    of the load profile
+
+    Scaling the load by s > 0 does not move the peak window of any demand charge,
+    so the peaks are found once and the cost of each charge is a piecewise-linear
+    function of s with breakpoints where s * peak demand crosses a basic charge limit.
+
+    Parameters
+    ----------
+    model : BillingPeriodModel
+        Charges of the billing period from `cost_gradients.BillingPeriodModel`
+
+    consumption : array
+        Unscaled electrical or gas usage data of the billing period
+
+    scales : array
+        Non-negative scale factors of the load profile
+
+    Returns
+    -------
+    array
+        Demand cost in USD at each scale factor, identical to `billing.calculate_cost`
+        of the scaled load up to floating point rounding
+    """
+    averaged = model.average_demand(consumption)
+    cost = np.zeros(len(scales))
+    for tier, peaks in zip(model.demand_tiers, model.demand_peaks(averaged)):
+        demand = scales[:, None] * model.billed_demand(averaged, peaks)[None, :]
+        cost += model.tier_cost(tier, demand).sum(axis=1)
+    return cost
+
+
+def energy_cost_curve(model, consumption, scales):
+    """Calculates the tiered energy cost of one billing period for every scale
+    factor of the load profile
+
+    The cumulative energy and the running cost of every tier are computed once.
+    The interval in which scale factor s crosses a basic charge limit L is where the
+    unscaled cumulative energy crosses L / s, so the crossings of all scale factors
+    are found with one `np.searchsorted` per tier. Load profiles with export to the
+    grid (i.e., negative consumption) do not have sorted cumulative energy and are
+    billed once per scale factor.
+
+    Parameters
+    ----------
+    model : BillingPeriodModel
+        Charges of the billing period from `cost_gradients.BillingPeriodModel`
+
+    consumption : array
+        Unscaled electrical or gas usage data of the billing period
+
+    scales : array
+        Non-negative scale factors of the load profile
+
+    Returns
+    -------
+    array
+        Tiered energy cost in USD at each scale factor, identical to
+        `billing.calculate_cost` of the scaled load up to floating point rounding
+    """
+    consumption = np.asarray(consumption, dtype=float)
+    limits = model.energy_limits
+    if len(limits) == 1:
+        return scales * (consumption @ model.energy_rates[0] / model.divisor)
+    if consumption.size and consumption.min() < 0:
+        charges = TieredCharges(limits, model.energy_rates)
+        return np.array(
+            [calculate_tiered_energy_cost(charges, s * consumption, model.divisor) for s in scales]
+        )
+
+    n = len(consumption)
+    energy = np.cumsum(consumption)
+    cumulative = energy / model.divisor
+    cost = np.zeros(len(scales))
+    start = np.zeros(len(scales), dtype=int)
+    active = np.ones(len(scales), dtype=bool)
+    for j, rates in enumerate(model.energy_rates):
+        sums = np.concatenate([[0], np.cumsum(consumption / model.divisor * rates)])
+        if j == len(limits) - 1:
+            cost[active] += scales[active] * (sums[n] - sums[start[active]])
+            break
+
+        limit = limits[j + 1]
+        with np.errstate(divide="ignore"):
+            # a scale factor of 0 never reaches the limit
+            thresholds = limit / scales
+        crossing = np.maximum(start, np.searchsorted(cumulative, thresholds, side="right"))
+        ends = active & (crossing >= n)
+        cost[ends] += scales[ends] * (sums[n] - sums[start[ends]])
+
+        crosses = active & (crossing < n)
+        i = crossing[crosses]
+        s = scales[crosses]
+        cost[crosses] += s * (sums[i] - sums[start[crosses]])
+        # the crossing interval is billed up to the limit
+        cost[crosses] += (limit - s * (energy[i] - consumption[i]) / model.divisor) * rates[i]
+        start = np.where(crosses, crossing + 1, start)
+        active = crosses & (start < n)
+    return cost
+
+
+def calculate_scaled_facility_costs(
+    compiled_tariff,
+    keys,
+    electric,
+    gas,
+    periods,
+    interval_minutes=15,
+    electric_scales=(1,),
+    gas_scales=None,
+):
+    """Calculates the cost of every charge type in every billing period for a
+    single facility at every scale factor of the load profile
+
+    Parameters
+    ----------
+    compiled_tariff : dict
+        Billing information compiled by `compiled_tariff.compile_tariff`
+
+    keys : array
+        Calendar keys of the load profile from `calendar_index.CalendarIndex`
+
+    electric : array
+        Unscaled electricity consumption in kW at each interval of the load profile
+
+    gas : array
+        Unscaled natural gas consumption in therms/hr at each interval of the load profile
+
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    interval_minutes : float
+        Length of each interval of the load profile in minutes
+
+    electric_scales : array
+        Non-negative scale factors of the electricity consumption
+
+    gas_scales : array
+        Non-negative scale factors of the natural gas consumption, paired with
+        `electric_scales`. Defaults to `electric_scales`
+
+    Raises
+    ------
+    ValueError
+        When a scale factor is negative or the scale factors are not paired
+
+    Returns
+    -------
+    array
+        Costs in USD with shape (scale factors, number of billing periods, 6)
+        in the order of `batch_billing.CHARGE_TYPES`
+    """
+    scales = {"electric": np.asarray(electric_scales, dtype=float)}
+    scales["gas"] = (
+        scales["electric"] if gas_scales is None else np.asarray(gas_scales, dtype=float)
+    )
+    if scales["electric"].shape != scales["gas"].shape or scales["electric"].ndim != 1:
+        raise ValueError("Electric and gas scale factors must be paired 1-D arrays")
+    if (scales["electric"] < 0).any() or (scales["gas"] < 0).any():
+        raise ValueError("Scale factors must be non-negative")
+
+    costs = np.zeros((len(scales["electric"]), periods.shape[0], len(CHARGE_TYPES)))
+    consumption = {"electric": electric, "gas": gas}
+    for utility in ["electric", "gas"]:
+        costs[:, :, CHARGE_TYPES.index(utility + "_customer")] = np.sum(
+            compiled_tariff[(utility, "customer")]
+        )
+        models = period_models(compiled_tariff, keys, periods, utility, interval_minutes)
+        for p, (start, end, model) in enumerate(zip(periods["start"], periods["end"], models)):
+            period_consumption = consumption[utility][start:end]
+            costs[:, p, CHARGE_TYPES.index(utility + "_demand")] = demand_cost_curve(
+                model, period_consumption, scales[utility]
+            )
+            costs[:, p, CHARGE_TYPES.index(utility + "_energy")] = energy_cost_curve(
+                model, period_consumption, scales[utility]
+            )
+    return costs
+
+
+def calculate_scaled_costs(
+    consumption_data,
+    tariffs,
+    electric_scales,
+    gas_scales=None,
+    elec_col="grid_to_plant_kW",
+    ng_col="natural_gas_therm_per_hr",
+):
+    """Calculates monthly costs of one load profile under many facilities' tariffs
+    over a sweep of scale factors of the load
+
+    Parameters
+    ----------
+    consumption_data : DataFrame
+        Electrical and gas usage data with a 'DateTime' column.
+        See 'data/synthetic_energy_data.csv' for an example.
+
+    tariffs : dict
+        Dictionary of billing information (as `DataFrame`) or compiled
+        tariffs (as `dict`) keyed by CWNS number
+
+    electric_scales : array
+        Scale factors of the electricity consumption, either shared by every
+        facility with shape (scale factors,) or with shape (facilities, scale
+        factors) in the order of `tariffs`, e.g. from `metadata_scales`
+
+    gas_scales : array
+        Scale factors of the natural gas consumption with the shape of
+        `electric_scales`. Defaults to `electric_scales`
+
+    elec_col : str
+        Name of the electricity consumption column in kW
+
+    ng_col : str
+        Name of the natural gas consumption column in therms/hr
+
+    Returns
+    -------
+    tuple
+        (costs, periods) where `costs` has shape (facilities, scale factors, billing
+        periods, 6) in the order of `tariffs` and `batch_billing.CHARGE_TYPES`,
+        and `periods` are the billing periods from `calendar_index.CalendarIndex`
+    """
+    keys, electric, gas, periods, interval_minutes = prepare_profile(
+        consumption_data, elec_col, ng_col
+    )
+    nfacilities = len(tariffs)
+    electric_scales = np.asarray(electric_scales, dtype=float)
+    gas_scales = electric_scales if gas_scales is None else np.asarray(gas_scales, dtype=float)
+    electric_scales = np.broadcast_to(electric_scales, (nfacilities, electric_scales.shape[-1]))
+    gas_scales = np.broadcast_to(gas_scales, (nfacilities, gas_scales.shape[-1]))
+
+    costs = np.empty(
+        (nfacilities, electric_scales.shape[1], periods.shape[0], len(CHARGE_TYPES))
+    )
+    for f, tariff in enumerate(tariffs.values()):
+        costs[f] = calculate_scaled_facility_costs(
+            ensure_compiled(tariff),
+            keys,
+            electric,
+            gas,
+            periods,
+            interval_minutes,
+            electric_scales=electric_scales[f],
+            gas_scales=gas_scales[f],
+        )
+    return costs, periods
+
+
+def metadata_scales(
+    metadata,
+    consumption_data,
+    elec_col="grid_to_plant_kW",
+    ng_col="natural_gas_therm_per_hr",
+):
+    """Gets the scale factors that bring the average load of a profile to each
+    facility's estimated existing and design grid and natural gas demand
+
+    Parameters
+    ----------
+    metadata : DataFrame
+        Facility metadata, i.e. 'data/metadata.csv'
+
+    consumption_data : DataFrame
+        Electrical and gas usage data, e.g. 'data/synthetic_energy_data.csv'
+
+    elec_col : str
+        Name of the electricity consumption column in kW
+
+    ng_col : str
+        Name of the natural gas consumption column in therms/hr
+
+    Returns
+    -------
+    tuple
+        (electric_scales, gas_scales) each with shape (facilities, 2) for the
+        'Existing' and 'Design' estimates in the order of `metadata`
+    """
+    mean_electric = consumption_data[elec_col].mean()
+    mean_gas = consumption_data[ng_col].mean()
+    electric_scales, gas_scales = [], []
+    for state in ["Existing", "Design"]:
+        # estimated grid demand is in MW and the load profile in kW
+        grid_demand = metadata["Est. {} Electric Grid Demand (MW)".format(state)].values
+        gas_demand = metadata["Est. {} Natural Gas Demand (therms/hr)".format(state)].values
+        electric_scales.append(grid_demand * 1000 / mean_electric)
+        gas_scales.append(gas_demand / mean_gas)
+    return np.stack(electric_scales, axis=1), np.stack(gas_scales, axis=1)
@@ -0,0 +1,412 @@
+import calendar
+import numpy as np
+import pandas as pd
+from billing import DEMAND_WINDOW_MINUTES, tier_demand_cost
+from batch_billing import CHARGE_TYPES
+from compiled_tariff import CALENDAR_SHAPE, calendar_keys, ensure_compiled
+from tariff_model import tier_arrays
+
+
+class _UtilityAccrual:
+    """Month-to-date demand and tiered energy charges of one utility,
+    updated one reading or one micro-batch at a time
+
+    Demand is billed exactly as `billing.calculate_cost`: each demand charge keeps
+    the demand of the window with the highest `rate * demand` and the highest and
+    lowest rates seen so far, so its cost is known without revisiting earlier
+    readings. Tiered energy keeps the cumulative energy and the current tier, and
+    follows the same crossing rule as `billing.find_tier_crossings`.
+    """
+
+    def __init__(self, compiled_tariff, utility, interval_minutes):
+        if utility == "electric":
+            self.divisor = 60 / interval_minutes
+        elif utility == "gas":
+            self.divisor = 1440 / interval_minutes
+        else:
+            raise ValueError("Invalid utility: " + utility)
+        self.customer = np.sum(compiled_tariff[(utility, "customer")])
+        self.window = max(int(round(DEMAND_WINDOW_MINUTES / interval_minutes)), 1)
+
+        # dense (calendar cell, column) tables so each reading is a row lookup
+        limits, rates = tier_arrays(compiled_tariff[(utility, "demand")])
+        ncells = np.prod(CALENDAR_SHAPE)
+        self.demand_limits = limits
+        self.demand_rates = [tier_rates.reshape(ncells, -1) for tier_rates in rates]
+        limits, rates = tier_arrays(compiled_tariff[(utility, "energy")])
+        self.energy_limits = limits
+        self.energy_rates = np.stack(rates, axis=1)
+        self.reset()
+
+    def reset(self):
+        """Clears the month-to-date state at the start of a billing period"""
+        self.readings = 0
+        self.energy = 0.0
+        self.tier = 0
+        self.energy_cost = 0.0
+        # committed demand windows: best charged demand, demand at it, and rate range
+        self.best = [np.full(rates.shape[1], -np.inf) for rates in self.demand_rates]
+        self.peaks = [np.zeros(rates.shape[1]) for rates in self.demand_rates]
+        self.max_rates = [np.full(rates.shape[1], -np.inf) for rates in self.demand_rates]
+        self.min_rates = [np.full(rates.shape[1], np.inf) for rates in self.demand_rates]
+        # demand window that is still being averaged
+        self.window_sum = 0.0
+        self.window_count = 0
+        self.window_key = 0
+
+    def add(self, key, consumption):
+        """Accrues one reading at calendar cell `key` in O(tiers * columns)"""
+        self.readings += 1
+        self._add_energy(key, consumption)
+        if self.window_count == 0:
+            # a demand window takes the charges in effect at its start
+            self.window_key = key
+        self.window_sum += consumption
+        self.window_count += 1
+        if self.window_count == self.window:
+            self._commit_window(self.window_sum / self.window_count, self.window_key)
+            self.window_sum = 0.0
+            self.window_count = 0
+
+    def add_batch(self, keys, consumption):
+        """Accrues consecutive readings of one billing period at calendar cells
+        `keys` in O(readings * tiers * columns) vectorized operations
+        """
+        n = len(consumption)
+        if n == 0:
+            return
+        self.readings += n
+        self._add_energy_batch(keys, consumption)
+
+        # complete the demand window that is still being averaged
+        fill = min(self.window - self.window_count, n)
+        if self.window_count == 0:
+            self.window_key = keys[0]
+        self.window_sum += np.sum(consumption[:fill])
+        self.window_count += fill
+        if self.window_count < self.window:
+            return
+        self._commit_window(self.window_sum / self.window_count, self.window_key)
+
+        # commit every complete window of the batch at once
+        starts = np.arange(fill, n, self.window)
+        complete = starts[starts + self.window <= n]
+        if len(complete):
+            sums = np.add.reduceat(consumption[fill : complete[-1] + self.window], complete - fill)
+            self._commit_windows(sums / self.window, keys[complete])
+        rest = fill + len(complete) * self.window
+        self.window_sum = np.sum(consumption[rest:])
+        self.window_count = n - rest
+        if self.window_count:
+            self.window_key = keys[rest]
+
+    def _add_energy_batch(self, keys, consumption):
+        rates = self.energy_rates[keys]
+        # cumulative energy accumulated in the same order as `add`
+        energy = np.cumsum(np.concatenate([[self.energy], consumption]))[1:]
+        n = len(consumption)
+        start = 0
+        while start < n:
+            if self.tier < len(self.energy_limits) - 1:
+                limit = self.energy_limits[self.tier + 1]
+                crossed = energy[start:] / self.divisor > limit
+                i = start + int(np.argmax(crossed)) if crossed.any() else n
+            else:
+                i = n
+            self.energy_cost += np.sum(
+                consumption[start:i] / self.divisor * rates[start:i, self.tier]
+            )
+            if i == n:
+                break
+            # the crossing reading is billed up to the limit, and the next
+            # tier starts with the following reading
+            self.energy_cost += (
+                limit - (energy[i] - consumption[i]) / self.divisor
+            ) * rates[i, self.tier]
+            self.tier += 1
+            start = i + 1
+        self.energy = energy[-1]
+
+    def _add_energy(self, key, consumption):
+        rates = self.energy_rates[key]
+        self.energy += consumption
+        if self.tier < len(self.energy_limits) - 1:
+            limit = self.energy_limits[self.tier + 1]
+            if self.energy / self.divisor > limit:
+                # the crossing reading is billed up to the limit, and the next
+                # tier starts with the following reading
+                self.energy_cost += (
+                    limit - (self.energy - consumption) / self.divisor
+                ) * rates[self.tier]
+                self.tier += 1
+                return
+        self.energy_cost += consumption / self.divisor * rates[self.tier]
+
+    def _commit_window(self, demand, key):
+        for j, rates in enumerate(self.demand_rates):
+            row = rates[key]
+            charged = row * demand
+            higher = charged > self.best[j]
+            self.best[j] = np.where(higher, charged, self.best[j])
+            self.peaks[j] = np.where(higher, demand, self.peaks[j])
+            self.max_rates[j] = np.maximum(self.max_rates[j], row)
+            self.min_rates[j] = np.minimum(self.min_rates[j], row)
+
+    def _commit_windows(self, demands, keys):
+        for j, rates in enumerate(self.demand_rates):
+            rows = rates[keys]
+            charged = rows * demands[:, None]
+            # np.argmax keeps the first of tied windows, as `_commit_window` does
+            best = np.argmax(charged, axis=0)
+            columns = np.arange(rows.shape[1])
+            higher = charged[best, columns] > self.best[j]
+            self.best[j] = np.where(higher, charged[best, columns], self.best[j])
+            self.peaks[j] = np.where(higher, demands[best], self.peaks[j])
+            self.max_rates[j] = np.maximum(self.max_rates[j], rows.max(axis=0))
+            self.min_rates[j] = np.minimum(self.min_rates[j], rows.min(axis=0))
+
+    def peak_demands(self):
+        """Gets the billed demand of each demand charge of each tier so far,
+        including the demand window that is still being averaged
+        """
+        if self.window_count == 0:
+            return self.peaks, self.max_rates, self.min_rates
+        demand = self.window_sum / self.window_count
+        peaks, max_rates, min_rates = [], [], []
+        for j, rates in enumerate(self.demand_rates):
+            row = rates[self.window_key]
+            peaks.append(np.where(row * demand > self.best[j], demand, self.peaks[j]))
+            max_rates.append(np.maximum(self.max_rates[j], row))
+            min_rates.append(np.minimum(self.min_rates[j], row))
+        return peaks, max_rates, min_rates
+
+    def demand_cost(self):
+        """Calculates the month-to-date demand cost"""
+        if self.readings == 0:
+            return 0.0
+        peaks, max_rates, min_rates = self.peak_demands()
+        cost = 0.0
+        for j, limit in enumerate(self.demand_limits):
+            next_limit = self.demand_limits[j + 1] if j < len(self.demand_limits) - 1 else None
+            cost += np.sum(
+                tier_demand_cost(peaks[j], limit, next_limit, max_rates[j], min_rates[j])
+            )
+        return cost
+
+    def tier_position(self):
+        """Gets the current energy tier, the cumulative energy in the units of
+        the basic charge limits, and the energy left until the next tier
+        """
+        cumulative = self.energy / self.divisor
+        if self.tier < len(self.energy_limits) - 1:
+            remaining = max(self.energy_limits[self.tier + 1] - cumulative, 0.0)
+        else:
+            remaining = np.inf
+        return {
+            "tier": self.tier,
+            "limit": self.energy_limits[self.tier],
+            "energy": cumulative,
+            "to_next_tier": remaining,
+        }
+
+
+class OnlineBill:
+    """Running month-to-date bill of one facility for streaming meter readings
+
+    Readings are accrued one at a time or in vectorized micro-batches at O(1)
+    amortized cost per reading, i.e. independent of the number of readings so far
+    in the month.
+    Closed billing periods are identical to `batch_billing.calculate_facility_costs`
+    up to floating point rounding.
+
+    Parameters
+    ----------
+    compiled_tariff : dict or DataFrame
+        Billing information compiled by `compiled_tariff.compile_tariff`, or the
+        billing information itself, e.g. a sheet of `tariff_cache.load_tariffs`
+
+    interval_minutes : float
+        Length of each reading in minutes. Readings are assumed to be consecutive
+
+    Attributes
+    ----------
+    history : list
+        Costs of every closed billing period as dictionaries with the 'year',
+        'month', and the cost in USD of each of `batch_billing.CHARGE_TYPES`
+    """
+
+    def __init__(self, compiled_tariff, interval_minutes=15):
+        compiled_tariff = ensure_compiled(compiled_tariff)
+        self.interval_minutes = interval_minutes
+        self.utilities = {
+            utility: _UtilityAccrual(compiled_tariff, utility, interval_minutes)
+            for utility in ["electric", "gas"]
+        }
+        self.year = None
+        self.month = None
+        self.history = []
+
+    def add(self, datetime, electric=0.0, gas=0.0):
+        """Accrues one reading, closing the current billing period when the
+        reading falls in a new month
+
+        Parameters
+        ----------
+        datetime : Timestamp
+            Start of the reading
+
+        electric : float
+            Electricity consumption in kW
+
+        gas : float
+            Natural gas consumption in therms/hr
+
+        Returns
+        -------
+        OnlineBill
+            This bill, so that calls can be chained
+        """
+        datetime = pd.Timestamp(datetime)
+        if (datetime.year, datetime.month) != (self.year, self.month):
+            self.close()
+            self.year, self.month = datetime.year, datetime.month
+        key = np.ravel_multi_index(
+            (datetime.month - 1, datetime.weekday(), datetime.hour * 4 + datetime.minute // 15),
+            CALENDAR_SHAPE,
+        )
+        self.utilities["electric"].add(key, float(electric))
+        self.utilities["gas"].add(key, float(gas))
+        return self
+
+    def add_batch(self, datetimes, electric, gas=None):
+        """Accrues a micro-batch of consecutive readings
+
+        Parameters
+        ----------
+        datetimes : array
+            Start of each reading
+
+        electric : array
+            Electricity consumption in kW of each reading
+
+        gas : array
+            Natural gas consumption in therms/hr of each reading.
+            Defaults to no gas consumption
+
+        Returns
+        -------
+        OnlineBill
+            This bill, so that calls can be chained
+        """
+        datetimes = pd.Series(pd.to_datetime(datetimes))
+        electric = np.asarray(electric, dtype=float)
+        gas = np.zeros(len(electric)) if gas is None else np.asarray(gas, dtype=float)
+        keys = calendar_keys(datetimes)
+        years = datetimes.dt.year.values
+        months = datetimes.dt.month.values
+        # accrue each billing period of the batch in one vectorized pass
+        bounds = np.flatnonzero((np.diff(years) != 0) | (np.diff(months) != 0)) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(electric)]):
+            if (years[start], months[start]) != (self.year, self.month):
+                self.close()
+                self.year, self.month = int(years[start]), int(months[start])
+            self.utilities["electric"].add_batch(keys[start:end], electric[start:end])
+            self.utilities["gas"].add_batch(keys[start:end], gas[start:end])
+        return self
+
+    async def accrue(self, readings):
+        """Accrues readings from an async iterator, e.g. a SCADA feed
+
+        Parameters
+        ----------
+        readings : async iterable
+            (datetime, electric, gas) tuples of consecutive readings
+
+        Yields
+        ------
+        dict
+            `status` after each reading
+        """
+        async for datetime, electric, gas in readings:
+            self.add(datetime, electric, gas)
+            yield self.status()
+
+    def close(self):
+        """Closes the current billing period, appending its costs to `history`"""
+        if self.year is None:
+            return
+        self.history.append({"year": self.year, "month": self.month, **self.month_to_date()})
+        for accrual in self.utilities.values():
+            accrual.reset()
+        self.year, self.month = None, None
+
+    def month_to_date(self):
+        """Gets the bill of the current billing period so far
+
+        Returns
+        -------
+        dict
+            Cost in USD of each of `batch_billing.CHARGE_TYPES`
+        """
+        costs = {}
+        for utility, accrual in self.utilities.items():
+            costs[utility + "_customer"] = accrual.customer if accrual.readings else 0.0
+            costs[utility + "_demand"] = accrual.demand_cost()
+            costs[utility + "_energy"] = accrual.energy_cost
+        return {charge_type: costs[charge_type] for charge_type in CHARGE_TYPES}
+
+    def projected(self):
+        """Projects the bill of the current billing period to the end of the month
+
+        Energy costs are extrapolated at the month-to-date run rate, while customer
+        and demand charges are those incurred so far, so the projection does
+        not anticipate future tier crossings or demand peaks.
+
+        Returns
+        -------
+        dict
+            Projected cost in USD of each of `batch_billing.CHARGE_TYPES`
+        """
+        costs = self.month_to_date()
+        if self.year is None:
+            return costs
+        days = calendar.monthrange(self.year, self.month)[1]
+        readings_per_month = days * 1440 / self.interval_minutes
+        for utility, accrual in self.utilities.items():
+            costs[utility + "_energy"] *= readings_per_month / accrual.readings
+        return costs
+
+    def status(self):
+        """Gets the current state of the bill
+
+        Returns
+        -------
+        dict
+            'year' and 'month' of the billing period, 'readings' so far, the
+            'month_to_date' and 'projected' costs with their 'total', and for each
+            utility the energy 'tier' position and 'peak_demand' of each demand
+            charge of each tier
+        """
+        month_to_date = self.month_to_date()
+        projected = self.projected()
+        status = {
+            "year": self.year,
+            "month": self.month,
+            "readings": self.utilities["electric"].readings,
+            "month_to_date": month_to_date,
+            "month_to_date_total": sum(month_to_date.values()),
+            "projected": projected,
+            "projected_total": sum(projected.values()),
+        }
+        for utility, accrual in self.utilities.items():
+            status[utility] = {
+                "tier": accrual.tier_position(),
+                "peak_demand": [peaks.copy() for peaks in accrual.peak_demands()[0]],
+            }
+        return status
+
+    def history_frame(self):
+        """Gets the costs of the closed billing periods as a DataFrame with
+        one row per billing period
+        """
+        return pd.DataFrame(self.history, columns=["year", "month"] + CHARGE_TYPES)
@@ -0,0 +1,211 @@
+import os
+import numpy as np
+import pandas as pd
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor
+from compiled_tariff import ensure_compiled
+from batch_billing import CHARGE_TYPES, calculate_facility_costs, prepare_profile, tidy_costs
+
+# shared arrays attached by each worker process in `_init_worker`
+_worker_state = {}
+
+
+def share_arrays(arrays):
+    """Copies arrays into a single block of shared memory
+
+    Parameters
+    ----------
+    arrays : dict
+        Dictionary of NumPy arrays
+
+    Returns
+    -------
+    tuple
+        (shm, manifest) where `shm` is the `SharedMemory` block, which the caller
+        must close and unlink, and `manifest` maps each key to the
+        (dtype, shape, offset) needed by `attach_arrays`
+    """
+    manifest = {}
+    size = 0
+    for key, array in arrays.items():
+        # keep every array 8-byte aligned
+        size += -size % 8
+        manifest[key] = (array.dtype, array.shape, size)
+        size += array.nbytes
+
+    shm = SharedMemory(create=True, size=max(size, 1))
+    for key, array in arrays.items():
+        dtype, shape, offset = manifest[key]
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+    return shm, manifest
+
+
+def attach_arrays(name, manifest):
+    """Attaches to a block created by `share_arrays` without copying
+
+    Returns
+    -------
+    tuple
+        (shm, arrays) where `arrays` are read-only views into `shm`
+    """
+    # worker processes share the resource tracker of the process that created
+    # the block, which remains responsible for unlinking it
+    shm = SharedMemory(name=name)
+    arrays = {}
+    for key, (dtype, shape, offset) in manifest.items():
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        array.flags.writeable = False
+        arrays[key] = array
+    return shm, arrays
+
+
+def _init_worker(tariff_block, profile_blocks, demand_options):
+    tariff_shm, tables = attach_arrays(*tariff_block)
+    compiled_tariffs = {}
+    for (cwns_no, utility, charge_type), table in tables.items():
+        compiled_tariffs.setdefault(cwns_no, {})[(utility, charge_type)] = table
+
+    profiles = []
+    shms = [tariff_shm]
+    for name, manifest, periods, interval_minutes in profile_blocks:
+        shm, arrays = attach_arrays(name, manifest)
+        shms.append(shm)
+        profiles.append(
+            (arrays["keys"], arrays["electric"], arrays["gas"], periods, interval_minutes)
+        )
+
+    _worker_state["shms"] = shms
+    _worker_state["tariffs"] = compiled_tariffs
+    _worker_state["profiles"] = profiles
+    _worker_state["demand_options"] = demand_options
+
+
+def _bill_chunk(task):
+    scenario, cwns_nos = task
+    keys, electric, gas, periods, interval_minutes = _worker_state["profiles"][scenario]
+    return np.stack(
+        [
+            calculate_facility_costs(
+                _worker_state["tariffs"][cwns_no],
+                keys,
+                electric,
+                gas,
+                periods,
+                interval_minutes,
+                **_worker_state["demand_options"],
+            )
+            for cwns_no in cwns_nos
+        ]
+    )
+
+
+def calculate_costs_parallel(
+    consumption_data,
+    tariffs,
+    elec_col="grid_to_plant_kW",
+    ng_col="natural_gas_therm_per_hr",
+    max_workers=None,
+    chunksize=10,
+    units="imperial",
+    **demand_options,
+):
+    """Calculates monthly costs of one or more load profiles under many
+    facilities' tariffs across a pool of worker processes
+
+    Compiled tariffs and load profiles are copied once into shared memory,
+    so each task only pickles a list of CWNS numbers. Results are identical
+    to `batch_billing.calculate_costs` regardless of the number of workers.
+
+    Parameters
+    ----------
+    consumption_data : DataFrame or list
+        Electrical and gas usage data with a 'DateTime' column, or a list
+        of such DataFrames to bill as separate scenarios
+
+    tariffs : dict
+        Dictionary of billing information (as `DataFrame`) or compiled
+        tariffs (as `dict`) keyed by CWNS number
+
+    elec_col : str
+        Name of the electricity consumption column in kW
+
+    ng_col : str
+        Name of the natural gas consumption column in therms/hr, or m3/hr
+        if `units` is 'metric'
+
+    max_workers : int
+        Number of worker processes. Defaults to the number of CPUs
+
+    chunksize : int
+        Number of facilities billed by each task
+
+    units : {'imperial', 'metric'}
+        Units of the consumption data. See `compiled_tariff.convert_tariff`
+
+    demand_options : dict
+        Demand window, peak, and ratchet options of
+        `batch_billing.calculate_facility_costs`
+
+    Returns
+    -------
+    DataFrame
+        Tidy table of costs in USD with columns 'CWNS_No', 'year', 'month',
+        'charge_type', and 'cost', with a leading 'scenario' column
+        if `consumption_data` is a list
+    """
+    scenarios = consumption_data if isinstance(consumption_data, list) else [consumption_data]
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    cwns_nos = list(tariffs.keys())
+    tables = {}
+    for cwns_no in cwns_nos:
+        tariff = ensure_compiled(tariffs[cwns_no], units)
+        for (utility, charge_type), table in tariff.items():
+            tables[(cwns_no, utility, charge_type)] = table
+
+    shms = []
+    try:
+        tariff_shm, tariff_manifest = share_arrays(tables)
+        shms.append(tariff_shm)
+        profile_blocks = []
+        all_periods = []
+        for profile in scenarios:
+            keys, electric, gas, periods, interval_minutes = prepare_profile(
+                profile, elec_col, ng_col
+            )
+            shm, manifest = share_arrays({"keys": keys, "electric": electric, "gas": gas})
+            shms.append(shm)
+            profile_blocks.append((shm.name, manifest, periods, interval_minutes))
+            all_periods.append(periods)
+
+        tasks = [
+            (scenario, cwns_nos[i : i + chunksize])
+            for scenario in range(len(scenarios))
+            for i in range(0, len(cwns_nos), chunksize)
+        ]
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=((tariff_shm.name, tariff_manifest), profile_blocks, demand_options),
+        ) as executor:
+            # `map` yields results in task order, so output is deterministic
+            chunks = list(executor.map(_bill_chunk, tasks))
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    results = []
+    nchunks = len(tasks) // len(scenarios)
+    for scenario, periods in enumerate(all_periods):
+        if nchunks == 0:
+            # no facilities to bill
+            costs = np.empty((0, periods.shape[0], len(CHARGE_TYPES)))
+        else:
+            costs = np.concatenate(chunks[scenario * nchunks : (scenario + 1) * nchunks])
+        result = tidy_costs(cwns_nos, periods, costs)
+        if isinstance(consumption_data, list):
+            result.insert(0, "scenario", scenario)
+        results.append(result)
+    return pd.concat(results, ignore_index=True)
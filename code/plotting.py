@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+# matplotlib is imported inside each function so that billing without plots
+# never imports it
+
+
+def plot_facility_costs(results, cwns_no, electric_path=None, gas_path=None):
+    """Plots the monthly electricity and natural gas costs of one facility
+    as bar charts of energy and demand charges
+
+    Parameters
+    ----------
+    results : BillingResults
+        Costs from `results.bill_facilities`
+
+    cwns_no : int
+        CWNS number of the facility to plot
+
+    electric_path : str
+        Path to save the electricity cost figure to. Not saved if None
+
+    gas_path : str
+        Path to save the natural gas cost figure to. Not saved if None
+
+    Returns
+    -------
+    tuple
+        (electric, gas) matplotlib figures
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.font_manager as font_manager
+
+    facility_costs = results.facility(cwns_no)
+    labels = list(facility_costs.index)
+    ind = np.arange(len(labels))  # the x locations for the groups
+    width = 0.4  # the width of the bars
+    arial_font = font_manager.FontProperties(family='Arial', style='normal', size=18)
+
+    figures = []
+    for utility, bars, ylabel, yticks, path in [
+        ("electric", ["energy", "demand"], "Electricity cost ($)", range(0, 11000, 1000), electric_path),
+        ("gas", ["demand", "energy"], "Natural gas cost ($)", range(0, 400, 50), gas_path),
+    ]:
+        figure = plt.figure(figsize=(8, 8))
+        ax = plt.gca()
+        ax.bar(ind, facility_costs[utility + "_" + bars[0]], width)
+        ax.bar(ind + width, facility_costs[utility + "_" + bars[1]], width)
+        ax.set_xticks(ind, labels, fontname="Arial", fontsize=16)
+        ax.set_xlabel("Month", fontname="Arial", fontsize=24)
+        ax.set_ylabel(ylabel, fontname="Arial", fontsize=24)
+        ax.legend(["Energy", "Demand"], loc="upper center", frameon=False, prop=arial_font, ncol=2)
+        plt.yticks(yticks, fontsize=18)
+        if path is not None:
+            plt.savefig(path, bbox_inches="tight")
+        figures.append(figure)
+    return tuple(figures)
+
+
+def plot_cost_distributions(results, electric_path=None, gas_path=None):
+    """Plots the distribution over facilities of the average monthly cost
+    of each charge type as violin plots
+
+    Parameters
+    ----------
+    results : BillingResults
+        Costs from `results.bill_facilities`
+
+    electric_path : str
+        Path to save the electricity violin plot to. Not saved if None
+
+    gas_path : str
+        Path to save the natural gas violin plot to. Not saved if None
+
+    Returns
+    -------
+    tuple
+        (electric, gas) matplotlib figures
+    """
+    import matplotlib.pyplot as plt
+
+    figures = []
+    for utility, labels, yticks, path in [
+        (
+            "electric",
+            ["Electric energy\ncharges", "Electric demand \n charges", "Electric customer\ncharges"],
+            np.arange(0, 51000, step=5000),
+            electric_path,
+        ),
+        (
+            "gas",
+            ["Gas energy\ncharges", "Gas demand\ncharges", "Gas customer\ncharges"],
+            np.arange(0, 3000, step=250),
+            gas_path,
+        ),
+    ]:
+        averages = pd.concat(
+            [
+                results.monthly_average(utility + "_" + charge).reset_index(drop=True)
+                for charge in ["energy", "demand", "customer"]
+            ],
+            axis=1,
+        )
+        figure = plt.figure(figsize=(8, 8))
+        plt.violinplot(averages, quantiles=[[0.25, 0.5, 0.75]] * 3)
+        ax = plt.gca()
+        ax.set_ylabel("Cost ($/month)", fontname="Arial", fontsize=24)
+        ax.set_xticks([1, 2, 3])
+        ax.set_xticklabels(labels, fontname="Arial", fontsize=20)
+        plt.yticks(yticks, fontsize=16)
+        if path is not None:
+            plt.savefig(path, bbox_inches="tight")
+        figures.append(figure)
+    return tuple(figures)
@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+from batch_billing import CHARGE_TYPES, calculate_cost_array, tidy_costs
+
+MONTH_NAMES = [
+    "Jan", "Feb", "Mar", "Apr", "May", "June", "July", "Aug", "Sept", "Oct", "Nov", "Dec"
+]
+
+
+class BillingResults:
+    """Costs of every facility, billing period, and charge type, stored in a
+    single preallocated array that is filled in place
+
+    Parameters
+    ----------
+    cwns_nos : list
+        CWNS numbers of the facilities
+
+    periods : DataFrame
+        Billing periods from `calendar_index.CalendarIndex`
+
+    costs : array
+        Costs in USD with shape (facilities, billing periods, charge types).
+        Defaults to an array of zeros to be filled with `fill`
+
+    Attributes
+    ----------
+    costs : array
+        Costs in USD with shape (facilities, billing periods, charge types)
+        in the order of `cwns_nos`, `periods`, and `batch_billing.CHARGE_TYPES`
+    """
+
+    def __init__(self, cwns_nos, periods, costs=None):
+        self.cwns_nos = list(cwns_nos)
+        self.periods = periods.reset_index(drop=True)
+        if costs is None:
+            costs = np.zeros((len(self.cwns_nos), self.periods.shape[0], len(CHARGE_TYPES)))
+        self.costs = costs
+        self._facility_index = {cwns_no: f for f, cwns_no in enumerate(self.cwns_nos)}
+
+    def fill(self, cwns_no, facility_costs):
+        """Writes the costs of one facility in place
+
+        Parameters
+        ----------
+        cwns_no : int
+            CWNS number of the facility
+
+        facility_costs : array
+            Costs in USD with shape (billing periods, charge types), e.g.
+            from `batch_billing.calculate_facility_costs`
+        """
+        self.costs[self._facility_index[cwns_no]] = facility_costs
+
+    def period_labels(self):
+        """Labels each billing period by its month name, followed by the year
+        if the billing periods span more than one year
+        """
+        labels = [MONTH_NAMES[month - 1] for month in self.periods["month"]]
+        if self.periods["year"].nunique() > 1:
+            labels = [
+                "{} {}".format(label, year) for label, year in zip(labels, self.periods["year"])
+            ]
+        return labels
+
+    def facility(self, cwns_no):
+        """Gets the costs of one facility
+
+        Returns
+        -------
+        DataFrame
+            Costs in USD with one row per billing period and one column per charge type
+        """
+        return pd.DataFrame(
+            self.costs[self._facility_index[cwns_no]],
+            index=pd.Index(self.period_labels(), name="month"),
+            columns=CHARGE_TYPES,
+        )
+
+    def to_frame(self):
+        """Gets the costs as a wide table
+
+        Returns
+        -------
+        DataFrame
+            Costs in USD indexed by ('charge_type', 'month') with one column per facility
+        """
+        index = pd.MultiIndex.from_product(
+            [self.period_labels(), CHARGE_TYPES], names=["month", "charge_type"]
+        ).swaplevel()
+        return pd.DataFrame(
+            self.costs.reshape(len(self.cwns_nos), -1).T, index=index, columns=self.cwns_nos
+        )
+
+    def to_tidy(self):
+        """Gets the costs as a tidy table. See `batch_billing.tidy_costs`"""
+        return tidy_costs(self.cwns_nos, self.periods, self.costs)
+
+    def monthly_average(self, charge_type):
+        """Averages the cost of `charge_type` over the billing periods of each facility
+
+        Returns
+        -------
+        Series
+            Average cost in USD/month indexed by CWNS number
+        """
+        return pd.Series(
+            self.costs[:, :, CHARGE_TYPES.index(charge_type)].mean(axis=1), index=self.cwns_nos
+        )
+
+    def annual_summary(self):
+        """Sums the costs of each facility over the billing periods of each year
+
+        Returns
+        -------
+        DataFrame
+            Costs in USD indexed by ('CWNS_No', 'year') with one column per
+            charge type and a 'total' column
+        """
+        years = self.periods["year"].values
+        unique_years = np.unique(years)
+        annual = np.stack(
+            [self.costs[:, years == year].sum(axis=1) for year in unique_years], axis=1
+        )
+        summary = pd.DataFrame(
+            annual.reshape(-1, len(CHARGE_TYPES)),
+            index=pd.MultiIndex.from_product(
+                [self.cwns_nos, unique_years], names=["CWNS_No", "year"]
+            ),
+            columns=CHARGE_TYPES,
+        )
+        summary["total"] = summary.sum(axis=1)
+        return summary
+
+    def save(self, path):
+        """Saves the costs to `path` in a format chosen by its extension:
+        '.npz' (columnar arrays), '.parquet' (tidy table, requires pyarrow),
+        or '.csv' (tidy table)
+
+        Raises
+        ------
+        ValueError
+            When the extension of `path` is not supported
+        """
+        if path.endswith(".npz"):
+            np.savez(
+                path,
+                cwns_nos=np.asarray(self.cwns_nos),
+                charge_types=np.asarray(CHARGE_TYPES),
+                costs=self.costs,
+                **{column: self.periods[column].values for column in self.periods.columns}
+            )
+        elif path.endswith(".parquet"):
+            self.to_tidy().to_parquet(path, index=False)
+        elif path.endswith(".csv"):
+            self.to_tidy().to_csv(path, index=False)
+        else:
+            raise ValueError("Unsupported results format: " + path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads costs saved by `save` as '.npz'"""
+        with np.load(path) as arrays:
+            periods = pd.DataFrame(
+                {column: arrays[column] for column in ["year", "month", "start", "end"]}
+            )
+            return cls(list(arrays["cwns_nos"]), periods, arrays["costs"])
+
+
+def bill_facilities(
+    consumption_data,
+    tariffs,
+    elec_col="grid_to_plant_kW",
+    ng_col="natural_gas_therm_per_hr",
+    units="imperial",
+    **demand_options,
+):
+    """Calculates monthly costs of one load profile under many facilities' tariffs
+    as `BillingResults`
+
+    Parameters
+    ----------
+    consumption_data : DataFrame
+        Electrical and gas usage data with a 'DateTime' column.
+        See 'data/synthetic_energy_data.csv' for an example.
+
+    tariffs : dict
+        Dictionary of billing information (as `DataFrame`) or compiled
+        tariffs in imperial units (as `dict`) keyed by CWNS number
+
+    elec_col : str
+        Name of the electricity consumption column in kW
+
+    ng_col : str
+        Name of the natural gas consumption column in therms/hr, or m3/hr
+        if `units` is 'metric'
+
+    units : {'imperial', 'metric'}
+        Units of the consumption data. See `compiled_tariff.convert_tariff`
+
+    demand_options : dict
+        Demand window, peak, and ratchet options of
+        `batch_billing.calculate_facility_costs`
+
+    Returns
+    -------
+    BillingResults
+        Costs of every facility, billing period, and charge type, identical
+        to `batch_billing.calculate_costs`
+    """
+    costs, periods = calculate_cost_array(
+        consumption_data, tariffs, elec_col, ng_col, units, **demand_options
+    )
+    return BillingResults(list(tariffs.keys()), periods, costs)
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+from collections import deque
+from billing import calculate_peak_demands
+from calendar_index import CalendarIndex
+from compiled_tariff import ensure_compiled
+from batch_billing import (
+    CHARGE_TYPES,
+    calculate_facility_costs,
+    ratchet_peaks,
+    ratcheted_demand_cost,
+    tidy_costs,
+)
+
+
+def iter_billing_periods(source, chunksize=100000, date_col="DateTime"):
+    """Yields a load profile one monthly billing period at a time, so that
+    at most one billing period (plus one chunk) is held in memory
+
+    Parameters
+    ----------
+    source : str or iterable
+        Path to a CSV file of consumption data, or an iterable of DataFrames
+        (e.g. record batches of a Parquet file converted with `to_pandas`)
+        in chronological order
+
+    chunksize : int
+        Number of rows read from the CSV file at a time
+
+    date_col : str
+        Name of the datetime column
+
+    Yields
+    ------
+    DataFrame
+        Consumption data of a single billing period with a parsed `date_col`
+    """
+    if isinstance(source, str):
+        source = pd.read_csv(source, chunksize=chunksize)
+
+    pieces = []
+    for chunk in source:
+        if chunk.shape[0] == 0:
+            continue
+        chunk = chunk.reset_index(drop=True)
+        chunk[date_col] = pd.to_datetime(chunk[date_col])
+        period_ids = (chunk[date_col].dt.year * 12 + chunk[date_col].dt.month).values
+        if pieces and pieces[-1]["period_id"] != period_ids[0]:
+            yield pd.concat([piece["data"] for piece in pieces], ignore_index=True)
+            pieces = []
+
+        starts = np.flatnonzero(np.diff(period_ids, prepend=period_ids[0] - 1))
+        ends = np.append(starts[1:], len(period_ids))
+        for start, end in zip(starts[:-1], ends[:-1]):
+            pieces.append({"period_id": period_ids[start], "data": chunk.iloc[start:end]})
+            yield pd.concat([piece["data"] for piece in pieces], ignore_index=True)
+            pieces = []
+        # the last period of the chunk may continue into the next chunk
+        pieces.append({"period_id": period_ids[starts[-1]], "data": chunk.iloc[starts[-1]:]})
+
+    if pieces:
+        yield pd.concat([piece["data"] for piece in pieces], ignore_index=True)
+
+
+def calculate_costs_streaming(
+    source,
+    tariffs,
+    elec_col="grid_to_plant_kW",
+    ng_col="natural_gas_therm_per_hr",
+    chunksize=100000,
+    units="imperial",
+    ratchet_fraction=0,
+    ratchet_months=11,
+    **demand_options,
+):
+    """Calculates monthly costs of a long load profile under many facilities'
+    tariffs, reading and billing one billing period at a time
+
+    Parameters
+    ----------
+    source : str or iterable
+        Path to a CSV file of consumption data, or an iterable of DataFrames.
+        See `iter_billing_periods`
+
+    tariffs : dict
+        Dictionary of billing information (as `DataFrame`) or compiled
+        tariffs in imperial units (as `dict`) keyed by CWNS number
+
+    elec_col : str
+        Name of the electricity consumption column in kW
+
+    ng_col : str
+        Name of the natural gas consumption column in therms/hr, or m3/hr
+        if `units` is 'metric'
+
+    chunksize : int
+        Number of rows read from the CSV file at a time
+
+    units : {'imperial', 'metric'}
+        Units of the consumption data. See `compiled_tariff.convert_tariff`
+
+    ratchet_fraction : float
+        Fraction of the peak demand of the preceding `ratchet_months` billing
+        periods that is billed at minimum. Only the peak demands of those billing
+        periods are kept. Defaults to no ratchet
+
+    ratchet_months : int
+        Number of preceding months of the demand ratchet
+
+    demand_options : dict
+        Demand window and peak options of `batch_billing.calculate_facility_costs`
+
+    Returns
+    -------
+    DataFrame
+        Tidy table of costs in USD identical to `batch_billing.calculate_costs`
+    """
+    cwns_nos = list(tariffs.keys())
+    compiled_tariffs = {
+        cwns_no: ensure_compiled(tariffs[cwns_no], units) for cwns_no in cwns_nos
+    }
+    # peak demands of the preceding billing periods of each facility and utility
+    trailing_peaks = {}
+
+    all_periods = []
+    all_costs = []
+    for period_data in iter_billing_periods(source, chunksize=chunksize):
+        # each billing period is used once, so its calendar is not cached
+        calendar = CalendarIndex(period_data["DateTime"])
+        consumption = {
+            "electric": period_data[elec_col].to_numpy(dtype=float),
+            "gas": period_data[ng_col].to_numpy(dtype=float),
+        }
+        period_id = calendar.periods["year"].values[0] * 12 + calendar.periods["month"].values[0]
+        period_costs = np.empty((len(cwns_nos), 1, len(CHARGE_TYPES)))
+        for f, cwns_no in enumerate(cwns_nos):
+            compiled_tariff = compiled_tariffs[cwns_no]
+            period_costs[f] = calculate_facility_costs(
+                compiled_tariff,
+                calendar.keys,
+                consumption["electric"],
+                consumption["gas"],
+                calendar.periods,
+                calendar.interval_minutes,
+                **demand_options,
+            )
+            if not ratchet_fraction:
+                continue
+            for utility in ["electric", "gas"]:
+                limits, rates, demands = calculate_peak_demands(
+                    compiled_tariff[(utility, "demand")][calendar.keys],
+                    consumption[utility],
+                    interval_minutes=calendar.interval_minutes,
+                    **demand_options,
+                )
+                history = trailing_peaks.setdefault((cwns_no, utility), deque())
+                while history and history[0][0] < period_id - ratchet_months:
+                    history.popleft()
+                peaks = ratchet_peaks(rates, demands)
+                minimum = (
+                    ratchet_fraction * np.max([past for _, past in history], axis=0)
+                    if history
+                    else np.zeros_like(peaks)
+                )
+                period_costs[f, 0, CHARGE_TYPES.index(utility + "_demand")] = (
+                    ratcheted_demand_cost(limits, rates, demands, minimum)
+                )
+                history.append((period_id, peaks))
+        all_costs.append(period_costs)
+        all_periods.append(calendar.periods)
+
+    periods = pd.concat(all_periods, ignore_index=True)
+    return tidy_costs(cwns_nos, periods, np.concatenate(all_costs, axis=1))
@@ -0,0 +1,212 @@
+import os
+import hashlib
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+from instrumentation import timed, count
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BILLING_PATH = os.path.join(REPO_DIR, "data", "WWTP_Billing.xlsx")
+CACHE_VERSION = 1
+
+
+def default_cache_path(workbook_path):
+    """Returns the path of the compiled cache that sits next to `workbook_path`,
+    e.g. 'data/WWTP_Billing.xlsx' -> 'data/WWTP_Billing.npz'
+    """
+    return os.path.splitext(workbook_path)[0] + ".npz"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Computes the SHA-256 hex digest of the file at `path`"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+@timed("parse_workbook")
+def _compile_workbook(workbook_path, cache_path, stat, digest):
+    """Parses every sheet of `workbook_path` in a single pass and writes the
+    concatenated columns as typed arrays to `cache_path`
+
+    Returns
+    -------
+    dict
+        Dictionary of DataFrames keyed by CWNS number (as `int`)
+    """
+    with warnings.catch_warnings():
+        # suppress superfluous openpyxl warnings
+        warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
+        sheets = pd.read_excel(workbook_path, sheet_name=None)
+
+    names = list(sheets.keys())
+    columns = list(sheets[names[0]].columns)
+    lengths = np.array([sheets[name].shape[0] for name in names], dtype=np.int64)
+    combined = pd.concat([sheets[name] for name in names], ignore_index=True)
+
+    arrays = {
+        "cwns_no": np.array([int(name) for name in names], dtype=np.int64),
+        "offsets": np.concatenate([[0], np.cumsum(lengths)]),
+        "columns": np.array(columns, dtype=str),
+        "source": np.array(
+            [str(stat.st_mtime_ns), str(stat.st_size), digest, str(CACHE_VERSION)]
+        ),
+    }
+    for i, col in enumerate(columns):
+        values = combined[col]
+        if pd.api.types.is_numeric_dtype(values):
+            arrays["col%d" % i] = values.to_numpy(dtype=float)
+        else:
+            # store strings as integer codes into a table of unique labels,
+            # with -1 marking missing values
+            codes, labels = pd.factorize(values)
+            arrays["col%d" % i] = codes.astype(np.int32)
+            arrays["labels%d" % i] = np.array(labels, dtype=str)
+
+    _write_cache(cache_path, arrays)
+    return {int(name): sheets[name] for name in names}
+
+
+def _write_cache(cache_path, arrays):
+    """Writes `arrays` to a uniquely named temporary file next to `cache_path`
+    and moves it into place, so that concurrent rebuilds never share a
+    temporary file and readers never see a partial cache
+    """
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(cache_path) or ".", suffix=".tmp.npz", delete=False
+    ) as f:
+        tmp_path = f.name
+        try:
+            np.savez(f, **arrays)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, cache_path)
+
+
+@timed("read_tariff_cache")
+def _read_cache(cache_path, cwns_nos=None):
+    """Reads the cache written by `_compile_workbook` into a dictionary
+    of DataFrames keyed by CWNS number, optionally only for `cwns_nos`
+    """
+    with np.load(cache_path, allow_pickle=False) as npz:
+        cached_cwns_nos = npz["cwns_no"]
+        offsets = npz["offsets"]
+        columns = list(npz["columns"])
+        data = {}
+        for i, col in enumerate(columns):
+            values = npz["col%d" % i]
+            if "labels%d" % i in npz.files:
+                labels = np.append(npz["labels%d" % i].astype(object), np.nan)
+                # code -1 indexes the trailing NaN
+                values = labels[values]
+            data[col] = values
+
+    tariffs = {}
+    for j, cwns_no in enumerate(cached_cwns_nos):
+        if cwns_nos is not None and int(cwns_no) not in cwns_nos:
+            continue
+        start, end = offsets[j], offsets[j + 1]
+        sheet = {}
+        for col in columns:
+            values = data[col][start:end]
+            # `read_excel` returns an empty text column as float NaN
+            if values.dtype == object and pd.isna(values).all():
+                values = values.astype(float)
+            sheet[col] = values
+        tariffs[int(cwns_no)] = pd.DataFrame(sheet)
+    return tariffs
+
+
+def _select(tariffs, cwns_nos):
+    """Orders `tariffs` as `cwns_nos`, raising a KeyError for any missing facility"""
+    if cwns_nos is None:
+        return tariffs
+    return {cwns_no: tariffs[cwns_no] for cwns_no in cwns_nos}
+
+
+def _cache_source(cache_path):
+    """Returns (mtime_ns, size, sha256, version) recorded in the cache header,
+    or None if the cache is missing or unreadable
+    """
+    try:
+        with np.load(cache_path, allow_pickle=False) as npz:
+            mtime_ns, size, digest, version = npz["source"]
+    except (OSError, KeyError, ValueError):
+        return None
+    return int(mtime_ns), int(size), str(digest), int(version)
+
+
+def _update_header(cache_path, stat, digest):
+    """Rewrites the source header of an existing cache with a new mtime
+    so that subsequent loads skip hashing the workbook
+    """
+    with np.load(cache_path, allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    arrays["source"] = np.array(
+        [str(stat.st_mtime_ns), str(stat.st_size), digest, str(CACHE_VERSION)]
+    )
+    _write_cache(cache_path, arrays)
+
+
+@timed()
+def load_tariffs(workbook_path=BILLING_PATH, cache_path=None, rebuild=False, cwns_nos=None):
+    """Loads the tariff of every facility in `workbook_path`, using a compiled
+    `.npz` cache that is rebuilt only when the workbook changes
+
+    Parameters
+    ----------
+    workbook_path : str
+        Path to the billing workbook with one sheet per CWNS number.
+        Defaults to 'data/WWTP_Billing.xlsx'
+
+    cache_path : str
+        Path to the compiled cache. Defaults to the workbook path with
+        an `.npz` extension
+
+    rebuild : bool
+        Force the workbook to be reparsed even if the cache is current
+
+    cwns_nos : list
+        CWNS numbers of the facilities to load. Defaults to every facility.
+        Loading only the facilities needed saves building the other DataFrames
+
+    Raises
+    ------
+    KeyError
+        When a CWNS number in `cwns_nos` is not in the workbook
+
+    Returns
+    -------
+    dict
+        Dictionary of DataFrames keyed by CWNS number (as `int`), each
+        identical to `pd.read_excel(workbook_path, sheet_name=str(cwns_no))`
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(workbook_path)
+    if cwns_nos is not None:
+        cwns_nos = [int(cwns_no) for cwns_no in cwns_nos]
+
+    stat = os.stat(workbook_path)
+    source = None if rebuild else _cache_source(cache_path)
+    if source is not None and source[3] == CACHE_VERSION:
+        if source[0] == stat.st_mtime_ns and source[1] == stat.st_size:
+            count("tariff_cache_hits")
+            return _select(_read_cache(cache_path, cwns_nos), cwns_nos)
+        # mtime changed (e.g. fresh checkout), so fall back to content hash
+        digest = file_hash(workbook_path)
+        if digest == source[2]:
+            count("tariff_cache_hits")
+            tariffs = _read_cache(cache_path, cwns_nos)
+            _update_header(cache_path, stat, digest)
+            return _select(tariffs, cwns_nos)
+    else:
+        digest = file_hash(workbook_path)
+
+    count("tariff_cache_misses")
+    return _select(_compile_workbook(workbook_path, cache_path, stat, digest), cwns_nos)
+
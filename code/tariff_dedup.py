@@ -0,0 +1,204 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from batch_billing import CHARGE_TYPES, calculate_facility_costs, prepare_profile
+from compiled_tariff import convert_tariff, ensure_compiled
+
+UTILITIES = ["electric", "gas"]
+
+
+def utility_fingerprint(compiled_tariff, utility):
+    """Hashes the compiled charge tables of one utility
+
+    Compiled tables hold the charges at every (month, weekday, 15-minute slot),
+    so the fingerprint does not depend on the names of the periods or on how a
+    time window is split across rows, and two tariffs with equal fingerprints bill
+    identically. It does depend on the order of the rows of the billing
+    information, which sets the order of the demand charge columns and the order
+    in which overlapping energy charges are summed, so the same charges listed
+    in a different order may have different fingerprints.
+
+    Parameters
+    ----------
+    compiled_tariff : dict
+        Billing information compiled by `compiled_tariff.compile_tariff`
+
+    utility : {'electric', 'gas'}
+        Utility of the charge tables to hash
+
+    Returns
+    -------
+    str
+        SHA-1 hex digest of the customer, demand, and energy charge tables
+    """
+    sha = hashlib.sha1()
+    for charge_type in ["customer", "demand", "energy"]:
+        table = np.asarray(compiled_tariff[(utility, charge_type)])
+        # the basic charge limits are the field names of the structured tables
+        sha.update(repr((charge_type, table.dtype.descr, table.shape)).encode())
+        sha.update(np.ascontiguousarray(table).tobytes())
+    return sha.hexdigest()
+
+
+class TariffRegistry:
+    """Facilities' tariffs with identical rate structures collapsed into shared objects
+
+    Each utility's charge tables are fingerprinted with `utility_fingerprint`, and
+    facilities with the same fingerprint share one set of tables. Batch billing then
+    evaluates each unique rate structure once per load profile and fans the costs
+    out to every facility that uses it.
+
+    Parameters
+    ----------
+    tariffs : dict
+        Billing information (as `DataFrame`), `tariff_model.Tariff`, or compiled
+        tariffs (as `dict`) keyed by CWNS number
+
+    Attributes
+    ----------
+    cwns_nos : list
+        CWNS numbers of the facilities
+
+    fingerprints : dict
+        Fingerprint of the charge tables of each facility, in the order of
+        `cwns_nos`, keyed by utility
+
+    unique : dict
+        Compiled tariff of one facility with each fingerprint, keyed by
+        (utility, fingerprint)
+
+    tariffs : dict
+        Compiled tariff of each facility keyed by CWNS number, built from the
+        shared tables, so that facilities with identical electric and gas
+        charges share the same object
+    """
+
+    def __init__(self, tariffs):
+        self.cwns_nos = list(tariffs.keys())
+        self.fingerprints = {utility: [] for utility in UTILITIES}
+        self.unique = {}
+        self.tariffs = {}
+        combined = {}
+        for cwns_no, tariff in tariffs.items():
+            tariff = ensure_compiled(tariff)
+            key = []
+            for utility in UTILITIES:
+                fingerprint = utility_fingerprint(tariff, utility)
+                self.fingerprints[utility].append(fingerprint)
+                self.unique.setdefault((utility, fingerprint), tariff)
+                key.append(fingerprint)
+            key = tuple(key)
+            if key not in combined:
+                combined[key] = {
+                    (utility, charge_type): self.unique[(utility, fingerprint)][
+                        (utility, charge_type)
+                    ]
+                    for utility, fingerprint in zip(UTILITIES, key)
+                    for charge_type in ["customer", "demand", "energy"]
+                }
+            self.tariffs[cwns_no] = combined[key]
+
+    def groups(self, utility):
+        """Gets the facilities sharing each rate structure of `utility`
+
+        Returns
+        -------
+        dict
+            List of CWNS numbers keyed by fingerprint, in order of first appearance
+        """
+        groups = {}
+        for cwns_no, fingerprint in zip(self.cwns_nos, self.fingerprints[utility]):
+            groups.setdefault(fingerprint, []).append(cwns_no)
+        return groups
+
+    def report(self):
+        """Reports how many facilities share each utility's rate structures
+
+        Returns
+        -------
+        DataFrame
+            One row per utility, plus 'facility' for the combined electric and gas
+            tariff, with the number of 'facilities', the number of 'unique' rate
+            structures, the 'dedup_ratio' of the two, and the size of the
+            'largest_group' of facilities sharing one rate structure
+        """
+        keys = {utility: self.fingerprints[utility] for utility in UTILITIES}
+        keys["facility"] = list(zip(*[self.fingerprints[utility] for utility in UTILITIES]))
+        rows = []
+        for name, fingerprints in keys.items():
+            counts = pd.Series(fingerprints, dtype=object).value_counts().values
+            rows.append(
+                {
+                    "facilities": len(fingerprints),
+                    "unique": len(counts),
+                    "dedup_ratio": len(fingerprints) / max(len(counts), 1),
+                    "largest_group": counts.max() if len(counts) else 0,
+                }
+            )
+        return pd.DataFrame(rows, index=pd.Index(list(keys), name="utility"))
+
+    def calculate_costs(
+        self,
+        consumption_data,
+        elec_col="grid_to_plant_kW",
+        ng_col="natural_gas_therm_per_hr",
+        units="imperial",
+        **demand_options,
+    ):
+        """Calculates monthly costs of one load profile for every facility,
+        billing each unique rate structure once
+
+        Parameters
+        ----------
+        consumption_data : DataFrame
+            Electrical and gas usage data with a 'DateTime' column.
+            See 'data/synthetic_energy_data.csv' for an example.
+
+        elec_col : str
+            Name of the electricity consumption column in kW
+
+        ng_col : str
+            Name of the natural gas consumption column in therms/hr, or m3/hr
+            if `units` is 'metric'
+
+        units : {'imperial', 'metric'}
+            Units of the consumption data. The rates of each unique rate structure
+            are converted once by `compiled_tariff.convert_tariff`
+
+        demand_options : dict
+            Demand window, peak, and ratchet options of
+            `batch_billing.calculate_facility_costs`
+
+        Returns
+        -------
+        BillingResults
+            Costs of every facility, identical to `results.bill_facilities`
+        """
+        from results import BillingResults
+
+        keys, electric, gas, periods, interval_minutes = prepare_profile(
+            consumption_data, elec_col, ng_col
+        )
+        results = BillingResults(self.cwns_nos, periods)
+        rows = {cwns_no: f for f, cwns_no in enumerate(self.cwns_nos)}
+        for utility in UTILITIES:
+            columns = [
+                CHARGE_TYPES.index(utility + "_" + charge_type)
+                for charge_type in ["customer", "demand", "energy"]
+            ]
+            for fingerprint, cwns_nos in self.groups(utility).items():
+                costs = calculate_facility_costs(
+                    convert_tariff(self.unique[(utility, fingerprint)], units),
+                    keys,
+                    electric,
+                    gas,
+                    periods,
+                    interval_minutes,
+                    utilities=[utility],
+                    **demand_options,
+                )
+                # fan the costs of the rate structure out to every facility using it
+                facilities = [rows[cwns_no] for cwns_no in cwns_nos]
+                block = np.ix_(facilities, np.arange(periods.shape[0]), columns)
+                results.costs[block] = costs[:, columns]
+        return results
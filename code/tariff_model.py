@@ -0,0 +1,444 @@
+import numpy as np
+
+# one record per demand or energy charge, with the basic charge limit stored as
+# the index of its tier and each time window as numbers
+CHARGE_DTYPE = np.dtype(
+    [
+        ("tier", np.int32),
+        ("column", np.int32),
+        ("period", np.int32),
+        ("month_start", np.int8),
+        ("month_end", np.int8),
+        ("weekday_start", np.int8),
+        ("weekday_end", np.int8),
+        ("hour_start", np.float64),
+        ("hour_end", np.float64),
+        ("charge", np.float64),
+    ]
+)
+
+
+class TieredCharges:
+    """Charges at each point in time of every tier of a demand or energy charge
+
+    A typed alternative to the structured arrays returned by
+    `billing.get_charge_array`, with the basic charge limits stored as numbers
+    instead of field names. `billing.calculate_cost` accepts either.
+
+    Parameters
+    ----------
+    limits : array
+        Basic charge limit of each tier in ascending order
+
+    rates : list
+        Charges of each tier, as an array of shape (points, columns)
+        for demand charges or (points,) for energy charges
+    """
+
+    __slots__ = ("limits", "rates")
+
+    def __init__(self, limits, rates):
+        self.limits = np.asarray(limits, dtype=float)
+        self.rates = list(rates)
+
+    def __len__(self):
+        return len(self.rates[0])
+
+    def __getitem__(self, index):
+        return TieredCharges(self.limits, [rates[index] for rates in self.rates])
+
+    @classmethod
+    def from_structured(cls, charges):
+        """Converts a structured array from `billing.get_charge_array`"""
+        names = charges.dtype.names
+        return cls([float(name) for name in names], [charges[name] for name in names])
+
+    def to_structured(self):
+        """Converts to a structured array identical to `billing.get_charge_array`"""
+        # demand charges are 2-D structured arrays with one column per charge period
+        charge_array = np.empty(
+            self.rates[0].shape, dtype=[(str(limit), float) for limit in self.limits]
+        )
+        for limit, rates in zip(self.limits, self.rates):
+            charge_array[str(limit)] = rates
+        return charge_array
+
+
+class ChargeTensor:
+    """Charges of every tier of a demand or energy charge as one contiguous
+    (tiers, columns, points) array with a separate vector of basic charge limits
+
+    Every tier has the columns of the first tier, as in `billing.get_charge_array`,
+    and energy charges have a single column. Since the charges of each column are
+    contiguous in time, slicing points and reading a column are views rather than
+    copies, and the array can be shared with Arrow without copying (see `to_arrow`).
+    `billing.calculate_cost` accepts it in place of a structured array.
+
+    Parameters
+    ----------
+    limits : array
+        Basic charge limit of each tier in ascending order
+
+    values : array
+        Charges with shape (tiers, columns, points)
+
+    charge_type : {'demand', 'energy'}
+        Type of charge
+    """
+
+    __slots__ = ("limits", "values", "charge_type")
+
+    def __init__(self, limits, values, charge_type="demand"):
+        if charge_type not in ["demand", "energy"]:
+            raise ValueError("Invalid charge_type: " + charge_type)
+        self.limits = np.asarray(limits, dtype=float)
+        self.values = values
+        self.charge_type = charge_type
+
+    def __len__(self):
+        return self.values.shape[2]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ChargeTensor(self.limits, self.values[:, :, index], self.charge_type)
+        # fancy indexing the last axis would leave the points strided
+        return ChargeTensor(self.limits, np.take(self.values, index, axis=2), self.charge_type)
+
+    @property
+    def rates(self):
+        """Charges of each tier as (points, columns) views for demand charges
+        or (points,) views for energy charges
+        """
+        if self.charge_type == "energy":
+            return [tier_values[0] for tier_values in self.values]
+        return [tier_values.T for tier_values in self.values]
+
+    @classmethod
+    def from_charges(cls, charges, charge_type="demand", dtype=np.float64):
+        """Converts a structured array from `billing.get_charge_array` or `TieredCharges`
+
+        Parameters
+        ----------
+        charges : array or TieredCharges
+            Demand or energy charges
+
+        charge_type : {'demand', 'energy'}
+            Type of charge in `charges`
+
+        dtype : dtype
+            Floating point type of the charges, e.g. `np.float32` to halve the memory
+
+        Returns
+        -------
+        ChargeTensor
+            Charges with the same limits and values as `charges`
+        """
+        limits, rates = tier_arrays(charges)
+        npoints = len(rates[0])
+        ncolumns = 1 if charge_type == "energy" else rates[0].reshape(npoints, -1).shape[1]
+        values = np.empty((len(limits), ncolumns, npoints), dtype=dtype)
+        for j, tier_rates in enumerate(rates):
+            # later tiers broadcast to the columns of the first tier
+            values[j] = np.broadcast_to(tier_rates.reshape(npoints, -1), (npoints, ncolumns)).T
+        return cls(limits, values, charge_type)
+
+    def to_structured(self):
+        """Converts to a structured array identical to `billing.get_charge_array`"""
+        return TieredCharges(self.limits, self.rates).to_structured()
+
+    def to_arrow(self):
+        """Exports the charges to Arrow without copying them
+
+        Only C-contiguous `values` are shared, as built by `from_charges` or
+        `compiled_tariff.get_compiled_charge_array`. A slice of the points, e.g. a
+        single billing period, is not contiguous and is copied once, so export
+        the whole tensor and slice the Arrow data instead to avoid the copy.
+        Requires pyarrow, which is not a dependency of this repository
+
+        Returns
+        -------
+        pyarrow.RecordBatch
+            One row per (tier, column) with its 'tier', 'limit', and 'column', and
+            the 'charges' at every point as a fixed-size list backed by `values`
+        """
+        import pyarrow as pa
+
+        ntiers, ncolumns, npoints = self.values.shape
+        # copies only when `values` is a slice of a larger tensor
+        values = np.ascontiguousarray(self.values)
+        flat = pa.Array.from_buffers(
+            pa.from_numpy_dtype(values.dtype), values.size, [None, pa.py_buffer(values)]
+        )
+        return pa.RecordBatch.from_arrays(
+            [
+                pa.array(np.repeat(np.arange(ntiers), ncolumns)),
+                pa.array(np.repeat(self.limits, ncolumns)),
+                pa.array(np.tile(np.arange(ncolumns), ntiers)),
+                pa.FixedSizeListArray.from_arrays(flat, npoints),
+            ],
+            names=["tier", "limit", "column", "charges"],
+            metadata={"charge_type": self.charge_type},
+        )
+
+    @classmethod
+    def from_arrow(cls, batch):
+        """Imports charges exported by `to_arrow` without copying them
+
+        Returns
+        -------
+        ChargeTensor
+            Read-only charges backed by the buffers of `batch`
+        """
+        limits = batch.column("limit").to_numpy()
+        ntiers = len(np.unique(batch.column("tier").to_numpy()))
+        charges = batch.column("charges")
+        values = charges.flatten().to_numpy(zero_copy_only=True)
+        charge_type = batch.schema.metadata[b"charge_type"].decode()
+        return cls(
+            limits[:: len(limits) // ntiers],
+            values.reshape(ntiers, len(limits) // ntiers, charges.type.list_size),
+            charge_type,
+        )
+
+
+def tier_arrays(charges):
+    """Gets the numeric basic charge limits and the charges of each tier
+
+    Parameters
+    ----------
+    charges : TieredCharges, ChargeTensor, or array
+        Charges from `TieredCharges`, `ChargeTensor`, or a structured array
+        from `billing.get_charge_array`
+
+    Returns
+    -------
+    tuple
+        (limits, rates) with a float limit and an array of charges for each tier
+    """
+    if isinstance(charges, (TieredCharges, ChargeTensor)):
+        return list(charges.limits), charges.rates
+    names = charges.dtype.names
+    return [float(name) for name in names], [charges[name] for name in names]
+
+
+class Tariff:
+    """Compact, typed billing information of a single facility
+
+    The rows of each (utility, charge type) are stored once as a record array of
+    `CHARGE_DTYPE`, so evaluating the tariff needs no per-row DataFrame access.
+
+    Parameters
+    ----------
+    customer : dict
+        Array of customer charges in USD/month keyed by utility
+
+    charges : dict
+        Record array of `CHARGE_DTYPE` keyed by (utility, charge_type)
+
+    limits : dict
+        Array of the basic charge limits of each tier keyed by (utility, charge_type)
+
+    periods : dict
+        Names of the demand charge periods, indexed by the 'period' field
+        (-1 for no name), keyed by (utility, charge_type)
+    """
+
+    __slots__ = ("customer", "charges", "limits", "periods")
+
+    def __init__(self, customer, charges, limits, periods):
+        self.customer = customer
+        self.charges = charges
+        self.limits = limits
+        self.periods = periods
+
+    @classmethod
+    def from_frame(cls, rate_data):
+        """Builds the tariff from billing information
+
+        Parameters
+        ----------
+        rate_data : DataFrame
+            Electric and gas billing information.
+            See `billing.get_charge_array` for a description of the columns
+
+        Raises
+        ------
+        IndexError
+            When the rows of a basic charge limit are not contiguous, which
+            `billing.get_charge_array` does not support either
+
+        Returns
+        -------
+        Tariff
+            Tariff whose charges are identical to those of `billing.get_charge_array`
+        """
+        customer, charges, limits, periods = {}, {}, {}, {}
+        for utility in ["electric", "gas"]:
+            rows = rate_data.loc[rate_data["utility"] == utility, :]
+            customer[utility] = rows.loc[rows["type"] == "customer", "charge (imperial)"].values
+            for charge_type in ["demand", "energy"]:
+                key = (utility, charge_type)
+                rows_of_type = rows.loc[rows["type"] == charge_type, :]
+                charges[key], limits[key], periods[key] = _compile_rows(rows_of_type, charge_type)
+        return cls(customer, charges, limits, periods)
+
+    @classmethod
+    def from_rows(cls, rows, charge_type, utility="electric"):
+        """Builds a tariff with only the demand or energy charges of one utility
+
+        Parameters
+        ----------
+        rows : DataFrame
+            Rows of the billing information for `utility` and `charge_type`,
+            e.g. those evaluated by `billing.build_charge_array`
+
+        charge_type : {'demand', 'energy'}
+            Type of charge in `rows`
+
+        utility : {'electric', 'gas'}
+            Utility of `rows`
+
+        Raises
+        ------
+        IndexError
+            When the rows of a basic charge limit are not contiguous
+
+        Returns
+        -------
+        Tariff
+            Tariff whose `get_charges` of `utility` and `charge_type` are identical
+            to those of `billing.build_charge_array`
+        """
+        key = (utility, charge_type)
+        records, limits, periods = _compile_rows(rows, charge_type)
+        return cls({}, {key: records}, {key: limits}, {key: periods})
+
+    def get_charges(self, charge_type, months, weekdays, hours, utility="electric"):
+        """Evaluates the charges at each (month, weekday, hour) point
+
+        Parameters
+        ----------
+        charge_type : {'customer', 'demand', 'energy'}
+            Type of charge to look up
+
+        months : array
+            Month {1-12} of each point
+
+        weekdays : array
+            Weekday {0-6} of each point
+
+        hours : array
+            Fractional hour of day {0-24} of each point
+
+        utility : {'electric', 'gas'}
+            Type of utility to look up
+
+        Raises
+        ------
+        ValueError
+            When invalid `charge_type` is entered
+
+        Returns
+        -------
+        array or TieredCharges
+            Customer charges, or the charges of every tier at each point
+        """
+        if charge_type == "customer":
+            return self.customer[utility]
+        if charge_type not in ["demand", "energy"]:
+            raise ValueError("Invalid charge_type: " + charge_type)
+
+        charges = self.charges[(utility, charge_type)]
+        limits = self.limits[(utility, charge_type)]
+        npoints = len(months)
+        if len(charges) == 0:
+            shape = (npoints, 1) if charge_type == "demand" else (npoints,)
+            return TieredCharges([0.0], [np.zeros(shape)])
+
+        # (charges, points) mask of where each charge applies
+        months = np.asarray(months)[None, :]
+        weekdays = np.asarray(weekdays)[None, :]
+        hours = np.asarray(hours)[None, :]
+        apply_charge = (
+            (months >= charges["month_start"][:, None])
+            & (months <= charges["month_end"][:, None])
+            & (weekdays >= charges["weekday_start"][:, None])
+            & (weekdays <= charges["weekday_end"][:, None])
+            & (hours >= charges["hour_start"][:, None])
+            & (hours < charges["hour_end"][:, None])
+        )
+
+        rates = []
+        for tier in range(len(limits)):
+            in_tier = np.flatnonzero(charges["tier"] == tier)
+            if charge_type == "energy":
+                # summed in row order so that overlapping charges add up identically
+                data = np.zeros(npoints)
+                for row in in_tier:
+                    data += apply_charge[row] * charges["charge"][row]
+                rates.append(data)
+                continue
+            data = np.zeros((npoints, len(in_tier)))
+            for column in np.unique(charges["column"][in_tier]):
+                in_column = in_tier[charges["column"][in_tier] == column]
+                # a charge period is the union of the first and the last charge of
+                # the period at the rate of the last, see `billing.build_charge_array`
+                first, last = in_column[0], in_column[-1]
+                data[:, column] = (
+                    apply_charge[first] | apply_charge[last]
+                ) * charges["charge"][last]
+            if rates:
+                # every tier shares the columns of the first tier, so a tier with
+                # a single charge applies to each of them
+                data = np.array(np.broadcast_to(data, rates[0].shape))
+            rates.append(data)
+        return TieredCharges(limits, rates)
+
+
+def _compile_rows(charges, charge_type):
+    """Converts the rows of one utility and charge type into a record array
+
+    Returns
+    -------
+    tuple
+        (records, limits, period_names)
+    """
+    # imported here so that evaluating a built tariff does not need pandas
+    import pandas as pd
+
+    limits = np.unique(charges["basic_charge_limit (imperial)"].values)
+    records = np.zeros(charges.shape[0], dtype=CHARGE_DTYPE)
+    if charges.shape[0] == 0:
+        return records, limits, []
+
+    periods = charges["period"].values
+    codes, period_names = pd.factorize(periods)
+    # column of each demand charge, resolved exactly as in `billing.build_charge_array`
+    columns = np.zeros(charges.shape[0], dtype=np.int32)
+    order = []
+    for tier, limit in enumerate(limits):
+        positions = np.flatnonzero(charges["basic_charge_limit (imperial)"].values == limit)
+        labels = charges.index.values[positions]
+        periods_seen = {}
+        for position, label in zip(positions, labels):
+            idx_np = label - labels.min()
+            if charge_type == "demand":
+                period = periods[idx_np]
+                idx_np = periods_seen.setdefault(period, idx_np)
+                if idx_np >= len(positions):
+                    raise IndexError(
+                        "Rows of basic charge limit {} are not contiguous".format(limit)
+                    )
+            columns[position] = idx_np
+            records["tier"][position] = tier
+        order.extend(positions)
+
+    records["column"] = columns
+    records["period"] = codes
+    for field in ["month_start", "month_end", "weekday_start", "weekday_end"]:
+        records[field] = charges[field].values
+    records["hour_start"] = charges["hour_start"].values
+    records["hour_end"] = charges["hour_end"].values
+    records["charge"] = charges["charge (imperial)"].values
+    # group the records by tier, keeping the order of rows within each tier
+    return records[np.asarray(order)], limits, list(period_names)
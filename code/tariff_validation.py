@@ -0,0 +1,329 @@
+import numpy as np
+import pandas as pd
+from compiled_tariff import CALENDAR_SHAPE, SLOTS_PER_DAY, THERM_TO_M3
+
+# cubic meters per million gallons
+MG_TO_M3 = 3785.41178
+# MW of electricity per therm/hr of natural gas, see paper for details
+GAS_CONVERSION_FACTOR = 3600 / (105.5 * 10)
+# bounds of the existing total flow in MGD, in which sheets are sorted
+MIN_MGD = 50
+MAX_MGD = 812
+# maximum charge (imperial) of each utility and charge type
+MAX_CHARGES = {
+    ("electric", "demand"): 35,
+    ("electric", "energy"): 2,
+    ("gas", "energy"): 3,
+    ("gas", "demand"): 40,
+    ("gas", "customer"): 5000,
+    ("electric", "customer"): 5000,
+}
+EXPECTED_UNITS = {
+    ("electric", "customer"): "$/month",
+    ("gas", "customer"): "$/month",
+    ("electric", "demand"): "$/kW",
+    ("electric", "energy"): "$/kWh",
+    ("gas", "demand"): "$/therm/hr or $/m3/hr",
+    ("gas", "energy"): "$/therm or $/m3",
+}
+# (CWNS number, utility, charge type) of charges outside `MAX_CHARGES` that were
+# manually checked to be correct
+CHARGE_OUTLIERS = (
+    {(42005016001, "electric", "customer"), (42005016001, "gas", "customer")}
+    | {(6009031001, "electric", "demand")}
+    | {
+        (cwns_no, "gas", "energy")
+        for cwns_no in [
+            36002001007, 36002001010, 36002001004, 36002001009, 36002001006,
+            36003169012, 36002001005, 36002001002, 36002001003, 36002001012,
+            36002001001, 36002001011, 36001010001, 36001010017, 34006012001,
+            36001010006, 36008024001,
+        ]
+    }
+    | {
+        (cwns_no, "gas", "demand")
+        for cwns_no in [34006012001, 34001005001, 34001030001, 34002065001, 34001082001]
+    }
+)
+REPORT_COLUMNS = ["CWNS_No", "utility", "type", "row", "check", "message"]
+
+
+def stack_tariffs(tariffs):
+    """Stacks the billing information of every facility into a single table
+
+    Parameters
+    ----------
+    tariffs : dict
+        Dictionary of billing information (as `DataFrame`) keyed by CWNS number,
+        e.g. from `tariff_cache.load_tariffs`
+
+    Returns
+    -------
+    DataFrame
+        Rows of every tariff with the facility's 'CWNS_No' and the
+        'row' of the charge in its sheet as additional columns
+    """
+    return pd.concat(tariffs, names=["CWNS_No", "row"]).reset_index()
+
+
+def _violations(table, failed, check, message):
+    """Builds report rows for the rows of `table` where `failed` is True"""
+    rows = table.loc[np.asarray(failed, dtype=bool), ["CWNS_No", "utility", "type", "row"]]
+    return rows.assign(check=check, message=message)
+
+
+def coverage_bitmap(table):
+    """Computes how many charges apply to each (month, weekday, 15-minute slot)
+    for every basic charge limit of every facility's demand and energy charges
+
+    Parameters
+    ----------
+    table : DataFrame
+        Stacked billing information from `stack_tariffs`
+
+    Returns
+    -------
+    tuple
+        (groups, counts) where `groups` is a DataFrame with the 'CWNS_No',
+        'utility', 'type', and 'basic_charge_limit (imperial)' of each group
+        and `counts` is an array of shape (number of groups, 12, 7, 96)
+    """
+    keys = ["CWNS_No", "utility", "type", "basic_charge_limit (imperial)"]
+    table = table.loc[table["type"] != "customer", :].sort_values(keys, kind="stable")
+    months = np.arange(1, 13)
+    weekdays = np.arange(7)
+    hours = np.arange(SLOTS_PER_DAY) / 4
+
+    def applies(values, start, end, inclusive=True):
+        start = table[start].values[:, None]
+        end = table[end].values[:, None]
+        return (values >= start) & ((values <= end) if inclusive else (values < end))
+
+    # outer product of the month, weekday, and hour masks of each row
+    bitmap = (
+        applies(months, "month_start", "month_end")[:, :, None, None]
+        & applies(weekdays, "weekday_start", "weekday_end")[:, None, :, None]
+        & applies(hours, "hour_start", "hour_end", inclusive=False)[:, None, None, :]
+    )
+    groups = table[keys].drop_duplicates().reset_index(drop=True)
+    if table.shape[0] == 0:
+        return groups, np.zeros((0,) + CALENDAR_SHAPE, dtype=int)
+    is_first = np.ones(table.shape[0], dtype=bool)
+    is_first[1:] = (table[keys].values[1:] != table[keys].values[:-1]).any(axis=1)
+    counts = np.add.reduceat(
+        bitmap.reshape(table.shape[0], -1).astype(np.int16), np.flatnonzero(is_first), axis=0
+    )
+    return groups, counts.reshape((-1,) + CALENDAR_SHAPE)
+
+
+def check_coverage(table):
+    """Checks that the energy charges of every basic charge limit apply to every
+    (month, weekday, 15-minute slot), which the rows of each limit are summed over
+
+    Returns
+    -------
+    DataFrame
+        One report row per tier with uncovered slots
+    """
+    groups, counts = coverage_bitmap(table)
+    uncovered = counts.reshape(len(groups), -1) == 0
+    failed = (groups["type"] == "energy").values & uncovered.any(axis=1)
+    first = np.argmax(uncovered, axis=1)
+    rows = []
+    for g in np.flatnonzero(failed):
+        month, weekday, slot = np.unravel_index(first[g], CALENDAR_SHAPE)
+        rows.append(
+            {
+                "CWNS_No": groups.loc[g, "CWNS_No"],
+                "utility": groups.loc[g, "utility"],
+                "type": groups.loc[g, "type"],
+                "row": -1,
+                "check": "coverage",
+                "message": "{} slots without a charge above {} starting month {}, "
+                "weekday {}, hour {:g}".format(
+                    uncovered[g].sum(),
+                    groups.loc[g, "basic_charge_limit (imperial)"],
+                    month + 1,
+                    weekday,
+                    slot / 4,
+                ),
+            }
+        )
+    return pd.DataFrame(rows, columns=REPORT_COLUMNS)
+
+
+def validate_tariffs(tariffs):
+    """Checks the units, bounds, unit conversions, ordering of time ranges, and
+    coverage of every charge of every facility in one pass over all tariffs
+
+    Parameters
+    ----------
+    tariffs : dict
+        Dictionary of billing information (as `DataFrame`) keyed by CWNS number,
+        e.g. from `tariff_cache.load_tariffs`
+
+    Returns
+    -------
+    DataFrame
+        One row per violation with the 'CWNS_No', 'utility', and 'type' of the
+        charge, its 'row' in the sheet (-1 for a whole tier), the name of the
+        failed 'check', and a 'message'. Empty if every tariff is valid
+    """
+    table = stack_tariffs(tariffs)
+    utility = table["utility"].values
+    charge_type = table["type"].values
+    is_gas = utility == "gas"
+    is_customer = charge_type == "customer"
+    imperial = table["charge (imperial)"].values
+    metric = table["charge (metric)"].values
+    report = []
+
+    expected_units = np.array(
+        [EXPECTED_UNITS.get(key) for key in zip(utility, charge_type)], dtype=object
+    )
+    report.append(
+        _violations(table, table["units"].values != expected_units, "units", "unexpected units")
+    )
+
+    # charges are positive and below a threshold, except manually checked outliers
+    max_charge = np.array([MAX_CHARGES.get(key, np.inf) for key in zip(utility, charge_type)])
+    checked = np.array(
+        [key not in CHARGE_OUTLIERS for key in zip(table["CWNS_No"], utility, charge_type)],
+        dtype=bool,
+    )
+    report.append(
+        _violations(table, checked & ((imperial < 0) | (metric < 0)), "bounds", "negative charge")
+    )
+    report.append(
+        _violations(
+            table,
+            checked & (imperial > max_charge),
+            "bounds",
+            "charge (imperial) above maximum",
+        )
+    )
+    max_metric = np.where(is_gas, max_charge / THERM_TO_M3, max_charge)
+    report.append(
+        _violations(
+            table, checked & (metric > max_metric), "bounds", "charge (metric) above maximum"
+        )
+    )
+
+    # time ranges are ordered and within the calendar
+    timed = table.loc[~is_customer, :]
+    for start, end, low, high, strict in [
+        ("month_start", "month_end", 1, 12, False),
+        ("weekday_start", "weekday_end", 0, 6, False),
+        ("hour_start", "hour_end", 0, 24, True),
+    ]:
+        unordered = (
+            timed[start].values >= timed[end].values
+            if strict
+            else timed[start].values > timed[end].values
+        )
+        message = "{} not before {}" if strict else "{} after {}"
+        report.append(_violations(timed, unordered, "ordering", message.format(start, end)))
+        outside = (
+            (timed[start].values < low)
+            | (timed[end].values > high)
+            | ~np.isfinite(timed[start].values)
+            | ~np.isfinite(timed[end].values)
+        )
+        report.append(
+            _violations(
+                timed, outside, "ordering", "{} or {} outside {}-{}".format(start, end, low, high)
+            )
+        )
+
+    # metric charges of gas are per cubic meter instead of per therm
+    gas_rate = is_gas & ~is_customer
+    expected_metric = np.where(gas_rate, imperial / THERM_TO_M3, imperial)
+    report.append(
+        _violations(table, metric != expected_metric, "conversion", "charge (metric) mismatch")
+    )
+    limit_imperial = table["basic_charge_limit (imperial)"].values
+    expected_limit = np.where(gas_rate, limit_imperial * THERM_TO_M3, limit_imperial)
+    report.append(
+        _violations(
+            table,
+            ~is_customer & (table["basic_charge_limit (metric)"].values != expected_limit),
+            "conversion",
+            "basic_charge_limit (metric) mismatch",
+        )
+    )
+
+    report.append(check_coverage(table))
+    return pd.concat(report, ignore_index=True)[REPORT_COLUMNS]
+
+
+def validate_metadata(metadata):
+    """Checks the flow rates, estimated demands, and unit conversions of every facility
+
+    Parameters
+    ----------
+    metadata : DataFrame
+        Facility metadata, i.e. 'data/metadata.csv'
+
+    Returns
+    -------
+    DataFrame
+        One row per violation in the format of `validate_tariffs`, with
+        'utility' and 'type' left empty and 'row' the row of the facility
+    """
+    flow = metadata["Existing Total Flow (MGD)"].values
+    checks = [
+        (
+            np.diff(flow, prepend=MIN_MGD) < 0,
+            "flow",
+            "Existing Total Flow (MGD) not increasing or below {}".format(MIN_MGD),
+        ),
+        (flow > MAX_MGD, "flow", "Existing Total Flow (MGD) above {}".format(MAX_MGD)),
+    ]
+
+    # gross electricity demand is either equal to or twice the electric grid demand,
+    # in which case the natural gas demand is the grid demand * conversion factor
+    for state in ["Existing", "Design"]:
+        gross = metadata["Est. {} Electricity Demand (MW)".format(state)].values
+        grid = metadata["Est. {} Electric Grid Demand (MW)".format(state)].values
+        therms = metadata["Est. {} Natural Gas Demand (therms/hr)".format(state)].values
+        cubic_meters = metadata["Est. {} Natural Gas Demand (m3/hr)".format(state)].values
+        no_cogen = np.isclose(gross, grid, rtol=1e-6, atol=1e-12)
+        cogen = np.isclose(gross / 2, grid, rtol=1e-6, atol=1e-12) & np.isclose(
+            grid, therms / GAS_CONVERSION_FACTOR, rtol=1e-6, atol=1e-12
+        )
+        checks.append(
+            (~(no_cogen | cogen), "demand", "{} grid and gas demand inconsistent".format(state))
+        )
+        checks.append(
+            (
+                ~np.isclose(cubic_meters, therms * THERM_TO_M3, rtol=1e-6, atol=1e-12),
+                "conversion",
+                "Est. {} Natural Gas Demand (m3/hr) mismatch".format(state),
+            )
+        )
+        mgd = metadata["{} Flow (MGD)".format("Existing Total" if state == "Existing" else state)]
+        m3 = metadata["{} Flow (m3/d)".format("Existing Total" if state == "Existing" else state)]
+        checks.append(
+            (
+                ~np.isclose(m3.values, mgd.values * MG_TO_M3, rtol=1e-6, atol=1e-12),
+                "conversion",
+                "{} Flow (m3/d) mismatch".format(state),
+            )
+        )
+
+    report = []
+    for failed, check, message in checks:
+        rows = np.flatnonzero(failed)
+        report.append(
+            pd.DataFrame(
+                {
+                    "CWNS_No": metadata["CWNS_No"].values[rows],
+                    "utility": "",
+                    "type": "",
+                    "row": rows,
+                    "check": check,
+                    "message": message,
+                }
+            )
+        )
+    return pd.concat(report, ignore_index=True)[REPORT_COLUMNS]